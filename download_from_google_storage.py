@@ -6,7 +6,10 @@
 """Download files from Google Storage based on SHA1 sums."""
 
 
+import errno
 import hashlib
+import json
+import multiprocessing.pool
 import optparse
 import os
 import Queue
@@ -15,6 +18,7 @@ import shutil
 import stat
 import sys
 import tarfile
+import tempfile
 import threading
 import time
 
@@ -23,6 +27,12 @@ import subprocess2
 
 GSUTIL_DEFAULT_PATH = os.path.join(
     os.path.dirname(os.path.abspath(__file__)), 'gsutil.py')
+# Number of objects passed to each gsutil call when they are batched.
+GSUTIL_BATCH_SIZE = 100
+# Default location of the shared cache of downloaded files, if any.
+CACHE_DIR_ENV = 'DEPOT_TOOLS_GS_CACHE_DIR'
+# Default maximum size of the cache, in MiB.
+CACHE_DEFAULT_MAX_SIZE = 10 * 1024
 # Maps sys.platform to what we actually want to call them.
 PLATFORM_MAPPING = {
     'cygwin': 'win',
@@ -79,6 +89,14 @@ class Gsutil(object):
     cmd.extend(args)
     return subprocess2.call(cmd, env=self.get_sub_env(), timeout=self.timeout)
 
+  def stream(self, *args):
+    """Starts gsutil with its stdout piped back, e.g. to read 'cat' output
+    while it is downloaded."""
+    cmd = [sys.executable, self.path, '--force-version', self.version]
+    cmd.extend(args)
+    return subprocess2.Popen(
+        cmd, stdout=subprocess2.PIPE, env=self.get_sub_env())
+
   def check_call(self, *args):
     cmd = [sys.executable, self.path, '--force-version', self.version]
     cmd.extend(args)
@@ -101,6 +119,28 @@ class Gsutil(object):
     return (code, out, err)
 
 
+def gsutil_ls_long(gsutil, urls):
+  """Runs 'gsutil ls -L' on urls in as few calls as possible.
+
+  Returns a dict of each url that exists to its 'ls -L' output, or None if
+  gsutil failed for another reason than missing objects.
+  """
+  listing = {}
+  for i in xrange(0, len(urls), GSUTIL_BATCH_SIZE):
+    code, out, _ = gsutil.check_call('ls', '-L', *urls[i:i + GSUTIL_BATCH_SIZE])
+    if code and code != 404:
+      return None
+    current = None
+    for line in out.splitlines():
+      match = re.match(r'^(gs://\S+):$', line)
+      if match:
+        current = match.group(1)
+        listing[current] = ''
+      elif current:
+        listing[current] += line + '\n'
+  return listing
+
+
 def check_platform(target):
   """Checks if any parent directory of target matches (win|mac|linux)."""
   assert os.path.isabs(target)
@@ -124,6 +164,154 @@ def get_sha1(filename):
   return sha1.hexdigest()
 
 
+def _link_or_copy(src, dest):
+  """Atomically replaces dest with a hardlink or copy of src."""
+  tmp = '%s.tmp%d.%s' % (dest, os.getpid(), threading.current_thread().ident)
+  try:
+    os.link(src, tmp)
+  except (AttributeError, OSError):
+    shutil.copy2(src, tmp)
+  try:
+    if sys.platform == 'win32' and os.path.exists(dest):
+      # Windows can't rename over an existing file.
+      os.remove(dest)
+    os.rename(tmp, dest)
+  finally:
+    if os.path.exists(tmp):
+      os.remove(tmp)
+
+
+def _copy_checked(src, dest, sha1_sum):
+  """Atomically replaces dest with a copy of src if the sha1 of src is
+  sha1_sum. Returns False, leaving dest alone, otherwise."""
+  tmp = '%s.tmp%d.%s' % (dest, os.getpid(), threading.current_thread().ident)
+  sha1 = hashlib.sha1()
+  try:
+    with open(src, 'rb') as f_in:
+      with open(tmp, 'wb') as f_out:
+        while True:
+          chunk = f_in.read(1024*1024)
+          if not chunk:
+            break
+          sha1.update(chunk)
+          f_out.write(chunk)
+    if sha1.hexdigest() != sha1_sum:
+      return False
+    shutil.copymode(src, tmp)
+    if sys.platform == 'win32' and os.path.exists(dest):
+      # Windows can't rename over an existing file.
+      os.remove(dest)
+    os.rename(tmp, dest)
+    return True
+  finally:
+    if os.path.exists(tmp):
+      os.remove(tmp)
+
+
+def _stat_record(filename):
+  st = os.stat(filename)
+  return [st.st_size, st.st_mtime, st.st_ino]
+
+
+def record_sha1(filename, sha1_sum):
+  """Remembers that filename, as it is now, has the sha1 sha1_sum."""
+  try:
+    with open('%s.sha1_stat' % filename, 'wb') as f:
+      json.dump({'sha1': sha1_sum, 'stat': _stat_record(filename)}, f)
+  except (IOError, OSError):
+    pass
+
+
+def get_sha1_cached(filename):
+  """Don't calculate the SHA1 if the .sha1_stat file next to filename shows
+  it didn't change since it was last computed."""
+  try:
+    with open('%s.sha1_stat' % filename, 'rb') as f:
+      record = json.load(f)
+    if record['stat'] == _stat_record(filename):
+      return record['sha1']
+  except (IOError, OSError, ValueError, KeyError, TypeError):
+    pass
+  sha1_sum = get_sha1(filename)
+  record_sha1(filename, sha1_sum)
+  return sha1_sum
+
+
+class BlobCache(object):
+  """Content-addressed cache of downloaded files, shared by all the checkouts
+  of a machine.
+
+  Files are stored as <path>/<sha1[:2]>/<sha1> and copied in and out, never
+  hardlinked, so that a checkout writing to its file can't change the cache or
+  the other checkouts. Their sha1 is checked on every copy. The least recently
+  used ones are evicted once the cache is bigger than max_size bytes; an entry
+  is touched whenever it is used.
+  """
+
+  def __init__(self, path, max_size):
+    self.path = path
+    self.max_size = max_size
+
+  def _entry(self, sha1_sum):
+    return os.path.join(self.path, sha1_sum[:2], sha1_sum)
+
+  def has(self, sha1_sum):
+    return os.path.isfile(self._entry(sha1_sum))
+
+  def get(self, sha1_sum, output_filename):
+    """Puts the cached file with the sha1 sha1_sum at output_filename.
+
+    Returns False if it isn't in the cache. A corrupted entry is evicted.
+    """
+    entry = self._entry(sha1_sum)
+    try:
+      if not _copy_checked(entry, output_filename, sha1_sum):
+        os.remove(entry)
+        return False
+      os.utime(entry, None)
+    except (IOError, OSError):
+      return False
+    return True
+
+  def put(self, sha1_sum, filename):
+    """Adds filename, whose sha1 is sha1_sum, to the cache."""
+    entry = self._entry(sha1_sum)
+    if os.path.exists(entry):
+      return
+    try:
+      if not os.path.isdir(os.path.dirname(entry)):
+        os.makedirs(os.path.dirname(entry))
+    except OSError as e:
+      if e.errno != errno.EEXIST:
+        return
+    try:
+      _copy_checked(filename, entry, sha1_sum)
+    except (IOError, OSError):
+      pass
+
+  def trim(self):
+    """Evicts the least recently used files until the cache fits in
+    max_size."""
+    entries = []
+    for root, _, files in os.walk(self.path):
+      for name in files:
+        path = os.path.join(root, name)
+        try:
+          st = os.stat(path)
+        except OSError:
+          continue
+        entries.append((st.st_mtime, st.st_size, path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+      if total <= self.max_size:
+        break
+      try:
+        os.remove(path)
+        total -= size
+      except OSError:
+        pass
+
+
 # Download-specific code starts here
 
 def enumerate_work_queue(input_filename, work_queue, directory,
@@ -199,85 +387,53 @@ def _validate_tar_file(tar, prefix):
 
 def _downloader_worker_thread(thread_num, q, force, base_url,
                               gsutil, out_q, ret_codes, verbose, extract,
-                              delete=True):
+                              delete=True, cache=None, batch=None):
   while True:
     input_sha1_sum, output_filename = q.get()
     if input_sha1_sum is None:
       return
     if os.path.exists(output_filename) and not force:
-      if get_sha1(output_filename) == input_sha1_sum:
+      if get_sha1_cached(output_filename) == input_sha1_sum:
         if verbose:
           out_q.put(
               '%d> File %s exists and SHA1 matches. Skipping.' % (
                   thread_num, output_filename))
         continue
-    # Check if file exists.
     file_url = '%s/%s' % (base_url, input_sha1_sum)
-    (code, _, err) = gsutil.check_call('ls', file_url)
-    if code != 0:
-      if code == 404:
-        out_q.put('%d> File %s for %s does not exist, skipping.' % (
-            thread_num, file_url, output_filename))
-        ret_codes.put((1, 'File %s for %s does not exist.' % (
-            file_url, output_filename)))
-      else:
-        # Other error, probably auth related (bad ~/.boto, etc).
-        out_q.put('%d> Failed to fetch file %s for %s, skipping. [Err: %s]' % (
-            thread_num, file_url, output_filename, err))
-        ret_codes.put((1, 'Failed to fetch file %s for %s. [Err: %s]' % (
-            file_url, output_filename, err)))
+    # The cached copy has the executable bit of the original download.
+    cached = cache and cache.get(input_sha1_sum, output_filename)
+    # (path of the prefetched file, 'ls -L' output), see _prefetch_files().
+    staged, listing = (batch or {}).get(file_url, (None, ''))
+    if cached:
+      out_q.put('%d> Copied %s from the cache.' % (thread_num, output_filename))
+      record_sha1(output_filename, input_sha1_sum)
+    elif listing is None:
+      _report_missing(thread_num, file_url, output_filename, out_q, ret_codes)
       continue
-    # Fetch the file.
-    out_q.put('%d> Downloading %s...' % (thread_num, output_filename))
-    try:
-      if delete:
-        os.remove(output_filename)  # Delete the file if it exists already.
-    except OSError:
-      if os.path.exists(output_filename):
-        out_q.put('%d> Warning: deleting %s failed.' % (
-            thread_num, output_filename))
-    code, _, err = gsutil.check_call('cp', file_url, output_filename)
-    if code != 0:
-      out_q.put('%d> %s' % (thread_num, err))
-      ret_codes.put((code, err))
+    elif staged:
+      try:
+        if delete and os.path.exists(output_filename):
+          os.remove(output_filename)
+        _link_or_copy(staged, output_filename)
+      except (IOError, OSError) as e:
+        msg = 'Failed to move %s to %s: %s' % (staged, output_filename, e)
+        out_q.put('%d> %s' % (thread_num, msg))
+        ret_codes.put((1, msg))
+        continue
+      out_q.put('%d> Downloaded %s.' % (thread_num, output_filename))
+      if not _check_download(
+          thread_num, input_sha1_sum, output_filename, out_q, ret_codes):
+        continue
+    elif not _download_file(
+        thread_num, gsutil, file_url, input_sha1_sum, output_filename, out_q,
+        ret_codes, delete):
       continue
 
-    remote_sha1 = get_sha1(output_filename)
-    if remote_sha1 != input_sha1_sum:
-      msg = ('%d> ERROR remote sha1 (%s) does not match expected sha1 (%s).' %
-             (thread_num, remote_sha1, input_sha1_sum))
-      out_q.put(msg)
-      ret_codes.put((20, msg))
+    if extract and not _extract_file(
+        thread_num, output_filename, out_q, ret_codes):
+      continue
+    if cached:
       continue
-
-    if extract:
-      if (not tarfile.is_tarfile(output_filename)
-          or not output_filename.endswith('.tar.gz')):
-        out_q.put('%d> Error: %s is not a tar.gz archive.' % (
-                  thread_num, output_filename))
-        ret_codes.put((1, '%s is not a tar.gz archive.' % (output_filename)))
-        continue
-      with tarfile.open(output_filename, 'r:gz') as tar:
-        dirname = os.path.dirname(os.path.abspath(output_filename))
-        extract_dir = output_filename[0:len(output_filename)-7]
-        if not _validate_tar_file(tar, os.path.basename(extract_dir)):
-          out_q.put('%d> Error: %s contains files outside %s.' % (
-                    thread_num, output_filename, extract_dir))
-          ret_codes.put((1, '%s contains invalid entries.' % (output_filename)))
-          continue
-        if os.path.exists(extract_dir):
-          try:
-            shutil.rmtree(extract_dir)
-            out_q.put('%d> Removed %s...' % (thread_num, extract_dir))
-          except OSError:
-            out_q.put('%d> Warning: Can\'t delete: %s' % (
-                      thread_num, extract_dir))
-            ret_codes.put((1, 'Can\'t delete %s.' % (extract_dir)))
-            continue
-        out_q.put('%d> Extracting %d entries from %s to %s' %
-                  (thread_num, len(tar.getmembers()),output_filename,
-                   extract_dir))
-        tar.extractall(path=dirname)
     # Set executable bit.
     if sys.platform == 'cygwin':
       # Under cygwin, mark all files as executable. The executable flag in
@@ -289,13 +445,165 @@ def _downloader_worker_thread(thread_num, q, force, base_url,
     elif sys.platform != 'win32':
       # On non-Windows platforms, key off of the custom header
       # "x-goog-meta-executable".
-      code, out, _ = gsutil.check_call('stat', file_url)
+      if listing:
+        code, out = 0, listing
+      else:
+        code, out, err = gsutil.check_call('stat', file_url)
       if code != 0:
         out_q.put('%d> %s' % (thread_num, err))
         ret_codes.put((code, err))
+        continue
       elif re.search(r'executable:\s*1', out):
         st = os.stat(output_filename)
         os.chmod(output_filename, st.st_mode | stat.S_IEXEC)
+    if cache:
+      cache.put(input_sha1_sum, output_filename)
+
+
+def _download_file(thread_num, gsutil, file_url, input_sha1_sum,
+                   output_filename, out_q, ret_codes, delete):
+  """Downloads file_url to output_filename and checks its sha1.
+
+  Returns True on success, errors are reported to out_q and ret_codes.
+  """
+  # Check if file exists.
+  (code, _, err) = gsutil.check_call('ls', file_url)
+  if code != 0:
+    if code == 404:
+      _report_missing(thread_num, file_url, output_filename, out_q, ret_codes)
+    else:
+      # Other error, probably auth related (bad ~/.boto, etc).
+      out_q.put('%d> Failed to fetch file %s for %s, skipping. [Err: %s]' % (
+          thread_num, file_url, output_filename, err))
+      ret_codes.put((1, 'Failed to fetch file %s for %s. [Err: %s]' % (
+          file_url, output_filename, err)))
+    return False
+  # Fetch the file.
+  out_q.put('%d> Downloading %s...' % (thread_num, output_filename))
+  try:
+    if delete:
+      os.remove(output_filename)  # Delete the file if it exists already.
+  except OSError:
+    if os.path.exists(output_filename):
+      out_q.put('%d> Warning: deleting %s failed.' % (
+          thread_num, output_filename))
+  code, _, err = gsutil.check_call('cp', file_url, output_filename)
+  if code != 0:
+    out_q.put('%d> %s' % (thread_num, err))
+    ret_codes.put((code, err))
+    return False
+  return _check_download(
+      thread_num, input_sha1_sum, output_filename, out_q, ret_codes)
+
+
+def _report_missing(thread_num, file_url, output_filename, out_q, ret_codes):
+  out_q.put('%d> File %s for %s does not exist, skipping.' % (
+      thread_num, file_url, output_filename))
+  ret_codes.put((1, 'File %s for %s does not exist.' % (
+      file_url, output_filename)))
+
+
+def _check_download(thread_num, input_sha1_sum, output_filename, out_q,
+                    ret_codes):
+  """Returns True if the downloaded output_filename has the expected sha1."""
+  remote_sha1 = get_sha1(output_filename)
+  if remote_sha1 != input_sha1_sum:
+    msg = ('%d> ERROR remote sha1 (%s) does not match expected sha1 (%s).' %
+           (thread_num, remote_sha1, input_sha1_sum))
+    out_q.put(msg)
+    ret_codes.put((20, msg))
+    return False
+  record_sha1(output_filename, remote_sha1)
+  return True
+
+
+def _prefetch_files(items, base_url, gsutil, force, out_q, cache,
+                    num_threads=1):
+  """Lists, then downloads into a staging directory, the objects of items
+  that are missing or out of date with a few gsutil calls instead of several
+  per file. The existing files are hashed by num_threads threads.
+
+  Returns (batch, staging directory). batch maps the url of each object that
+  was looked up to (path of the downloaded file or None, 'ls -L' output or None
+  if it doesn't exist). Returns (None, None) if there is nothing to batch or
+  gsutil failed; the worker threads then handle the files one at a time.
+  """
+  def up_to_date(item):
+    sha1_sum, output_filename = item
+    return (not force and os.path.exists(output_filename) and
+            get_sha1_cached(output_filename) == sha1_sum)
+  pool = multiprocessing.pool.ThreadPool(max(1, num_threads))
+  try:
+    fresh = pool.map(up_to_date, items)
+  finally:
+    pool.close()
+    pool.join()
+  urls = sorted(set(
+      '%s/%s' % (base_url, sha1_sum)
+      for (sha1_sum, _), is_fresh in zip(items, fresh)
+      if not is_fresh and not (cache and cache.has(sha1_sum))))
+  if len(urls) < 2:
+    return None, None
+  out_q.put('Main> Listing %d files...' % len(urls))
+  listing = gsutil_ls_long(gsutil, urls)
+  if listing is None:
+    return None, None
+
+  found = [url for url in urls if url in listing]
+  try:
+    staging = tempfile.mkdtemp(
+        prefix='_download_tmp',
+        dir=os.path.dirname(os.path.abspath(items[0][1])))
+  except OSError:
+    return None, None
+  out_q.put('Main> Downloading %d files...' % len(found))
+  for i in xrange(0, len(found), GSUTIL_BATCH_SIZE):
+    args = ['-m', 'cp'] + found[i:i + GSUTIL_BATCH_SIZE] + [staging]
+    code, _, err = gsutil.check_call(*args)
+    if code:
+      # The files that are missing are downloaded again one at a time.
+      out_q.put('Main> %s' % err)
+
+  batch = {}
+  for url in urls:
+    staged = os.path.join(staging, url.rsplit('/', 1)[1])
+    batch[url] = (staged if os.path.isfile(staged) else None, listing.get(url))
+  return batch, staging
+
+
+def _extract_file(thread_num, output_filename, out_q, ret_codes):
+  """Extracts the tar.gz output_filename next to it.
+
+  Returns True on success, errors are reported to out_q and ret_codes.
+  """
+  if (not tarfile.is_tarfile(output_filename)
+      or not output_filename.endswith('.tar.gz')):
+    out_q.put('%d> Error: %s is not a tar.gz archive.' % (
+              thread_num, output_filename))
+    ret_codes.put((1, '%s is not a tar.gz archive.' % (output_filename)))
+    return False
+  with tarfile.open(output_filename, 'r:gz') as tar:
+    dirname = os.path.dirname(os.path.abspath(output_filename))
+    extract_dir = output_filename[0:len(output_filename)-7]
+    if not _validate_tar_file(tar, os.path.basename(extract_dir)):
+      out_q.put('%d> Error: %s contains files outside %s.' % (
+                thread_num, output_filename, extract_dir))
+      ret_codes.put((1, '%s contains invalid entries.' % (output_filename)))
+      return False
+    if os.path.exists(extract_dir):
+      try:
+        shutil.rmtree(extract_dir)
+        out_q.put('%d> Removed %s...' % (thread_num, extract_dir))
+      except OSError:
+        out_q.put('%d> Warning: Can\'t delete: %s' % (
+                  thread_num, extract_dir))
+        ret_codes.put((1, 'Can\'t delete %s.' % (extract_dir)))
+        return False
+    out_q.put('%d> Extracting %d entries from %s to %s' %
+              (thread_num, len(tar.getmembers()),output_filename,
+               extract_dir))
+    tar.extractall(path=dirname)
+  return True
 
 def printer_worker(output_queue):
   while True:
@@ -308,30 +616,37 @@ def printer_worker(output_queue):
 
 def download_from_google_storage(
     input_filename, base_url, gsutil, num_threads, directory, recursive,
-    force, output, ignore_errors, sha1_file, verbose, auto_platform, extract):
-  # Start up all the worker threads.
+    force, output, ignore_errors, sha1_file, verbose, auto_platform, extract,
+    cache=None):
   all_threads = []
   download_start = time.time()
   stdout_queue = Queue.Queue()
   work_queue = Queue.Queue()
   ret_codes = Queue.Queue()
   ret_codes.put((0, None))
-  for thread_num in range(num_threads):
-    t = threading.Thread(
-        target=_downloader_worker_thread,
-        args=[thread_num, work_queue, force, base_url,
-              gsutil, stdout_queue, ret_codes, verbose, extract])
-    t.daemon = True
-    t.start()
-    all_threads.append(t)
   printer_thread = threading.Thread(target=printer_worker, args=[stdout_queue])
   printer_thread.daemon = True
   printer_thread.start()
 
-  # Enumerate our work queue.
+  # Enumerate our work queue, then fetch what is needed in batches before
+  # the worker threads process each file.
   work_queue_size = enumerate_work_queue(
       input_filename, work_queue, directory, recursive,
       ignore_errors, output, sha1_file, auto_platform)
+  batch, staging = _prefetch_files(
+      list(work_queue.queue), base_url, gsutil, force, stdout_queue, cache,
+      num_threads)
+
+  # Start up all the worker threads.
+  for thread_num in range(num_threads):
+    t = threading.Thread(
+        target=_downloader_worker_thread,
+        args=[thread_num, work_queue, force, base_url,
+              gsutil, stdout_queue, ret_codes, verbose, extract],
+        kwargs={'cache': cache, 'batch': batch})
+    t.daemon = True
+    t.start()
+    all_threads.append(t)
   for _ in all_threads:
     work_queue.put((None, None))  # Used to tell worker threads to stop.
 
@@ -340,6 +655,10 @@ def download_from_google_storage(
     t.join()
   stdout_queue.put(None)
   printer_thread.join()
+  if staging:
+    shutil.rmtree(staging, ignore_errors=True)
+  if cache:
+    cache.trim()
 
   # See if we ran into any errors.
   max_ret_code = 0
@@ -415,6 +734,15 @@ def main(args):
                          'If a directory with the same name as the tar.gz '
                          'file already exists, is deleted (to get a '
                          'clean state in case of update.)')
+  parser.add_option('--cache_dir', default=os.environ.get(CACHE_DIR_ENV),
+                    help='Directory of a cache of the downloaded files that '
+                         'can be shared by several checkouts. Defaults to '
+                         '$%s.' % CACHE_DIR_ENV)
+  parser.add_option('--cache_max_size', type='int',
+                    default=CACHE_DEFAULT_MAX_SIZE,
+                    help='Size in MiB above which the least recently used '
+                         'files are evicted from the cache. '
+                         'Default: %default')
   parser.add_option('-v', '--verbose', action='store_true', default=True,
                     help='DEPRECATED: Defaults to True.  Use --no-verbose '
                          'to suppress.')
@@ -508,11 +836,16 @@ def main(args):
 
   base_url = 'gs://%s' % options.bucket
 
+  cache = None
+  if options.cache_dir:
+    cache = BlobCache(os.path.abspath(options.cache_dir),
+                      options.cache_max_size * 1024 * 1024)
+
   return download_from_google_storage(
       input_filename, base_url, gsutil, options.num_threads, options.directory,
       options.recursive, options.force, options.output, options.ignore_errors,
       options.sha1_file, options.verbose, options.auto_platform,
-      options.extract)
+      options.extract, cache)
 
 
 if __name__ == '__main__':
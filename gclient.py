@@ -16,6 +16,17 @@
 #   .gclient_entries : A cache constructed by 'update' command.  Format is a
 #                   Python script defining 'entries', a list of the names
 #                   of all modules in the client
+#   .gclient_deps_cache : A cache of the evaluated DEPS files, keyed by a hash
+#                   of their content and of the .gclient settings they depend
+#                   on. It is a python literal.
+#   .gclient_timings : Json file written by 'update' command recording how
+#                   long each module and hook took in the previous syncs. It
+#                   is used to start the slowest modules first and is
+#                   summarized by the 'timings' command.
+#   .gclient_logs/ : Directory holding the full output of each module and hook
+#                   of the last command run on them, one file each.
+#   .gclient_trash/ : Modules no longer part of the client are moved there and
+#                   deleted in the background.
 #   <module>/DEPS : Python script defining var 'deps' as a map from each
 #                   requisite submodule name to a URL where it can be found (via
 #                   one SCM)
@@ -45,13 +56,23 @@
 #                will be extended by the list of matching files.
 #     "name"     An optional string specifying the group to which a hook belongs
 #                for overriding and organizing.
+#     "depends_on" An optional list of hook names. By default a hook runs after
+#                all the hooks listed before it. A hook with "depends_on" only
+#                waits for the hooks with these names and may run in parallel
+#                with the others, up to --jobs at a time. The output of each
+#                hook is then printed once it completes.
 #
 #   Example:
 #     hooks = [
 #       { "pattern": "\\.(gif|jpe?g|pr0n|png)$",
 #         "action":  ["python", "image_indexer.py", "--all"]},
 #       { "pattern": ".",
+#         "name": "sysroot",
+#         "depends_on": [],
+#         "action":  ["python", "src/build/install_sysroot.py"]},
+#       { "pattern": ".",
 #         "name": "gyp",
+#         "depends_on": ["sysroot"],
 #         "action":  ["python", "src/build/gyp_chromium"]},
 #     ]
 #
@@ -82,6 +103,8 @@ __version__ = '0.7'
 
 import ast
 import copy
+import datetime
+import hashlib
 import json
 import logging
 import optparse
@@ -91,6 +114,7 @@ import posixpath
 import pprint
 import re
 import sys
+import threading
 import time
 import urllib
 import urlparse
@@ -99,6 +123,7 @@ import breakpad  # pylint: disable=W0611
 
 import fix_encoding
 import gclient_scm
+import gclient_timings
 import gclient_utils
 import git_cache
 from third_party.repo.progress import Progress
@@ -212,6 +237,80 @@ class GClientKeywords(object):
       raise gclient_utils.Error("Var is not defined: %s" % var_name)
 
 
+class DepsCache(object):
+  """Resolved content of DEPS files, keyed by a hash of their content and of
+  everything else their parsing depends on.
+
+  It is saved as a python literal next to .gclient_entries so commands run on
+  an unchanged checkout don't need to evaluate the DEPS files again. Only the
+  entries used by the last command are kept.
+
+  Methods of this class are thread safe.
+  """
+  def __init__(self, path):
+    self.path = path
+    self.lock = threading.Lock()
+    self._entries = {}
+    self._used = {}
+    self._modified = False
+    if path and os.path.exists(path):
+      try:
+        self._entries = ast.literal_eval(gclient_utils.FileRead(path))
+      except (SyntaxError, ValueError) as e:
+        logging.warning('Ignoring invalid %s: %s', path, e)
+
+  @staticmethod
+  def Key(*args):
+    return hashlib.sha1(
+        json.dumps(args, sort_keys=True, default=str)).hexdigest()
+
+  @staticmethod
+  def EncodeUrl(url):
+    """Returns a literal representation of a deps url."""
+    if isinstance(url, GClientKeywords.FromImpl):
+      return {'From': (url.module_name, url.sub_target_name)}
+    if isinstance(url, GClientKeywords.FileImpl):
+      return {'File': url.file_location}
+    return url
+
+  @staticmethod
+  def DecodeUrl(url):
+    """Reverts EncodeUrl()."""
+    if isinstance(url, dict) and url.keys() == ['From']:
+      return GClientKeywords.FromImpl(*url['From'])
+    if isinstance(url, dict) and url.keys() == ['File']:
+      return GClientKeywords.FileImpl(url['File'])
+    return url
+
+  def get(self, key):
+    with self.lock:
+      value = self._entries.get(key)
+      if value is not None:
+        self._used[key] = value
+      return value
+
+  def set(self, key, value):
+    try:
+      ast.literal_eval(repr(value))
+    except (SyntaxError, ValueError):
+      # Not representable, e.g. a hook with an unexpected type.
+      return
+    with self.lock:
+      self._entries[key] = value
+      self._used[key] = value
+      self._modified = True
+
+  def save(self):
+    with self.lock:
+      if not self.path:
+        return
+      if not self._modified and len(self._used) == len(self._entries):
+        return
+      self._entries = dict(self._used)
+      self._modified = False
+      gclient_utils.FileWrite(self.path, repr(self._entries))
+
+
 class DependencySettings(GClientKeywords):
   """Immutable configuration settings."""
   def __init__(
@@ -365,6 +464,11 @@ class Dependency(gclient_utils.WorkItem, DependencySettings):
     # The actual revision we ended up getting, or None if that information is
     # unavailable
     self._got_revision = None
+    # Maps a phase name, e.g. 'clone', 'fetch', 'checkout' or 'deps', to the
+    # seconds spent in it while running this dependency.
+    self.timings = {}
+    # Set when the checkout was found already synced without running the scm.
+    self.up_to_date = False
 
     # This is a mutable value that overrides the normal recursion limit for this
     # dependency.  It is read from the actual DEPS file so cannot be set on
@@ -593,7 +697,6 @@ class Dependency(gclient_utils.WorkItem, DependencySettings):
     assert not self.dependencies
 
     deps_content = None
-    use_strict = False
 
     # First try to locate the configured deps file.  If it's missing, fallback
     # to DEPS.
@@ -614,6 +717,52 @@ class Dependency(gclient_utils.WorkItem, DependencySettings):
     if os.path.isfile(filepath):
       deps_content = gclient_utils.FileRead(filepath)
       logging.debug('ParseDepsFile(%s) read:\n%s', self.name, deps_content)
+
+    # Everything the parsing depends on besides the content itself.
+    key = DepsCache.Key(
+        deps_content, self.name, filepath, sorted(self.target_os),
+        self.custom_vars, self.custom_deps, self.custom_hooks)
+    parsed = self.root.deps_cache.get(key)
+    if parsed is None:
+      parsed = self._ParseDepsContent(deps_content, filepath)
+      self.root.deps_cache.set(key, parsed)
+    else:
+      logging.info('ParseDepsFile(%s): cached', self.name)
+
+    if parsed['recursion'] is not None:
+      self.recursion_override = parsed['recursion']
+      logging.warning(
+          'Setting %s recursion to %d.', self.name, self.recursion_limit)
+    if parsed['recursedeps'] is not None:
+      self.recursedeps = set(parsed['recursedeps'])
+    if parsed['target_os'] is not None:
+      self.local_target_os = parsed['target_os']
+    if parsed['allowed_hosts'] is not None:
+      self._allowed_hosts = frozenset(parsed['allowed_hosts'])
+
+    # Convert the deps into real Dependency.
+    deps_to_add = []
+    for name, url in parsed['deps'].iteritems():
+      should_process = self.recursion_limit and self.should_process
+      deps_to_add.append(Dependency(
+          self, name, DepsCache.DecodeUrl(url), None, None, None, None, None,
+          self.deps_file, should_process))
+    deps_to_add.sort(key=lambda x: x.name)
+
+    self._pre_deps_hooks = [self.GetHookAction(hook, []) for hook in
+                            parsed['pre_deps_hooks']]
+
+    self.add_dependencies_and_close(deps_to_add, parsed['hooks'])
+    logging.info('ParseDepsFile(%s) done' % self.name)
+
+  def _ParseDepsContent(self, deps_content, filepath):
+    """Evaluates deps_content and resolves its deps and hooks for this
+    dependency.
+
+    Returns a dict that can be stored in the DepsCache.
+    """
+    use_strict = False
+    if deps_content:
       use_strict = 'use strict' in deps_content.splitlines()[0]
 
     local_scope = {}
@@ -648,20 +797,16 @@ class Dependency(gclient_utils.WorkItem, DependencySettings):
               (self.name, key, val))
 
     deps = local_scope.get('deps', {})
-    if 'recursion' in local_scope:
-      self.recursion_override = local_scope.get('recursion')
-      logging.warning(
-          'Setting %s recursion to %d.', self.name, self.recursion_limit)
-    self.recursedeps = local_scope.get('recursedeps', None)
+    recursedeps = local_scope.get('recursedeps', None)
     if 'recursedeps' in local_scope:
-      self.recursedeps = set(self.recursedeps)
-      logging.warning('Found recursedeps %r.', repr(self.recursedeps))
-    # If present, save 'target_os' in the local_target_os property.
-    if 'target_os' in local_scope:
-      self.local_target_os = local_scope['target_os']
+      recursedeps = set(recursedeps)
+      logging.warning('Found recursedeps %r.', repr(recursedeps))
     # load os specific dependencies if defined.  these dependencies may
     # override or extend the values defined by the 'deps' member.
     target_os_list = self.target_os
+    if 'target_os' in local_scope:
+      target_os_list = tuple(
+          set(local_scope['target_os']).union(target_os_list))
     if 'deps_os' in local_scope and target_os_list:
       deps = self.MergeWithOsDeps(deps, local_scope['deps_os'], target_os_list)
 
@@ -687,34 +832,26 @@ class Dependency(gclient_utils.WorkItem, DependencySettings):
       deps = rel_deps
 
       # Update recursedeps if it's set.
-      if self.recursedeps is not None:
+      if recursedeps is not None:
         logging.warning('Updating recursedeps by prepending %s.', self.name)
         rel_deps = set()
-        for d in self.recursedeps:
+        for d in recursedeps:
           rel_deps.add(os.path.normpath(os.path.join(self.name, d)))
-        self.recursedeps = rel_deps
+        recursedeps = rel_deps
 
+    allowed_hosts = None
     if 'allowed_hosts' in local_scope:
       try:
-        self._allowed_hosts = frozenset(local_scope.get('allowed_hosts'))
+        allowed_hosts = frozenset(local_scope.get('allowed_hosts'))
       except TypeError:  # raised if non-iterable
         pass
-      if not self._allowed_hosts:
+      if not allowed_hosts:
         logging.warning("allowed_hosts is specified but empty %s",
-                        self._allowed_hosts)
+                        allowed_hosts)
         raise gclient_utils.Error(
             'ParseDepsFile(%s): allowed_hosts must be absent '
             'or a non-empty iterable' % self.name)
 
-    # Convert the deps into real Dependency.
-    deps_to_add = []
-    for name, url in deps.iteritems():
-      should_process = self.recursion_limit and self.should_process
-      deps_to_add.append(Dependency(
-          self, name, url, None, None, None, None, None,
-          self.deps_file, should_process))
-    deps_to_add.sort(key=lambda x: x.name)
-
     # override named sets of hooks by the custom hooks
     hooks_to_run = []
     hook_names_to_suppress = [c.get('name', '') for c in self.custom_hooks]
@@ -727,11 +864,17 @@ class Dependency(gclient_utils.WorkItem, DependencySettings):
       if 'action' in hook:
         hooks_to_run.append(hook)
 
-    self._pre_deps_hooks = [self.GetHookAction(hook, []) for hook in
-                            local_scope.get('pre_deps_hooks', [])]
-
-    self.add_dependencies_and_close(deps_to_add, hooks_to_run)
-    logging.info('ParseDepsFile(%s) done' % self.name)
+    return {
+      'deps': dict(
+          (name, DepsCache.EncodeUrl(url)) for name, url in deps.iteritems()),
+      'recursion': local_scope.get('recursion'),
+      'recursedeps': sorted(recursedeps) if recursedeps is not None else None,
+      'target_os': local_scope.get('target_os'),
+      'allowed_hosts': (
+          sorted(allowed_hosts) if allowed_hosts is not None else None),
+      'hooks': hooks_to_run,
+      'pre_deps_hooks': local_scope.get('pre_deps_hooks', []),
+    }
 
   def add_dependencies_and_close(self, deps_to_add, hooks):
     """Adds the dependencies, hooks and mark the parsing as done."""
@@ -832,6 +975,8 @@ class Dependency(gclient_utils.WorkItem, DependencySettings):
             out_cb=work_queue.out_cb)
         self._got_revision = self._used_scm.RunCommand(command, options, args,
                                                        file_list)
+        self.timings.update(self._used_scm.timings)
+        self.up_to_date = self._used_scm.short_circuited
         if file_list:
           file_list = [os.path.join(self.name, f.strip()) for f in file_list]
 
@@ -849,7 +994,9 @@ class Dependency(gclient_utils.WorkItem, DependencySettings):
           file_list[i] = file_list[i][1:]
 
     # Always parse the DEPS file.
+    start_time = time.time()
     self.ParseDepsFile()
+    self.timings['deps'] = time.time() - start_time
     self._run_is_done(file_list or [], parsed_url)
     if command in ('update', 'revert') and not options.noprehooks:
       self.RunPreDepsHooks()
@@ -945,6 +1092,10 @@ class Dependency(gclient_utils.WorkItem, DependencySettings):
 
     RunOnDeps() must have been called before to load the DEPS.
     """
+    return [action for _, action in self.GetHookItems(options)]
+
+  def GetHookItems(self, options):
+    """Same as GetHooks() but returns a list of (hook_dict, action)."""
     result = []
     if not self.should_process or not self.recursion_limit:
       # Don't run the hook when it is above recursion_limit.
@@ -960,7 +1111,7 @@ class Dependency(gclient_utils.WorkItem, DependencySettings):
           gclient_scm.GetScmName(self.parsed_url) in ('git', None) or
           os.path.isdir(os.path.join(self.root.root_dir, self.name, '.git'))):
         for hook_dict in self.deps_hooks:
-          result.append(self.GetHookAction(hook_dict, []))
+          result.append((hook_dict, self.GetHookAction(hook_dict, [])))
       else:
         # Run hooks on the basis of whether the files from the gclient operation
         # match each hook's pattern.
@@ -970,15 +1121,20 @@ class Dependency(gclient_utils.WorkItem, DependencySettings):
               f for f in self.file_list_and_children if pattern.search(f)
           ]
           if matching_file_list:
-            result.append(self.GetHookAction(hook_dict, matching_file_list))
+            result.append(
+                (hook_dict, self.GetHookAction(hook_dict, matching_file_list)))
     for s in self.dependencies:
-      result.extend(s.GetHooks(options))
+      result.extend(s.GetHookItems(options))
     return result
 
   def RunHooksRecursively(self, options):
     assert self.hooks_ran == False
     self._hooks_ran = True
-    for hook in self.GetHooks(options):
+    hooks = self.GetHookItems(options)
+    if any('depends_on' in hook_dict for hook_dict, _ in hooks):
+      self._RunHooksInParallel(hooks, options)
+      return
+    for _, hook in hooks:
       try:
         start_time = time.time()
         gclient_utils.CheckCallAndFilterAndHeader(
@@ -991,10 +1147,43 @@ class Dependency(gclient_utils.WorkItem, DependencySettings):
         sys.exit(2)
       finally:
         elapsed_time = time.time() - start_time
+        self.root.hook_timings.append(
+            (gclient_utils.CommandToStr(hook), elapsed_time))
         if elapsed_time > 10:
           print("Hook '%s' took %.2f secs" % (
               gclient_utils.CommandToStr(hook), elapsed_time))
 
+  def _RunHooksInParallel(self, hooks, options):
+    """Runs the hooks with an ExecutionQueue, honoring their depends_on."""
+    items = [Hook(i, hook_dict, action) for i, (hook_dict, action) in
+             enumerate(hooks)]
+    names = {}
+    for item in items:
+      if item.hook_dict.get('name'):
+        names.setdefault(item.hook_dict['name'], []).append(item.name)
+    for i, item in enumerate(items):
+      depends_on = item.hook_dict.get('depends_on')
+      if depends_on is None:
+        item.requirements = tuple(j.name for j in items[:i])
+        continue
+      if not isinstance(depends_on, (list, tuple)):
+        raise gclient_utils.Error(
+            'depends_on of %s must be a list of hook names' % item.name)
+      # Names that don't match any hook refer to hooks that were skipped.
+      item.requirements = tuple(
+          r for name in depends_on for r in names.get(name, []))
+    work_queue = gclient_utils.ExecutionQueue(
+        options.jobs, None, False, verbose=True)
+    for item in items:
+      work_queue.enqueue(item)
+    try:
+      work_queue.flush(self.root)
+    except (gclient_utils.Error, subprocess2.CalledProcessError) as e:
+      # Use a discrete exit status code of 2 to indicate that a hook action
+      # failed.
+      print('Error: %s' % str(e), file=sys.stderr)
+      sys.exit(2)
+
   def RunPreDepsHooks(self):
     assert self.processed
     assert self.deps_parsed
@@ -1016,6 +1205,8 @@ class Dependency(gclient_utils.WorkItem, DependencySettings):
         sys.exit(2)
       finally:
         elapsed_time = time.time() - start_time
+        self.root.hook_timings.append(
+            (gclient_utils.CommandToStr(hook), elapsed_time))
         if elapsed_time > 10:
           print("Hook '%s' took %.2f secs" % (
               gclient_utils.CommandToStr(hook), elapsed_time))
@@ -1148,6 +1339,35 @@ class Dependency(gclient_utils.WorkItem, DependencySettings):
     return out
 
 
+class Hook(gclient_utils.WorkItem):
+  """One hook action run by an ExecutionQueue once its requirements, the
+  names of other Hook instances, are done. Its output is buffered."""
+
+  def __init__(self, index, hook_dict, action):
+    label = hook_dict.get('name') or gclient_utils.CommandToStr(action)
+    gclient_utils.WorkItem.__init__(self, 'hook %d: %s' % (index, label))
+    self.hook_dict = hook_dict
+    self.action = action
+    self.requirements = ()
+
+  # pylint: disable=W0221
+  def run(self, root, work_queue):
+    """Runs the hook in the root directory of the checkout."""
+    # Disable 'unused work_queue' warning | pylint: disable=W0613
+    start_time = time.time()
+    try:
+      gclient_utils.CheckCallAndFilterAndHeader(
+          self.action, cwd=root.root_dir, always=True, stdout=self.outbuf)
+    finally:
+      elapsed_time = time.time() - start_time
+      root.hook_timings.append(
+          (gclient_utils.CommandToStr(self.action), elapsed_time))
+      if elapsed_time > 10:
+        print("Hook '%s' took %.2f secs" % (
+            gclient_utils.CommandToStr(self.action), elapsed_time),
+            file=self.outbuf)
+
+
 class GClient(Dependency):
   """Object that represent a gclient checkout. A tree of Dependency(), one per
   solution or DEPS entry."""
@@ -1212,6 +1432,9 @@ solutions = [
     self._enforced_os = tuple(set(enforced_os))
     self._root_dir = root_dir
     self.config_content = None
+    # List of (action, seconds) for every hook that ran.
+    self.hook_timings = []
+    self._deps_cache = None
 
   def _CheckConfig(self):
     """Verify that the config matches the state of the existing checked-out
@@ -1412,6 +1635,17 @@ been automagically updated.  The previous version is available at %s.old.
       'cache_dir': cache_dir,
     })
 
+  @property
+  def deps_cache(self):
+    """The DepsCache of this checkout, loaded on first use."""
+    with self.lock:
+      if self._deps_cache is None:
+        path = None
+        if getattr(self._options, 'deps_cache_filename', None):
+          path = os.path.join(self.root_dir, self._options.deps_cache_filename)
+        self._deps_cache = DepsCache(path)
+      return self._deps_cache
+
   def _SaveEntries(self):
     """Creates a .gclient_entries file to record the list of unique checkouts.
 
@@ -1515,20 +1749,48 @@ been automagically updated.  The previous version is available at %s.old.
         pm = Progress('Syncing projects', 1)
       elif command == 'recurse':
         pm = Progress(' '.join(args), 1)
+    timings = None
+    priorities = None
+    if command == 'update':
+      # Start the dependencies that historically delayed the sync the most
+      # first.
+      timings = gclient_timings.SyncTimings(
+          os.path.join(self.root_dir, self._options.timings_filename))
+      priorities = timings.critical_paths()
     work_queue = gclient_utils.ExecutionQueue(
         self._options.jobs, pm, ignore_requirements=ignore_requirements,
-        verbose=self._options.verbose)
+        verbose=self._options.verbose, priorities=priorities,
+        log_dir=os.path.join(self.root_dir, self._options.logs_dirname),
+        live=self._options.verbose and self._options.live_output)
     for s in self.dependencies:
       work_queue.enqueue(s)
-    work_queue.flush(revision_overrides, command, args, options=self._options)
-    if revision_overrides:
-      print('Please fix your script, having invalid --revision flags will soon '
-            'considered an error.', file=sys.stderr)
-
-    # Once all the dependencies have been processed, it's now safe to run the
-    # hooks.
-    if not self._options.nohooks:
-      self.RunHooksRecursively(self._options)
+    sync_start = datetime.datetime.now()
+    sync_finish = None
+    try:
+      work_queue.flush(
+          revision_overrides, command, args, options=self._options)
+      sync_finish = datetime.datetime.now()
+      self.deps_cache.save()
+      if command == 'update' and self._options.verbose:
+        up_to_date = len([d for d in self.subtree(False) if d.up_to_date])
+        if up_to_date:
+          print('%d dependencies were already up to date.' % up_to_date)
+      if revision_overrides:
+        print('Please fix your script, having invalid --revision flags will '
+              'soon considered an error.', file=sys.stderr)
+
+      # Once all the dependencies have been processed, it's now safe to run
+      # the hooks.
+      if not self._options.nohooks:
+        self.RunHooksRecursively(self._options)
+    finally:
+      # The durations measured are kept even if the sync failed or was
+      # interrupted.
+      if timings:
+        timings.record_run(
+            self, self._options.jobs, sync_start,
+            sync_finish or datetime.datetime.now(), self.hook_timings)
+        timings.save()
 
     if command == 'update':
       # Notify the user if there is an orphaned entry in their working copy.
@@ -1624,7 +1886,8 @@ been automagically updated.  The previous version is available at %s.old.
             # Delete the entry
             print('\n________ deleting \'%s\' in \'%s\'' % (
                 entry_fixed, self.root_dir))
-            gclient_utils.rmtree(e_dir)
+            gclient_utils.rmtree_in_background(
+                e_dir, os.path.join(self.root_dir, self._options.trash_dirname))
       # record the current list of entries for next time
       self._SaveEntries()
     return 0
@@ -1638,6 +1901,7 @@ been automagically updated.  The previous version is available at %s.old.
     for s in self.dependencies:
       work_queue.enqueue(s)
     work_queue.flush({}, None, [], options=self._options)
+    self.deps_cache.save()
 
     def GetURLAndRev(dep):
       """Returns the revision-qualified SCM url for a Dependency."""
@@ -2049,6 +2313,9 @@ def CMDsync(parser, args):
                     help='Don\'t bootstrap from Google Storage.')
   parser.add_option('--ignore_locks', action='store_true',
                     help='GIT ONLY - Ignore cache locks.')
+  parser.add_option('--timings', action='store_true',
+                    help='Print a summary of the slowest dependencies and '
+                         'hooks once the sync is done.')
   (options, args) = parser.parse_args(args)
   client = GClient.LoadCurrentConfig(options)
 
@@ -2064,6 +2331,9 @@ def CMDsync(parser, args):
     # client dict, but more legible, and it might contain helpful comments.
     print(client.config_content)
   ret = client.RunOnDeps('update', args)
+  if options.timings:
+    print('\n'.join(gclient_timings.SyncTimings(
+        os.path.join(client.root_dir, options.timings_filename)).report()))
   if options.output_json:
     slns = {}
     for d in client.subtree(True):
@@ -2173,6 +2443,21 @@ def CMDrevinfo(parser, args):
   return 0
 
 
+def CMDtimings(parser, args):
+  """Reports the slowest dependencies and hooks of the previous syncs."""
+  parser.add_option('-n', '--limit', type='int', default=10,
+                    help='Number of dependencies and hooks to list; defaults '
+                         'to %default')
+  (options, args) = parser.parse_args(args)
+  root = gclient_utils.FindGclientRoot(os.getcwd(), options.config_filename)
+  if not root:
+    raise gclient_utils.Error('client not configured; see \'gclient config\'')
+  timings = gclient_timings.SyncTimings(
+      os.path.join(root, options.timings_filename))
+  print('\n'.join(timings.report(options.limit)))
+  return 0
+
+
 def CMDhookinfo(parser, args):
   """Outputs the hooks that would be run by `gclient runhooks`."""
   (options, args) = parser.parse_args(args)
@@ -2243,6 +2528,10 @@ class OptionParser(optparse.OptionParser):
     self.add_option(
         '--no-nag-max', default=False, action='store_true',
         help='Ignored for backwards compatibility.')
+    self.add_option(
+        '--live-output', action='store_true',
+        help='With --verbose, print the output of each dependency as it is '
+             'produced instead of once it is done.')
 
   def parse_args(self, args=None, values=None):
     """Integrates standard options processing."""
@@ -2259,6 +2548,10 @@ class OptionParser(optparse.OptionParser):
     if not options.config_filename:
       options.config_filename = self.gclientfile_default
     options.entries_filename = options.config_filename + '_entries'
+    options.timings_filename = options.config_filename + '_timings'
+    options.deps_cache_filename = options.config_filename + '_deps_cache'
+    options.logs_dirname = options.config_filename + '_logs'
+    options.trash_dirname = options.config_filename + '_trash'
     if options.jobs < 1:
       self.error('--jobs must be 1 or higher')
 
@@ -6,13 +6,16 @@
 
 from __future__ import print_function
 
+import contextlib
 import errno
+import json
 import logging
 import os
 import posixpath
 import re
 import sys
 import tempfile
+import time
 import traceback
 import urlparse
 
@@ -29,6 +32,9 @@ THIS_FILE_PATH = os.path.abspath(__file__)
 GSUTIL_DEFAULT_PATH = os.path.join(
     os.path.dirname(os.path.abspath(__file__)), 'gsutil.py')
 
+# Written in .git by GitWrapper.update() to detect no-op syncs.
+SYNC_STATE_FILE = 'gclient_sync_state'
+
 
 class NoUsableRevError(gclient_utils.Error):
   """Raised if requested revision isn't found in checkout."""
@@ -124,6 +130,18 @@ def CreateSCM(url, root_dir=None, relpath=None, out_fh=None, out_cb=None):
 
 # SCMWrapper base class
 
+def timed_phase(phase):
+  """SCMWrapper method decorator accounting its duration to phase."""
+  def decorator(method):
+    def inner(self, *args, **kwargs):
+      with self._Phase(phase):
+        return method(self, *args, **kwargs)
+    inner.__name__ = method.__name__
+    inner.__doc__ = method.__doc__
+    return inner
+  return decorator
+
+
 class SCMWrapper(object):
   """Add necessary glue between all the supported SCM.
 
@@ -145,6 +163,30 @@ class SCMWrapper(object):
       out_fh = sys.stdout
     self.out_fh = out_fh
     self.out_cb = out_cb
+    # Maps a phase name, e.g. 'clone' or 'fetch', to the seconds spent in it.
+    # Time spent in a nested phase is only accounted to the inner one.
+    self.timings = {}
+    self._phases = []
+    # Set when update() found the checkout already up to date.
+    self.short_circuited = False
+
+  @contextlib.contextmanager
+  def _Phase(self, phase):
+    """Accounts the time spent in the block to phase."""
+    now = time.time()
+    if self._phases:
+      outer = self._phases[-1]
+      self.timings[outer[0]] = (
+          self.timings.get(outer[0], 0) + now - outer[1])
+    self._phases.append([phase, now])
+    try:
+      yield
+    finally:
+      now = time.time()
+      _, resumed = self._phases.pop()
+      self.timings[phase] = self.timings.get(phase, 0) + now - resumed
+      if self._phases:
+        self._phases[-1][1] = now
 
   def Print(self, *args, **kwargs):
     kwargs.setdefault('file', self.out_fh)
@@ -338,6 +380,102 @@ class GitWrapper(SCMWrapper):
     if args:
       raise gclient_utils.Error("Unsupported argument(s): %s" % ",".join(args))
 
+    # Short-circuit dependencies pinned to the sha1 they are already at when
+    # nothing changed since the last sync, without running git at all.
+    pinned = self._GetPinnedRevision(options)
+    if pinned:
+      state = self._GetSyncState(*pinned)
+      if state and state == self._ReadSyncState():
+        self.short_circuited = True
+        self.Print('_____ %s at %s' % (self.relpath, pinned[0]),
+                   timestamp=False)
+        return pinned[0]
+
+    result = self._Update(options, file_list)
+    if pinned:
+      self._WriteSyncState(self._GetSyncState(*pinned))
+    return result
+
+  def _GetPinnedRevision(self, options):
+    """Returns (sha1, url) if the dependency is pinned to a sha1 and a sync
+    could be a no-op, or None.
+
+    url is the url the checkout is expected to fetch from.
+    """
+    if (options.force or options.reset or
+        getattr(options, 'upstream', False) or
+        getattr(options, 'with_branch_heads', False) or
+        getattr(options, 'with_tags', False)):
+      return None
+    url, revision = gclient_utils.SplitUrlRevision(self.url)
+    if options.revision:
+      revision = str(options.revision)
+    if not revision or not re.match('^[0-9a-f]{40}$', revision):
+      return None
+    mirror = self._GetMirror(url, options)
+    if mirror:
+      url = mirror.mirror_path
+    return revision, url
+
+  def _ReadHead(self):
+    """Returns the sha1 HEAD resolves to by reading .git directly, or None."""
+    git_dir = os.path.join(self.checkout_path, '.git')
+    try:
+      head = gclient_utils.FileRead(os.path.join(git_dir, 'HEAD')).strip()
+    except (IOError, OSError):
+      return None
+    if not head.startswith('ref: '):
+      return str(head)
+    ref = head[len('ref: '):]
+    try:
+      return str(gclient_utils.FileRead(
+          os.path.join(git_dir, *ref.split('/'))).strip())
+    except (IOError, OSError):
+      pass
+    try:
+      with open(os.path.join(git_dir, 'packed-refs')) as f:
+        for line in f:
+          parts = line.split()
+          if len(parts) == 2 and parts[1] == ref:
+            return parts[0]
+    except IOError:
+      pass
+    return None
+
+  def _GetSyncState(self, revision, url):
+    """Returns the state a no-op sync to revision from url depends on, or None
+    if HEAD isn't at revision.
+
+    The stat of .git/index changes whenever git touches the worktree stat
+    cache and the one of .git/config when the remote url may have changed.
+    """
+    if self._ReadHead() != revision:
+      return None
+    state = {'revision': revision, 'url': url}
+    for name in ('index', 'config'):
+      try:
+        st = os.stat(os.path.join(self.checkout_path, '.git', name))
+      except OSError:
+        return None
+      state[name] = [st.st_mtime, st.st_size, st.st_ino]
+    return state
+
+  def _ReadSyncState(self):
+    try:
+      return json.loads(gclient_utils.FileRead(
+          os.path.join(self.checkout_path, '.git', SYNC_STATE_FILE)))
+    except (IOError, OSError, ValueError):
+      return None
+
+  def _WriteSyncState(self, state):
+    path = os.path.join(self.checkout_path, '.git', SYNC_STATE_FILE)
+    if state:
+      gclient_utils.FileWrite(path, json.dumps(state))
+    elif os.path.exists(path):
+      os.remove(path)
+
+  def _Update(self, options, file_list):
+    """Does the actual work of update() with git."""
     self._CheckMinVersion("1.6.6")
 
     # If a dependency is not pinned, track the default remote branch.
@@ -413,7 +551,8 @@ class GitWrapper(SCMWrapper):
         (os.path.isdir(self.checkout_path) and
          not os.path.exists(os.path.join(self.checkout_path, '.git')))):
       if mirror:
-        self._UpdateMirror(mirror, options)
+        with self._Phase('mirror'):
+          self._UpdateMirror(mirror, options)
       try:
         self._Clone(revision, url, options)
       except subprocess2.CalledProcessError:
@@ -434,7 +573,8 @@ class GitWrapper(SCMWrapper):
       return self._Capture(['rev-parse', '--verify', 'HEAD'])
 
     if mirror:
-      self._UpdateMirror(mirror, options)
+      with self._Phase('mirror'):
+        self._UpdateMirror(mirror, options)
 
     # See if the url has changed (the unittests use git://foo for the url, let
     # that through).
@@ -874,6 +1014,7 @@ class GitWrapper(SCMWrapper):
                     ignore_lock=getattr(options, 'ignore_locks', False))
     mirror.unlock()
 
+  @timed_phase('clone')
   def _Clone(self, revision, url, options):
     """Clone a git repository from the given URL.
 
@@ -1140,6 +1281,7 @@ class GitWrapper(SCMWrapper):
     env = scm.GIT.ApplyEnvVars(kwargs)
     return subprocess2.check_output(['git'] + args, env=env, **kwargs).strip()
 
+  @timed_phase('checkout')
   def _Checkout(self, options, ref, force=False, quiet=None):
     """Performs a 'git-checkout' operation.
 
@@ -1160,6 +1302,7 @@ class GitWrapper(SCMWrapper):
     checkout_args.append(ref)
     return self._Capture(checkout_args)
 
+  @timed_phase('fetch')
   def _Fetch(self, options, remote=None, prune=False, quiet=False):
     cfg = gclient_utils.DefaultIndexPackConfig(self.url)
     fetch_cmd =  cfg + [
@@ -1203,6 +1346,8 @@ class GitWrapper(SCMWrapper):
     kwargs.setdefault('stdout', self.out_fh)
     kwargs['filter_fn'] = self.filter
     kwargs.setdefault('print_stdout', False)
+    # The output of fetches and clones can be large and is never looked at.
+    kwargs.setdefault('return_output', False)
     env = scm.GIT.ApplyEnvVars(kwargs)
     cmd = ['git'] + args
     if show_header:
@@ -0,0 +1,217 @@
+# Copyright 2015 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Persistent record of how long each dependency and hook took to sync.
+
+The data is kept in a small json file next to .gclient. It is used to start
+the dependencies on the longest chains first on the next sync and to report
+the slowest dependencies and hooks with 'gclient timings'.
+"""
+
+import calendar
+import datetime
+import json
+import logging
+import os
+
+import gclient_utils
+
+
+# Weight of the latest sample in the smoothed duration of a dependency.
+SMOOTHING = 0.5
+
+# Number of syncs kept in the history.
+MAX_RUNS = 30
+
+
+def _seconds(delta):
+  return round(delta.total_seconds(), 2)
+
+
+def repository_size(path):
+  """Returns the size in bytes of the packs of the git repository at path.
+
+  Loose objects are ignored; it is meant to be cheap, not exact.
+  """
+  pack_dir = os.path.join(path, '.git', 'objects', 'pack')
+  if not os.path.isdir(pack_dir):
+    return None
+  return sum(os.path.getsize(os.path.join(pack_dir, f))
+             for f in os.listdir(pack_dir))
+
+
+class SyncTimings(object):
+  """Timings of the previous syncs of a checkout."""
+
+  def __init__(self, path):
+    self.path = path
+    # Maps a Dependency name to {'duration': seconds, 'parent': name or None}
+    # where duration is smoothed over all the syncs.
+    self.deps = {}
+    # One dict per sync, oldest first. See record_run() for the format.
+    self.runs = []
+    self.load()
+
+  def load(self):
+    if not os.path.exists(self.path):
+      return
+    try:
+      data = json.loads(gclient_utils.FileRead(self.path))
+      self.deps = data.get('deps', {})
+      self.runs = data.get('runs', [])
+    except (IOError, ValueError, AttributeError) as e:
+      logging.warning('Ignoring unreadable %s: %s', self.path, e)
+      self.deps = {}
+      self.runs = []
+
+  def save(self):
+    content = json.dumps(
+        {'deps': self.deps, 'runs': self.runs[-MAX_RUNS:]},
+        sort_keys=True, separators=(',', ':'))
+    gclient_utils.FileWrite(self.path, content)
+
+  def record_dep(self, name, parent, seconds):
+    """Folds a new sync duration for the dependency name into its history."""
+    previous = self.deps.get(name)
+    if previous:
+      seconds = SMOOTHING * seconds + (1 - SMOOTHING) * previous['duration']
+    self.deps[name] = {'duration': seconds, 'parent': parent}
+
+  def record_run(self, root, jobs, start, finish, hooks):
+    """Records the sync of every processed Dependency under root.
+
+    Args:
+      root: GClient instance that was synced.
+      jobs: number of parallel jobs used.
+      start, finish: datetime boundaries of the dependencies processing.
+      hooks: list of (action, seconds) for the hooks that ran.
+    """
+    run = {
+      'time': calendar.timegm(start.utctimetuple()),
+      'jobs': jobs,
+      'elapsed': _seconds(finish - start),
+      'deps': {},
+      'up_to_date': 0,
+      'hooks': [{'action': a, 'elapsed': round(s, 2)} for a, s in hooks],
+    }
+    for d in root.subtree(False):
+      if not d.start or not d.finish:
+        continue
+      work = d.finish - d.start
+      if d.up_to_date:
+        run['up_to_date'] += 1
+      parent = d.parent.name if d.parent else None
+      self.record_dep(d.name, parent, work.total_seconds())
+      entry = {
+        'work': _seconds(work),
+        'phases': dict((k, round(v, 2)) for k, v in d.timings.iteritems()),
+      }
+      if d.enqueued:
+        entry['wait'] = _seconds(d.start - d.enqueued)
+      size = repository_size(os.path.join(root.root_dir, d.name))
+      if size is not None:
+        entry['size'] = size
+      run['deps'][d.name] = entry
+    self.runs.append(run)
+    del self.runs[:-MAX_RUNS]
+
+  def critical_paths(self):
+    """Returns a dict of name to the duration of the longest chain of
+    dependencies starting at name, including itself.
+
+    A dependency's children can only start once it is done so the chain
+    length is the best known estimate of how long it delays the whole sync.
+    """
+    children = {}
+    for name, info in self.deps.iteritems():
+      children.setdefault(info.get('parent'), []).append(name)
+    paths = {}
+    def visit(name, seen):
+      if name in paths:
+        return paths[name]
+      if name in seen:
+        # Corrupted history; don't loop forever.
+        return 0
+      seen.add(name)
+      longest = max(
+          [visit(child, seen) for child in children.get(name, [])] or [0])
+      paths[name] = self.deps[name]['duration'] + longest
+      return paths[name]
+    for name in self.deps:
+      visit(name, set())
+    return paths
+
+  def report(self, limit=10):
+    """Returns a human readable summary of the recorded syncs as a list of
+    lines."""
+    if not self.runs:
+      return ['No sync recorded yet.']
+    last = self.runs[-1]
+    when = datetime.datetime.fromtimestamp(last['time'])
+    working = sum(d['work'] for d in last['deps'].itervalues())
+    waiting = sum(d.get('wait', 0) for d in last['deps'].itervalues())
+    hooks = sum(h['elapsed'] for h in last['hooks'])
+    out = [
+      'Last sync: %s, %d jobs, %.1fs for %d dependencies, %.1fs of hooks.' % (
+          when.strftime('%Y-%m-%d %H:%M'), last['jobs'], last['elapsed'],
+          len(last['deps']), hooks),
+      '  Working: %.1fs, waiting in the queue: %.1fs.' % (working, waiting),
+    ]
+    if last.get('up_to_date'):
+      out.append('  %d dependencies were already up to date.' %
+                 last['up_to_date'])
+
+    samples = {}
+    for run in self.runs:
+      for name, entry in run['deps'].iteritems():
+        samples.setdefault(name, []).append(entry['work'])
+    out.append('')
+    out.append('Slowest dependencies over the last %d syncs:' % len(self.runs))
+    out.extend(self._format_samples(samples, limit, self._format_dep(last)))
+
+    samples = {}
+    for run in self.runs:
+      for hook in run['hooks']:
+        samples.setdefault(hook['action'], []).append(hook['elapsed'])
+    if samples:
+      out.append('')
+      out.append('Slowest hooks over the last %d syncs:' % len(self.runs))
+      out.extend(self._format_samples(samples, limit, lambda _: ''))
+    return out
+
+  @staticmethod
+  def _format_dep(last):
+    """Returns a function describing the last sync of a dependency."""
+    def format_dep(name):
+      entry = last['deps'].get(name)
+      if not entry:
+        return ''
+      details = ['%s %.1fs' % (k, v) for k, v in sorted(
+          entry['phases'].iteritems(), key=lambda x: -x[1])]
+      if 'wait' in entry:
+        details.append('queued %.1fs' % entry['wait'])
+      if 'size' in entry:
+        details.append('%.1fMiB' % (entry['size'] / 1024. / 1024.))
+      return '  (%s)' % ', '.join(details) if details else ''
+    return format_dep
+
+  @staticmethod
+  def _format_samples(samples, limit, describe):
+    """Formats the slowest entries of samples, a dict of name to a list of
+    durations, oldest first."""
+    lines = ['  %8s %8s %6s  %s' % ('avg', 'last', 'trend', 'name')]
+    averages = sorted(
+        ((sum(v) / len(v), k) for k, v in samples.iteritems()), reverse=True)
+    for average, name in averages[:limit]:
+      values = samples[name]
+      trend = '-'
+      if len(values) > 1:
+        half = len(values) / 2
+        older = sum(values[:half]) / half
+        newer = sum(values[half:]) / (len(values) - half)
+        if older:
+          trend = '%+d%%' % int(round((newer - older) * 100 / older))
+      lines.append('  %7.1fs %7.1fs %6s  %s%s' % (
+          average, values[-1], trend, name, describe(name)))
+    return lines
@@ -5,8 +5,13 @@
 """Generic utils."""
 
 import codecs
+import collections
 import cStringIO
 import datetime
+import errno
+import hashlib
+import heapq
+import itertools
 import logging
 import os
 import pipes
@@ -26,6 +31,14 @@ import subprocess2
 
 RETRY_MAX = 3
 RETRY_INITIAL_SLEEP = 0.5
+# Maximum size of each read of a child's output by CheckCallAndFilter.
+OUTPUT_CHUNK_SIZE = 64 * 1024
+# Output captured by CheckCallAndFilter past this size is kept on disk.
+OUTPUT_SPILL_SIZE = 4 * 1024 * 1024
+# Amount of the most recent output of a WorkItem kept in memory.
+TASK_OUTPUT_SIZE = 64 * 1024
+# Number of threads deleting a directory tree in rmtree().
+RMTREE_JOBS = 8
 START = datetime.datetime.now()
 
 
@@ -198,6 +211,10 @@ def rmtree(path):
   Doing so would be hazardous, as it's not a directory slated for removal.
   In the ordinary case, this is not a problem: for our purposes, the user
   will never lack write permission on *path's parent.
+
+  The tree is walked without recursion and each entry is unlinked without
+  being stat()'ed first; only the entries that turn out to be directories are
+  looked at. The directories are emptied by up to RMTREE_JOBS threads.
   """
   if not os.path.exists(path):
     return
@@ -217,27 +234,150 @@ def rmtree(path):
       time.sleep(3)
     raise Exception('Failed to remove path %s' % path)
 
+  # Every directory of the tree, removed once they are all empty.
+  dirs = [path]
+  subdirs = _empty_dir(path)
+  if subdirs:
+    dirs.extend(subdirs)
+    pending = Queue.Queue()
+    errors = []
+    lock = threading.Lock()
+    def worker():
+      while True:
+        directory = pending.get()
+        try:
+          if directory is None:
+            return
+          if not errors:
+            found = _empty_dir(directory)
+            with lock:
+              dirs.extend(found)
+            for subdir in found:
+              pending.put(subdir)
+        except Exception:
+          errors.append(sys.exc_info())
+        finally:
+          pending.task_done()
+    for subdir in subdirs:
+      pending.put(subdir)
+    threads = [threading.Thread(target=worker) for _ in xrange(RMTREE_JOBS)]
+    for thread in threads:
+      thread.daemon = True
+      thread.start()
+    # Like pending.join() but with a timeout, otherwise Ctrl-C isn't processed.
+    with pending.all_tasks_done:
+      while pending.unfinished_tasks:
+        pending.all_tasks_done.wait(1)
+    for _ in threads:
+      pending.put(None)
+    for thread in threads:
+      thread.join()
+    if errors:
+      raise errors[0][0], errors[0][1], errors[0][2]
+
+  # Children before their parent.
+  dirs.sort(key=lambda d: d.count(os.sep), reverse=True)
+  for directory in dirs:
+    try:
+      os.rmdir(directory)
+    except OSError as e:
+      if e.errno != errno.ENOENT:
+        raise
+
+
+def _empty_dir(path):
+  """Removes everything but the subdirectories of path and returns them."""
   # On POSIX systems, we need the x-bit set on the directory to access it,
   # the r-bit to see its contents, and the w-bit to remove files from it.
   # The actual modes of the files within the directory is irrelevant.
   os.chmod(path, stat.S_IRUSR | stat.S_IWUSR | stat.S_IXUSR)
-
-  def remove(func, subpath):
-    func(subpath)
-
+  subdirs = []
   for fn in os.listdir(path):
-    # If fullpath is a symbolic link that points to a directory, isdir will
-    # be True, but we don't want to descend into that as a directory, we just
-    # want to remove the link.  Check islink and treat links as ordinary files
-    # would be treated regardless of what they reference.
     fullpath = os.path.join(path, fn)
-    if os.path.islink(fullpath) or not os.path.isdir(fullpath):
-      remove(os.remove, fullpath)
-    else:
-      # Recurse.
-      rmtree(fullpath)
+    try:
+      # Symbolic links are removed like files, even when they point to a
+      # directory.
+      os.remove(fullpath)
+    except OSError as e:
+      if e.errno == errno.ENOENT:
+        continue
+      # Linux fails with EISDIR for a directory, OSX with EPERM.
+      if (e.errno not in (errno.EISDIR, errno.EPERM) or
+          not stat.S_ISDIR(os.lstat(fullpath).st_mode)):
+        raise
+      subdirs.append(fullpath)
+  return subdirs
+
+
+def _trash_owner_alive(name, prefix):
+  """Returns True if the trash entry name, made by rmtree_in_background(),
+  belongs to a process that is still running."""
+  match = re.match(r'%s\.(\d+)\.' % re.escape(prefix), name)
+  if not match:
+    return False
+  pid = int(match.group(1))
+  if pid == os.getpid():
+    return True
+  if sys.platform == 'win32':
+    # os.kill() would terminate the process.
+    return False
+  try:
+    os.kill(pid, 0)
+  except OSError as e:
+    return e.errno != errno.ESRCH
+  return True
+
+
+def rmtree_in_background(path, trash_dir, prefix='trash'):
+  """Moves the directory path out of the way right away and deletes it with
+  rmtree() from a background thread.
+
+  path is moved into a new directory named prefix.<pid>.* in trash_dir, which
+  must be on the same file system. Leftovers of processes that are gone, e.g.
+  interrupted ones, are deleted as well; a process claims each of them by
+  renaming it into one of its own directories first, so several processes
+  sharing trash_dir don't delete the same ones. The thread is a daemon so the
+  process doesn't wait for the deletion to exit; what is left is deleted by a
+  later call.
+
+  Falls back to deleting path synchronously when it can't be moved.
+  """
+  if not os.path.exists(path):
+    return
+  own_prefix = '%s.%d.' % (prefix, os.getpid())
+  try:
+    safe_makedirs(trash_dir)
+    destination = tempfile.mkdtemp(prefix=own_prefix, dir=trash_dir)
+    os.rename(path, os.path.join(destination, os.path.basename(path)))
+  except OSError as e:
+    logging.info('Deleting %s in the foreground: %s', path, e)
+    rmtree(path)
+    return
 
-  remove(os.rmdir, path)
+  def empty_trash():
+    directories = [destination]
+    for name in os.listdir(trash_dir):
+      if not name.startswith(prefix) or _trash_owner_alive(name, prefix):
+        continue
+      try:
+        claim = tempfile.mkdtemp(prefix=own_prefix, dir=trash_dir)
+      except OSError:
+        break
+      directories.append(claim)
+      try:
+        os.rename(os.path.join(trash_dir, name), os.path.join(claim, name))
+      except OSError:
+        # Another process claimed it first.
+        pass
+    for directory in directories:
+      try:
+        rmtree(directory)
+      except Exception as e:
+        logging.warning('Failed to delete %s: %s', directory, e)
+
+  thread = threading.Thread(target=empty_trash, name='rmtree %s' % path)
+  thread.daemon = True
+  thread.start()
 
 
 def safe_makedirs(tree):
@@ -365,12 +505,12 @@ class Annotated(Wrapper):
       self.lock.release()
 
     # Continue lockless.
-    obj[0] += out
-    while '\n' in obj[0]:
-      line, remaining = obj[0].split('\n', 1)
-      if line:
-        self._wrapped.write('%d>%s\n' % (index, line))
-      obj[0] = remaining
+    complete, newline, obj[0] = (obj[0] + out).rpartition('\n')
+    if newline:
+      lines = ''.join(
+          '%d>%s\n' % (index, line) for line in complete.split('\n') if line)
+      if lines:
+        self._wrapped.write(lines)
 
   def flush(self):
     """Flush buffered output."""
@@ -459,9 +599,67 @@ class GClientChildren(object):
           print >> sys.stderr, '  ', zombie.pid
 
 
+class _SpillBuffer(object):
+  """Accumulates output in memory until it grows past max_memory bytes, then in
+  a temporary file.
+  """
+  def __init__(self, max_memory):
+    self._buffer = cStringIO.StringIO()
+    self._size = 0
+    self._max_memory = max_memory
+    self._spilled = False
+
+  def write(self, data):
+    self._buffer.write(data)
+    self._size += len(data)
+    if not self._spilled and self._size > self._max_memory:
+      spill = tempfile.TemporaryFile(prefix='gclient_output')
+      spill.write(self._buffer.getvalue())
+      self._buffer = spill
+      self._spilled = True
+
+  def getvalue(self):
+    if not self._spilled:
+      return self._buffer.getvalue()
+    self._buffer.seek(0)
+    return self._buffer.read()
+
+  def close(self):
+    self._buffer.close()
+
+
+_LINE_BREAK_RE = re.compile(r'[\r\n]')
+
+
+def _ReadChunks(pipe, size):
+  """Yields the data written to pipe, in pieces of at most size bytes, until it
+  is closed.
+
+  os.read() returns as soon as anything is available instead of waiting for
+  size bytes, so a prompt that isn't followed by a newline still shows up.
+  """
+  try:
+    fd = pipe.fileno()
+  except (AttributeError, IOError, ValueError):
+    # Not backed by a file descriptor, e.g. in tests.
+    read = lambda: pipe.read(size)
+  else:
+    read = lambda: os.read(fd, size)
+  while True:
+    try:
+      data = read()
+    except OSError as e:
+      if e.errno == errno.EINTR:
+        continue
+      raise
+    if not data:
+      return
+    yield data
+
+
 def CheckCallAndFilter(args, stdout=None, filter_fn=None,
                        print_stdout=None, call_filter_on_first_line=False,
-                       retry=False, **kwargs):
+                       retry=False, return_output=True, **kwargs):
   """Runs a command and calls back a filter function if needed.
 
   Accepts all subprocess2.Popen() parameters plus:
@@ -472,12 +670,14 @@ def CheckCallAndFilter(args, stdout=None, filter_fn=None,
     stdout: Can be any bufferable output.
     retry: If the process exits non-zero, sleep for a brief interval and try
            again, up to RETRY_MAX times.
+    return_output: If False, the output isn't kept and None is returned, for
+                   callers that only need the filter_fn or stdout.
 
   stderr is always redirected to stdout.
   """
   assert print_stdout or filter_fn
   stdout = stdout or sys.stdout
-  output = cStringIO.StringIO()
+  output = _SpillBuffer(OUTPUT_SPILL_SIZE) if return_output else None
   filter_fn = filter_fn or (lambda x: None)
 
   sleep_interval = RETRY_INITIAL_SLEEP
@@ -493,29 +693,35 @@ def CheckCallAndFilter(args, stdout=None, filter_fn=None,
     stdout.flush()
 
     # Also, we need to forward stdout to prevent weird re-ordering of output.
-    # This has to be done on a per byte basis to make sure it is not buffered:
-    # normally buffering is done for each line, but if svn requests input, no
-    # end-of-line character is output after the prompt and it would not show up.
+    # The output is forwarded as soon as it is read, without waiting for a
+    # full line: if svn requests input, no end-of-line character is output
+    # after the prompt and it would not show up otherwise.
     try:
-      in_byte = kid.stdout.read(1)
-      if in_byte:
-        if call_filter_on_first_line:
-          filter_fn(None)
-        in_line = ''
-        while in_byte:
-          output.write(in_byte)
-          if print_stdout:
-            stdout.write(in_byte)
-          if in_byte not in ['\r', '\n']:
-            in_line += in_byte
-          else:
-            filter_fn(in_line)
-            in_line = ''
-          in_byte = kid.stdout.read(1)
-        # Flush the rest of buffered output. This is only an issue with
-        # stdout/stderr not ending with a \n.
-        if len(in_line):
-          filter_fn(in_line)
+      first_chunk = True
+      # Pieces of the line being received; \r and \n both end a line.
+      in_line = []
+      for chunk in _ReadChunks(kid.stdout, OUTPUT_CHUNK_SIZE):
+        if first_chunk:
+          first_chunk = False
+          if call_filter_on_first_line:
+            filter_fn(None)
+        if output:
+          output.write(chunk)
+        if print_stdout:
+          stdout.write(chunk)
+        lines = _LINE_BREAK_RE.split(chunk)
+        if len(lines) > 1:
+          in_line.append(lines[0])
+          filter_fn(''.join(in_line))
+          for line in lines[1:-1]:
+            filter_fn(line)
+          in_line = []
+        if lines[-1]:
+          in_line.append(lines[-1])
+      # Flush the rest of buffered output. This is only an issue with
+      # stdout/stderr not ending with a \n.
+      if in_line:
+        filter_fn(''.join(in_line))
       rv = kid.wait()
 
       # Don't put this in a 'finally,' since the child may still run if we get
@@ -527,13 +733,19 @@ def CheckCallAndFilter(args, stdout=None, filter_fn=None,
       raise
 
     if rv == 0:
-      return output.getvalue()
+      if not output:
+        return None
+      result = output.getvalue()
+      output.close()
+      return result
     if not retry:
       break
     print ("WARNING: subprocess '%s' in %s failed; will retry after a short "
            'nap...' % (' '.join('"%s"' % x for x in args), run_cwd))
     time.sleep(sleep_interval)
     sleep_interval *= 2
+  if output:
+    output.close()
   raise subprocess2.CalledProcessError(
       rv, args, kwargs.get('cwd', None), None, None)
 
@@ -772,6 +984,71 @@ def lockedmethod(method):
   return inner
 
 
+class TaskOutput(object):
+  """Captures the output of a WorkItem.
+
+  Only the last max_size bytes are kept in memory. Once start_log() was called,
+  the whole output is also written to a file, and complete lines are forwarded
+  to live as they arrive if it is set.
+  """
+  def __init__(self, max_size=TASK_OUTPUT_SIZE):
+    self.max_size = max_size
+    self.live = None
+    self.log_path = None
+    # Number of bytes no longer kept in memory.
+    self.dropped = 0
+    self._log = None
+    self._chunks = collections.deque()
+    self._size = 0
+    # The incomplete last line not forwarded to live yet.
+    self._partial = ''
+
+  def start_log(self, path):
+    self.log_path = path
+    self._log = open(path, 'wb')
+
+  def close(self):
+    """Forwards the last incomplete line to live and closes the log."""
+    if self.live and self._partial:
+      self.live.write(self._partial + '\n')
+      self._partial = ''
+    if self._log:
+      self._log.close()
+      self._log = None
+
+  def write(self, data):
+    if isinstance(data, unicode):
+      data = data.encode('utf-8')
+    if self._log:
+      self._log.write(data)
+    self._chunks.append(data)
+    self._size += len(data)
+    while self._size > self.max_size:
+      extra = self._size - self.max_size
+      first = self._chunks[0]
+      if len(first) <= extra:
+        self._chunks.popleft()
+        extra = len(first)
+      else:
+        self._chunks[0] = first[extra:]
+      self._size -= extra
+      self.dropped += extra
+    if self.live:
+      complete, newline, self._partial = (self._partial + data).rpartition('\n')
+      if newline:
+        self.live.write(complete + '\n')
+      # Progress output without newlines mustn't accumulate forever.
+      self._partial = self._partial[-self.max_size:]
+
+  def flush(self):
+    if self._log:
+      self._log.flush()
+
+  def getvalue(self):
+    """Returns the output kept in memory."""
+    return ''.join(self._chunks)
+
+
 class WorkItem(object):
   """One work item."""
   # On cygwin, creating a lock throwing randomly when nearing ~100 locks.
@@ -782,8 +1059,8 @@ class WorkItem(object):
   def __init__(self, name):
     # A unique string representing this work item.
     self._name = name
-    self.outbuf = cStringIO.StringIO()
-    self.start = self.finish = None
+    self.outbuf = TaskOutput()
+    self.enqueued = self.start = self.finish = None
 
   def run(self, work_queue):
     """work_queue is passed as keyword argument so it should be
@@ -803,21 +1080,41 @@ class ExecutionQueue(object):
   From() keyword. This class manages that all the required dependencies are run
   before running each one.
 
+  Pending items are indexed by the requirements they still lack, so completing
+  an item only revisits the items waiting on it. Items whose requirements are
+  satisfied are started by decreasing priority; gclient uses the historical
+  critical path duration of each dependency so the longest chains start first.
+
+  The output of each item is kept in its TaskOutput. It can be written to one
+  file per item in log_dir and, when live is set, printed as it is produced
+  instead of once the item is done.
+
   Methods of this class are thread safe.
   """
-  def __init__(self, jobs, progress, ignore_requirements, verbose=False):
+  def __init__(self, jobs, progress, ignore_requirements, verbose=False,
+               priorities=None, log_dir=None, live=False):
     """jobs specifies the number of concurrent tasks to allow. progress is a
-    Progress instance."""
+    Progress instance. priorities is an optional dict mapping a WorkItem name
+    to a number; runnable items with a higher priority are started first."""
     # Set when a thread is done or a new item is enqueued.
     self.ready_cond = threading.Condition()
     # Maximum number of concurrent tasks.
     self.jobs = jobs
-    # List of WorkItem, for gclient, these are Dependency instances.
-    self.queued = []
+    # Heap of (-priority, sequence, WorkItem) whose requirements were satisfied
+    # when they were pushed. The sequence keeps FIFO order on ties.
+    self._runnable = []
+    self._sequence = itertools.count()
+    # Maps a requirement name to the WorkItem waiting on it.
+    self._blocked = {}
+    # Maps a blocked WorkItem to the number of requirements it still lacks.
+    self._missing = {}
     # List of strings representing each Dependency.name that was run.
     self.ran = []
+    self._ran_set = set()
     # List of items currently running.
     self.running = []
+    # Threads that terminated and need to be joined.
+    self._terminated = []
     # Exceptions thrown if any.
     self.exceptions = Queue.Queue()
     # Progress status
@@ -827,9 +1124,17 @@ class ExecutionQueue(object):
 
     self.ignore_requirements = ignore_requirements
     self.verbose = verbose
+    self.priorities = priorities or {}
+    self.log_dir = log_dir
+    self.live = live
     self.last_join = None
     self.last_subproc_output = None
 
+  @property
+  def queued(self):
+    """List of WorkItem enqueued but not started yet."""
+    return [i[2] for i in self._runnable] + self._missing.keys()
+
   def enqueue(self, d):
     """Enqueue one Dependency to be executed later once its requirements are
     satisfied.
@@ -837,8 +1142,10 @@ class ExecutionQueue(object):
     assert isinstance(d, WorkItem)
     self.ready_cond.acquire()
     try:
-      self.queued.append(d)
-      total = len(self.queued) + len(self.ran) + len(self.running)
+      d.enqueued = datetime.datetime.now()
+      self._schedule(d)
+      total = (len(self._runnable) + len(self._missing) + len(self.ran) +
+               len(self.running))
       if self.jobs == 1:
         total += 1
       logging.debug('enqueued(%s)' % d.name)
@@ -849,6 +1156,56 @@ class ExecutionQueue(object):
     finally:
       self.ready_cond.release()
 
+  def _schedule(self, d):
+    """Files d either as runnable or under each requirement it still lacks."""
+    missing = None
+    if not self.ignore_requirements:
+      missing = set(d.requirements) - self._ran_set
+    if missing:
+      self._missing[d] = len(missing)
+      for name in missing:
+        self._blocked.setdefault(name, []).append(d)
+    else:
+      heapq.heappush(
+          self._runnable,
+          (-self.priorities.get(d.name, 0), next(self._sequence), d))
+
+  def _pop_runnable(self):
+    """Returns the highest priority runnable WorkItem or None.
+
+    Requirements are calculated again since they can grow while the tree is
+    being processed.
+    """
+    while self._runnable:
+      d = heapq.heappop(self._runnable)[2]
+      if (self.ignore_requirements or
+          not (set(d.requirements) - self._ran_set)):
+        return d
+      self._schedule(d)
+    return None
+
+  def _mark_ran(self, name):
+    """Records that name completed and releases the items waiting on it."""
+    if name in self._ran_set:
+      raise Error(
+          'gclient is confused, "%s" is already in "%s"' % (
+            name, ', '.join(self.ran)))
+    self.ran.append(name)
+    self._ran_set.add(name)
+    for d in self._blocked.pop(name, []):
+      if d not in self._missing:
+        # The queue was flushed.
+        continue
+      self._missing[d] -= 1
+      if not self._missing[d]:
+        del self._missing[d]
+        self._schedule(d)
+
+  def _clear_queue(self):
+    self._runnable = []
+    self._blocked = {}
+    self._missing = {}
+
   def out_cb(self, _):
     self.last_subproc_output = datetime.datetime.now()
     return True
@@ -862,12 +1219,30 @@ class ExecutionQueue(object):
           str(task.finish - task.start).partition('.')[0])
     else:
       elapsed = ''
+    output = task.outbuf.getvalue().strip()
+    if task.outbuf.dropped:
+      output = '[... %d bytes skipped ...]\n%s' % (task.outbuf.dropped, output)
+    if task.outbuf.log_path:
+      output += '\nFull log: %s' % task.outbuf.log_path
     return """
 %s%s%s
 ----------------------------------------
 %s
 ----------------------------------------""" % (
-    task.name, comment, elapsed, task.outbuf.getvalue().strip())
+    task.name, comment, elapsed, output)
+
+  def _start_output(self, task_item):
+    """Sets up the log file and the live view of task_item's output."""
+    if self.live:
+      task_item.outbuf.live = sys.stdout
+    if self.log_dir:
+      if not os.path.isdir(self.log_dir):
+        os.makedirs(self.log_dir)
+      name = task_item.name or 'unnamed'
+      # The hash keeps names like src/a_b/c and src/a/b_c apart.
+      log_name = '%s.%s.log' % (
+          re.sub(r'[^\w.-]', '_', name), hashlib.sha1(name).hexdigest()[:8])
+      task_item.outbuf.start_log(os.path.join(self.log_dir, log_name))
 
   def flush(self, *args, **kwargs):
     """Runs all enqueued items until all are executed."""
@@ -880,29 +1255,28 @@ class ExecutionQueue(object):
         while True:
           if not self.exceptions.empty():
             # Systematically flush the queue when an exception logged.
-            self.queued = []
+            self._clear_queue()
           self._flush_terminated_threads()
-          if (not self.queued and not self.running or
-              self.jobs == len(self.running)):
-            logging.debug('No more worker threads or can\'t queue anything.')
+          if self.jobs == len(self.running):
             break
-
-          # Check for new tasks to start.
-          for i in xrange(len(self.queued)):
-            # Verify its requirements.
-            if (self.ignore_requirements or
-                not (set(self.queued[i].requirements) - set(self.ran))):
-              # Start one work item: all its requirements are satisfied.
-              self._run_one_task(self.queued.pop(i), args, kwargs)
-              break
-          else:
-            # Couldn't find an item that could run. Break out the outher loop.
+          task_item = self._pop_runnable()
+          if task_item is None:
+            logging.debug('No more worker threads or can\'t queue anything.')
             break
+          # Start one work item: all its requirements are satisfied.
+          self._run_one_task(task_item, args, kwargs)
 
-        if not self.queued and not self.running:
+        if not self._missing and not self.running:
           # We're done.
           break
-        # We need to poll here otherwise Ctrl-C isn't processed.
+        if not self.running:
+          raise Error(
+              'gclient is confused, no dependency can be processed: %s' %
+              ', '.join(
+                  '%s requires %s' % (i.name, ', '.join(i.requirements))
+                  for i in self._missing))
+        # Workers notify ready_cond when they complete; the timeout is only
+        # there otherwise Ctrl-C isn't processed.
         try:
           self.ready_cond.wait(10)
           # If we haven't printed to terminal for a while, but we have received
@@ -921,14 +1295,15 @@ class ExecutionQueue(object):
               sys.stdout.flush()
         except KeyboardInterrupt:
           # Help debugging by printing some information:
+          queued = self.queued
           print >> sys.stderr, (
               ('\nAllowed parallel jobs: %d\n# queued: %d\nRan: %s\n'
                 'Running: %d') % (
               self.jobs,
-              len(self.queued),
+              len(queued),
               ', '.join(self.ran),
               len(self.running)))
-          for i in self.queued:
+          for i in queued:
             print >> sys.stderr, '%s (not started): %s' % (
                 i.name, ', '.join(i.requirements))
           for i in self.running:
@@ -952,27 +1327,21 @@ class ExecutionQueue(object):
 
   def _flush_terminated_threads(self):
     """Flush threads that have terminated."""
-    running = self.running
-    self.running = []
-    for t in running:
-      if t.isAlive():
-        self.running.append(t)
-      else:
-        t.join()
-        self.last_join = datetime.datetime.now()
-        sys.stdout.flush()
-        if self.verbose:
-          print >> sys.stdout, self.format_task_output(t.item)
-        if self.progress:
-          self.progress.update(1, t.item.name)
-        if t.item.name in self.ran:
-          raise Error(
-              'gclient is confused, "%s" is already in "%s"' % (
-                t.item.name, ', '.join(self.ran)))
-        if not t.item.name in self.ran:
-          self.ran.append(t.item.name)
+    terminated = self._terminated
+    self._terminated = []
+    for t in terminated:
+      self.running.remove(t)
+      t.join()
+      self.last_join = datetime.datetime.now()
+      sys.stdout.flush()
+      if self.verbose and not self.live:
+        print >> sys.stdout, self.format_task_output(t.item)
+      if self.progress:
+        self.progress.update(1, t.item.name)
+      self._mark_ran(t.item.name)
 
   def _run_one_task(self, task_item, args, kwargs):
+    self._start_output(task_item)
     if self.jobs > 1:
       # Start the thread.
       index = len(self.ran) + len(self.running) + 1
@@ -988,17 +1357,20 @@ class ExecutionQueue(object):
         task_item.run(*args, **kwargs)
         task_item.finish = datetime.datetime.now()
         print >> task_item.outbuf, '[%s] Finished.' % Elapsed(task_item.finish)
-        self.ran.append(task_item.name)
-        if self.verbose:
+        task_item.outbuf.close()
+        self._mark_ran(task_item.name)
+        if self.verbose and not self.live:
           if self.progress:
             print >> sys.stdout, ''
           print >> sys.stdout, self.format_task_output(task_item)
         if self.progress:
           self.progress.update(1, ', '.join(t.item.name for t in self.running))
       except KeyboardInterrupt:
+        task_item.outbuf.close()
         print >> sys.stderr, self.format_task_output(task_item, 'interrupted')
         raise
       except Exception:
+        task_item.outbuf.close()
         print >> sys.stderr, self.format_task_output(task_item, 'ERROR')
         raise
 
@@ -1035,9 +1407,12 @@ class ExecutionQueue(object):
         logging.info(str(sys.exc_info()))
         work_queue.exceptions.put((sys.exc_info(), self))
       finally:
+        self.item.outbuf.close()
         logging.info('_Worker.run(%s) done', self.item.name)
         work_queue.ready_cond.acquire()
         try:
+          # pylint: disable=W0212
+          work_queue._terminated.append(self)
           work_queue.ready_cond.notifyAll()
         finally:
           work_queue.ready_cond.release()
@@ -7,7 +7,10 @@
 
 from __future__ import print_function
 import errno
+import fnmatch
+import hashlib
 import logging
+import multiprocessing.pool
 import optparse
 import os
 import re
@@ -19,6 +22,7 @@ import sys
 import urlparse
 import zipfile
 
+from download_from_google_storage import get_sha1
 from download_from_google_storage import Gsutil
 import gclient_utils
 import subcommand
@@ -28,6 +32,10 @@ GC_AUTOPACKLIMIT = 50
 
 GIT_CACHE_CORRUPT_MESSAGE = 'WARNING: The Git cache is corrupt.'
 
+# Written in the mirror after a successful fetch; digest of the remote refs
+# that were fetched, see Mirror._remote_refs_digest().
+REFS_DIGEST_FILE = 'refs_digest'
+
 try:
   # pylint: disable=E0602
   WinErr = WindowsError
@@ -225,6 +233,7 @@ class Mirror(object):
     cwd = kwargs.setdefault('cwd', self.mirror_path)
     kwargs.setdefault('print_stdout', False)
     kwargs.setdefault('filter_fn', self.print)
+    kwargs.setdefault('return_output', False)
     env = kwargs.get('env') or kwargs.setdefault('env', os.environ.copy())
     env.setdefault('GIT_ASKPASS', 'true')
     env.setdefault('SSH_ASKPASS', 'true')
@@ -274,13 +283,20 @@ class Mirror(object):
 
     gs_folder = 'gs://%s/%s' % (self.bootstrap_bucket, self.basedir)
     gsutil = Gsutil(self.gsutil_exe, boto_path=None)
-    # Get the most recent version of the zipfile.
+    # Get the most recent version of the bootstrap, a bundle is preferred over
+    # a zipfile of the same generation.
     _, ls_out, _ = gsutil.check_call('ls', gs_folder)
-    ls_out_sorted = sorted(ls_out.splitlines())
+    ls_out_sorted = sorted(
+        (l for l in ls_out.splitlines() if l.endswith(('.zip', '.bundle'))),
+        key=lambda l: (l.rsplit('.', 1)[0], l.endswith('.bundle')))
     if not ls_out_sorted:
       # This repo is not on Google Storage.
       return False
     latest_checkout = ls_out_sorted[-1]
+    if latest_checkout.endswith('.bundle'):
+      return self._bootstrap_from_bundle(
+          gsutil, latest_checkout, directory,
+          latest_checkout + '.sha1' in ls_out.splitlines())
 
     # Download zip file to a temporary directory.
     try:
@@ -319,9 +335,118 @@ class Mirror(object):
       return False
     return True
 
+  def _bootstrap_from_bundle(self, gsutil, bundle, directory, has_sha1):
+    """Streams the git bundle at the gs:// url bundle into directory.
+
+    Nothing is written to disk besides the pack and its index, which are
+    built while the bundle is downloaded.
+    """
+    expected_sha1 = None
+    if has_sha1:
+      code, out, _ = gsutil.check_call('cat', bundle + '.sha1')
+      if code:
+        return False
+      expected_sha1 = out.strip()
+    self.print('Downloading and indexing %s' % bundle)
+    proc = gsutil.stream('cat', bundle)
+    success = False
+    try:
+      success = self.unbundle(proc.stdout, directory, expected_sha1)
+    finally:
+      if not success and proc.poll() is None:
+        proc.kill()
+      success = proc.wait() == 0 and success
+    if not success:
+      self.print(
+          'Extracting bootstrap bundle %s failed.\n'
+          'Resuming normal operations.' % bundle)
+      for name in os.listdir(directory):
+        gclient_utils.rm_file_or_tree(os.path.join(directory, name))
+    return success
+
+  def unbundle(self, stream, directory, expected_sha1=None):
+    """Reads a git bundle from the file object stream into a new bare
+    repository in directory.
+
+    The pack is fed to 'git index-pack' as it is read and the sha1 of the
+    whole bundle is checked against expected_sha1 if given.
+
+    Returns True on success.
+    """
+    sha1 = hashlib.sha1()
+    def readline():
+      line = stream.readline()
+      sha1.update(line)
+      return line
+
+    if readline().rstrip('\n') not in ('# v2 git bundle', '# v3 git bundle'):
+      self.print('Not a git bundle.')
+      return False
+    refs = []
+    while True:
+      line = readline()
+      if not line:
+        self.print('Truncated git bundle.')
+        return False
+      line = line.rstrip('\n')
+      if not line:
+        break
+      if line.startswith('@'):
+        # v3 capabilities.
+        continue
+      if line.startswith('-'):
+        self.print('Bundles with prerequisites are not supported.')
+        return False
+      refs.append(line.split(' ', 1))
+
+    self.RunGit(['init', '--bare'], cwd=directory)
+    with open(os.devnull, 'w') as devnull:
+      index_pack = subprocess.Popen(
+          [self.git_exe, 'index-pack', '--stdin'], cwd=directory,
+          stdin=subprocess.PIPE, stdout=devnull)
+      try:
+        while True:
+          chunk = stream.read(1024 * 1024)
+          if not chunk:
+            break
+          sha1.update(chunk)
+          index_pack.stdin.write(chunk)
+      finally:
+        index_pack.stdin.close()
+        retcode = index_pack.wait()
+    if retcode:
+      return False
+    if expected_sha1 and sha1.hexdigest() != expected_sha1:
+      self.print('Bundle checksum mismatch: expected %s, got %s.' % (
+          expected_sha1, sha1.hexdigest()))
+      return False
+    with open(os.path.join(directory, 'packed-refs'), 'w') as f:
+      for sha, ref in refs:
+        if ref.startswith('refs/'):
+          f.write('%s %s\n' % (sha, ref))
+    return True
+
   def exists(self):
     return os.path.isfile(os.path.join(self.mirror_path, 'config'))
 
+  def last_updated(self):
+    """Returns the time of the last successful fetch into the mirror, or 0."""
+    times = [0]
+    for name in (REFS_DIGEST_FILE, 'FETCH_HEAD'):
+      try:
+        times.append(os.path.getmtime(os.path.join(self.mirror_path, name)))
+      except OSError:
+        pass
+    return max(times)
+
+  def pack_size(self):
+    """Returns the size in bytes of the pack files of the mirror."""
+    pack_dir = os.path.join(self.mirror_path, 'objects', 'pack')
+    if not os.path.isdir(pack_dir):
+      return 0
+    return sum(os.path.getsize(os.path.join(pack_dir, f))
+               for f in os.listdir(pack_dir) if f.endswith('.pack'))
+
   def _preserve_fetchspec(self):
     """Read and preserve remote.origin.fetch from an existing mirror.
 
@@ -361,7 +486,9 @@ class Mirror(object):
       bootstrapped = not depth and bootstrap and self.bootstrap_repo(tempdir)
       if bootstrapped:
         # Bootstrap succeeded; delete previous cache, if any.
-        gclient_utils.rmtree(self.mirror_path)
+        gclient_utils.rmtree_in_background(
+            self.mirror_path, os.path.dirname(self.mirror_path),
+            prefix='_cache_tmp_trash')
       elif not self.exists():
         # Bootstrap failed, no previous cache; start with a bare git dir.
         self.RunGit(['init', '--bare'], cwd=tempdir)
@@ -379,7 +506,29 @@ class Mirror(object):
             'Shallow fetch requested, but repo cache already exists.')
     return tempdir
 
-  def _fetch(self, rundir, verbose, depth):
+  def _remote_refs_digest(self, rundir, fetch_specs, depth):
+    """Returns a digest of the remote refs matched by fetch_specs, or None if
+    they can't be listed.
+
+    Deleted refs change the digest as much as updated ones.
+    """
+    lines = []
+    try:
+      self.RunGit(['ls-remote', 'origin'], cwd=rundir, retry=True,
+                  filter_fn=lines.append)
+    except subprocess.CalledProcessError:
+      return None
+    patterns = [spec.lstrip('+').split(':', 1)[0] for spec in fetch_specs]
+    refs = sorted(set(
+        line for line in lines
+        if len(line.split()) == 2 and
+        any(fnmatch.fnmatchcase(line.split()[1], p) for p in patterns)))
+    digest = hashlib.sha1()
+    for line in [str(depth)] + sorted(fetch_specs) + refs:
+      digest.update(line + '\n')
+    return digest.hexdigest()
+
+  def _fetch(self, rundir, verbose, depth, incremental=False):
     self.config(rundir)
     v = []
     d = []
@@ -391,17 +540,54 @@ class Mirror(object):
     fetch_specs = subprocess.check_output(
         [self.git_exe, 'config', '--get-all', 'remote.origin.fetch'],
         cwd=rundir).strip().splitlines()
-    for spec in fetch_specs:
-      try:
-        self.print('Fetching %s' % spec)
-        self.RunGit(fetch_cmd + [spec], cwd=rundir, retry=True)
-      except subprocess.CalledProcessError:
-        if spec == '+refs/heads/*:refs/heads/*':
-          raise RefsHeadsFailedToFetch
-        logging.warn('Fetch of %s failed' % spec)
+
+    digest_file = os.path.join(rundir, REFS_DIGEST_FILE)
+    digest = None
+    if incremental:
+      digest = self._remote_refs_digest(rundir, fetch_specs, depth)
+      if digest and os.path.isfile(digest_file):
+        with open(digest_file) as f:
+          unchanged = f.read().strip() == digest
+        if unchanged:
+          self.print('Remote refs of %s are unchanged, not fetching.' %
+                     self.url)
+          # Still counts as an update for last_updated().
+          os.utime(digest_file, None)
+          return
+    if os.path.isfile(digest_file):
+      os.remove(digest_file)
+
+    # Fetch everything in one negotiation first; only fall back to one fetch
+    # per spec to find out which one is failing.
+    try:
+      self.print('Fetching %s' % ' '.join(fetch_specs))
+      self.RunGit(fetch_cmd + fetch_specs, cwd=rundir, retry=True)
+    except subprocess.CalledProcessError:
+      logging.warn('Fetch of all refs failed, fetching them one by one.')
+      failed = False
+      for spec in fetch_specs:
+        try:
+          self.print('Fetching %s' % spec)
+          self.RunGit(fetch_cmd + [spec], cwd=rundir, retry=True)
+        except subprocess.CalledProcessError:
+          if spec == '+refs/heads/*:refs/heads/*':
+            raise RefsHeadsFailedToFetch
+          logging.warn('Fetch of %s failed' % spec)
+          failed = True
+      if failed:
+        return
+
+    if digest:
+      with open(digest_file, 'w') as f:
+        f.write(digest)
 
   def populate(self, depth=None, shallow=False, bootstrap=False,
-               verbose=False, ignore_lock=False):
+               verbose=False, ignore_lock=False, incremental=False):
+    """Adds or updates the mirror of self.url in the cache.
+
+    If incremental is set, an existing mirror isn't fetched when 'git
+    ls-remote' shows none of the refs changed since the last populate.
+    """
     assert self.GetCachePath()
     if shallow and not depth:
       depth = 10000
@@ -415,7 +601,7 @@ class Mirror(object):
     try:
       tempdir = self._ensure_bootstrapped(depth, bootstrap)
       rundir = tempdir or self.mirror_path
-      self._fetch(rundir, verbose, depth)
+      self._fetch(rundir, verbose, depth, incremental)
     except RefsHeadsFailedToFetch:
       # This is a major failure, we need to clean and force a bootstrap.
       gclient_utils.rmtree(rundir)
@@ -426,8 +612,9 @@ class Mirror(object):
     finally:
       if tempdir:
         try:
-          if os.path.exists(self.mirror_path):
-            gclient_utils.rmtree(self.mirror_path)
+          gclient_utils.rmtree_in_background(
+              self.mirror_path, os.path.dirname(self.mirror_path),
+              prefix='_cache_tmp_trash')
           os.rename(tempdir, self.mirror_path)
         except OSError as e:
           # This is somehow racy on Windows.
@@ -438,27 +625,43 @@ class Mirror(object):
       if not ignore_lock:
         lockfile.unlock()
 
-  def update_bootstrap(self, prune=False):
-    # The files are named <git number>.zip
+  def update_bootstrap(self, prune=False, bundle=False):
+    """Uploads the mirror as a bootstrap.
+
+    The bootstrap is a zipfile of the whole mirror, or with bundle, a git
+    bundle of all its refs which can be indexed while it is downloaded.
+    """
+    # The files are named <git number>.zip or <git number>.bundle
     gen_number = subprocess.check_output(
         [self.git_exe, 'number', 'master'], cwd=self.mirror_path).strip()
     # Run Garbage Collect to compress packfile.
     self.RunGit(['gc', '--prune=all'])
-    # Creating a temp file and then deleting it ensures we can use this name.
-    _, tmp_zipfile = tempfile.mkstemp(suffix='.zip')
-    os.remove(tmp_zipfile)
-    subprocess.call(['zip', '-r', tmp_zipfile, '.'], cwd=self.mirror_path)
     gsutil = Gsutil(path=self.gsutil_exe, boto_path=None)
     gs_folder = 'gs://%s/%s' % (self.bootstrap_bucket, self.basedir)
-    dest_name = '%s/%s.zip' % (gs_folder, gen_number)
-    gsutil.call('cp', tmp_zipfile, dest_name)
-    os.remove(tmp_zipfile)
+    # Creating a temp file and then deleting it ensures we can use this name.
+    _, tmp_file = tempfile.mkstemp(suffix='.bundle' if bundle else '.zip')
+    os.remove(tmp_file)
+    if bundle:
+      dest_names = ['%s/%s.bundle' % (gs_folder, gen_number)]
+      dest_names.append(dest_names[0] + '.sha1')
+      self.RunGit(['bundle', 'create', tmp_file, '--all'])
+      gclient_utils.FileWrite(tmp_file + '.sha1', get_sha1(tmp_file))
+      # Upload the checksum first so that it is there as soon as the bundle
+      # can be listed.
+      gsutil.call('cp', tmp_file + '.sha1', dest_names[1])
+      gsutil.call('cp', tmp_file, dest_names[0])
+      os.remove(tmp_file + '.sha1')
+    else:
+      dest_names = ['%s/%s.zip' % (gs_folder, gen_number)]
+      subprocess.call(['zip', '-r', tmp_file, '.'], cwd=self.mirror_path)
+      gsutil.call('cp', tmp_file, dest_names[0])
+    os.remove(tmp_file)
 
     # Remove all other files in the same directory.
     if prune:
       _, ls_out, _ = gsutil.check_call('ls', gs_folder)
       for filename in ls_out.splitlines():
-        if filename == dest_name:
+        if filename in dest_names:
           continue
         gsutil.call('rm', filename)
 
@@ -495,6 +698,28 @@ class Mirror(object):
   def unlock(self):
     return self.BreakLocks(self.mirror_path)
 
+  @classmethod
+  def ListAll(cls):
+    """Returns a Mirror for each repository in the cache."""
+    cachepath = cls.GetCachePath()
+    mirrors = []
+    for dirent in sorted(os.listdir(cachepath)):
+      path = os.path.join(cachepath, dirent)
+      if (dirent.startswith('_cache_tmp') or dirent.startswith('tmp') or
+          not os.path.isfile(os.path.join(path, 'config'))):
+        continue
+      # The directory name loses the url scheme, prefer the configured url.
+      try:
+        url = subprocess.check_output(
+            [cls.git_exe, 'config', 'remote.origin.url'], cwd=path).strip()
+      except subprocess.CalledProcessError:
+        url = None
+      if url and os.path.join(cachepath, cls.UrlToCacheDir(url)) == path:
+        mirrors.append(cls(url))
+      else:
+        mirrors.append(cls.FromPath(path))
+    return mirrors
+
   @classmethod
   def UnlockAll(cls):
     cachepath = cls.GetCachePath()
@@ -541,6 +766,9 @@ def CMDupdate_bootstrap(parser, args):
 
   parser.add_option('--prune', action='store_true',
                     help='Prune all other cached zipballs of the same repo.')
+  parser.add_option('--bundle', action='store_true',
+                    help='Upload a git bundle instead of a zipball. Bundles '
+                         'are indexed while they are downloaded.')
 
   # First, we need to ensure the cache is populated.
   populate_args = args[:]
@@ -551,13 +779,61 @@ def CMDupdate_bootstrap(parser, args):
   options, args = parser.parse_args(args)
   url = args[0]
   mirror = Mirror(url)
-  mirror.update_bootstrap(options.prune)
+  mirror.update_bootstrap(options.prune, options.bundle)
   return 0
 
 
-@subcommand.usage('[url of repo to add to or update in cache]')
+def populate_mirrors(mirrors, jobs, **kwargs):
+  """Populates mirrors in parallel, the least recently updated ones first.
+
+  The output of each mirror is buffered and only printed if it fails.
+
+  Returns the number of mirrors that failed.
+  """
+  mirrors = sorted(mirrors, key=lambda m: m.last_updated())
+
+  def populate(mirror):
+    output = []
+    mirror.print = mirror.print_without_file
+    mirror.print_func = output.append
+    size = mirror.pack_size()
+    start = time.time()
+    try:
+      mirror.populate(**kwargs)
+      error = None
+    except Exception as e:
+      # One failing mirror mustn't stop the others from being updated.
+      error = e
+    return (mirror, output, mirror.pack_size() - size,
+            time.time() - start, error)
+
+  failures = 0
+  pool = multiprocessing.pool.ThreadPool(max(1, min(jobs, len(mirrors))))
+  try:
+    for mirror, output, fetched, elapsed, error in pool.imap_unordered(
+        populate, mirrors):
+      if error:
+        failures += 1
+        print('%s: FAILED after %.1fs: %s' % (mirror.url, elapsed, error))
+        for line in output:
+          print('  %s' % line)
+      else:
+        print('%s: fetched %.1f MiB in %.1fs' % (
+            mirror.url, fetched / 1024. / 1024., elapsed))
+    pool.close()
+  except:
+    pool.terminate()
+    raise
+  finally:
+    pool.join()
+  if len(mirrors) > 1:
+    print('Updated %d mirrors, %d failed.' % (len(mirrors), failures))
+  return failures
+
+
+@subcommand.usage('[url of repo to add to or update in cache, or --all]')
 def CMDpopulate(parser, args):
-  """Ensure that the cache has all up-to-date objects for the given repo."""
+  """Ensure that the cache has all up-to-date objects for the given repos."""
   parser.add_option('--depth', type='int',
                     help='Only cache DEPTH commits of history')
   parser.add_option('--shallow', '-s', action='store_true',
@@ -570,22 +846,51 @@ def CMDpopulate(parser, args):
   parser.add_option('--ignore_locks', '--ignore-locks',
                     action='store_true',
                     help='Don\'t try to lock repository')
+  parser.add_option('--incremental', action='store_true',
+                    help='List the remote refs first and don\'t fetch if they '
+                         'look unchanged since the last populate')
+  parser.add_option('--all', '-a', action='store_true',
+                    help='Update all the repositories already in the cache')
+  parser.add_option('--url-file', '--url_file',
+                    help='Also add or update the repo urls listed in this '
+                         'file, one per line, or - for stdin')
+  parser.add_option('--jobs', '-j', type='int', default=8,
+                    help='Number of repositories to update in parallel when '
+                         'there are several, default: %default')
 
   options, args = parser.parse_args(args)
-  if not len(args) == 1:
-    parser.error('git cache populate only takes exactly one repo url.')
-  url = args[0]
+  urls = list(args)
+  if options.url_file:
+    if options.url_file == '-':
+      lines = sys.stdin.readlines()
+    else:
+      with open(options.url_file) as f:
+        lines = f.readlines()
+    urls.extend(l.strip() for l in lines
+                if l.strip() and not l.strip().startswith('#'))
+  if not options.all and not options.url_file and len(urls) != 1:
+    parser.error('git cache populate only takes exactly one repo url, '
+                 '--all or --url-file.')
 
-  mirror = Mirror(url, refs=options.ref)
   kwargs = {
       'verbose': options.verbose,
       'shallow': options.shallow,
       'bootstrap': not options.no_bootstrap,
       'ignore_lock': options.ignore_locks,
+      'incremental': options.incremental,
   }
   if options.depth:
     kwargs['depth'] = options.depth
-  mirror.populate(**kwargs)
+  if len(urls) == 1 and not options.all:
+    Mirror(urls[0], refs=options.ref).populate(**kwargs)
+    return 0
+
+  mirrors = dict((m.mirror_path, m) for m in (
+      Mirror(url, refs=options.ref) for url in urls))
+  if options.all:
+    for mirror in Mirror.ListAll():
+      mirrors.setdefault(mirror.mirror_path, mirror)
+  return 1 if populate_mirrors(mirrors.values(), options.jobs, **kwargs) else 0
 
 
 @subcommand.usage('Fetch new commits into cache and current checkout')
@@ -627,16 +932,23 @@ def CMDfetch(parser, args):
     mirror = Mirror.FromPath(git_dir)
     mirror.populate(bootstrap=not options.no_bootstrap)
     return 0
+  # Update all the mirrors behind the remotes at once before fetching them.
+  mirrors = {}
   for remote in remotes:
     remote_url = subprocess.check_output(
         [Mirror.git_exe, 'config', 'remote.%s.url' % remote]).strip()
     if remote_url.startswith(cachepath):
       mirror = Mirror.FromPath(remote_url)
-      mirror.print = lambda *args: None
-      print('Updating git cache...')
-      mirror.populate(bootstrap=not options.no_bootstrap)
+      mirrors[mirror.mirror_path] = mirror
+  failures = 0
+  if mirrors:
+    print('Updating git cache...')
+    failures = populate_mirrors(mirrors.values(), len(mirrors),
+                                bootstrap=not options.no_bootstrap)
+  # The remotes are still fetched from the mirrors that failed to update.
+  for remote in remotes:
     subprocess.check_call([Mirror.git_exe, 'fetch', remote])
-  return 0
+  return 1 if failures else 0
 
 
 @subcommand.usage('[url of repo to unlock, or -a|--all]')
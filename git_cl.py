@@ -23,6 +23,7 @@ import stat
 import sys
 import tempfile
 import textwrap
+import threading
 import time
 import traceback
 import urllib2
@@ -77,6 +78,9 @@ Fore = colorama.Fore
 
 # Initialized in main()
 settings = None
+# GitConfigSnapshot answering GetConfig() once EnableConfigSnapshot() was
+# called.
+config_snapshot = None
 
 
 def DieWithError(message):
@@ -422,6 +426,147 @@ class BuildbucketResponseException(Exception):
   pass
 
 
+class GitConfigSnapshot(object):
+  """In-memory copy of the git configuration seen from the current directory.
+
+  The whole configuration is read with a single "git config --list -z" and
+  read again only when one of the configuration files changed. Files pulled in
+  with include.path aren't watched. Writes go through "git config" and are
+  applied to the copy so they don't cause a reload.
+
+  Methods of this class are thread safe.
+  """
+  def __init__(self):
+    self._lock = threading.Lock()
+    # Maps a normalized key to the list of its values.
+    self._values = None
+    self._files = None
+    self._stamps = None
+
+  @staticmethod
+  def _normalize(key):
+    """Lowercases the section and the variable name, which are case
+    insensitive, but not the subsection."""
+    section, _, rest = key.partition('.')
+    subsection, dot, name = rest.rpartition('.')
+    return '%s.%s%s%s' % (section.lower(), subsection, dot, name.lower())
+
+  def _config_files(self):
+    if self._files is None:
+      git_dir = RunGit(['rev-parse', '--git-dir'], error_ok=True).strip()
+      # In a worktree, the repository's configuration is in the common
+      # directory. git older than 2.5 echoes the unknown option back.
+      common_dir = RunGit(
+          ['rev-parse', '--git-common-dir'], error_ok=True).strip()
+      if not common_dir or common_dir == '--git-common-dir':
+        common_dir = git_dir
+      # The paths may be relative and presubmit scripts change the current
+      # directory.
+      git_dir = os.path.abspath(git_dir or '.git')
+      common_dir = os.path.abspath(common_dir or '.git')
+      xdg_config = os.environ.get('XDG_CONFIG_HOME') or os.path.join(
+          os.path.expanduser('~'), '.config')
+      self._files = [
+          os.path.join(common_dir, 'config'),
+          os.path.join(git_dir, 'config.worktree'),
+          os.path.join(os.path.expanduser('~'), '.gitconfig'),
+          os.path.join(xdg_config, 'git', 'config'),
+          '/etc/gitconfig',
+      ]
+    return self._files
+
+  def _current_stamps(self):
+    """Returns what identifies the current version of the configuration files.
+
+    git replaces a configuration file when it writes it, so its inode changes
+    even if its mtime doesn't.
+    """
+    stamps = []
+    for path in self._config_files():
+      try:
+        st = os.stat(path)
+        stamps.append((st.st_ino, st.st_mtime, st.st_size))
+      except OSError:
+        stamps.append(None)
+    return stamps
+
+  def _load_if_needed(self):
+    stamps = self._current_stamps()
+    if self._values is not None and stamps == self._stamps:
+      return
+    values = {}
+    output = RunGit(['config', '--list', '-z'], error_ok=True) or ''
+    for entry in output.split('\0'):
+      if not entry:
+        continue
+      key, _, value = entry.partition('\n')
+      values.setdefault(self._normalize(key), []).append(value)
+    self._values = values
+    self._stamps = stamps
+
+  def get(self, key):
+    """Returns the last value of key, like "git config key", or None."""
+    with self._lock:
+      self._load_if_needed()
+      values = self._values.get(self._normalize(key))
+      return values[-1] if values else None
+
+  def set(self, key, value):
+    RunGit(['config', key, value])
+    with self._lock:
+      if self._values is not None:
+        self._values[self._normalize(key)] = [value]
+        self._stamps = self._current_stamps()
+
+  def unset(self, key, **kwargs):
+    RunGit(['config', '--unset', key], **kwargs)
+    with self._lock:
+      if self._values is not None:
+        self._values.pop(self._normalize(key), None)
+        self._stamps = self._current_stamps()
+
+
+def EnableConfigSnapshot():
+  """Makes GetConfig() answer from a GitConfigSnapshot instead of running git
+  for each key. Meant for the commands reading the configuration of many
+  branches."""
+  global config_snapshot
+  if not config_snapshot:
+    config_snapshot = GitConfigSnapshot()
+
+
+def GetConfig(key, error_ok=False, error_message=None):
+  """Returns the stripped value of the git configuration key.
+
+  Dies with error_message if key isn't set, unless error_ok is set; the empty
+  string is returned then.
+  """
+  if not config_snapshot:
+    return RunGit(['config', key], error_ok=error_ok,
+                  error_message=error_message).strip()
+  value = config_snapshot.get(key)
+  if value is None:
+    if not error_ok:
+      DieWithError('Command "git config %s" failed.\n%s' % (
+          key, error_message or ''))
+    return ''
+  return value.strip()
+
+
+def SetConfig(key, value):
+  if config_snapshot:
+    config_snapshot.set(key, value)
+  else:
+    RunGit(['config', key, value])
+
+
+def UnsetConfig(key, **kwargs):
+  if config_snapshot:
+    config_snapshot.unset(key, **kwargs)
+  else:
+    RunGit(['config', '--unset', key], **kwargs)
+
+
 class Settings(object):
   def __init__(self):
     self.default_server = None
@@ -443,9 +588,7 @@ class Settings(object):
     if not self.updated:
       # The only value that actually changes the behavior is
       # autoupdate = "false". Everything else means "true".
-      autoupdate = RunGit(['config', 'rietveld.autoupdate'],
-                          error_ok=True
-                          ).strip().lower()
+      autoupdate = GetConfig('rietveld.autoupdate', error_ok=True).lower()
 
       cr_settings_file = FindCodereviewSettingsFile()
       if autoupdate != 'false' and cr_settings_file:
@@ -637,7 +780,7 @@ class Settings(object):
 
   def _GetConfig(self, param, **kwargs):
     self.LazyUpdateIfNeeded()
-    return RunGit(['config', param], **kwargs).strip()
+    return GetConfig(param, **kwargs)
 
 
 def ShortBranchName(branch):
@@ -722,15 +865,13 @@ class Changelist(object):
        e.g. 'origin', 'refs/heads/master'
     """
     remote = '.'
-    upstream_branch = RunGit(['config', 'branch.%s.merge' % branch],
-                             error_ok=True).strip()
+    upstream_branch = GetConfig('branch.%s.merge' % branch, error_ok=True)
     if upstream_branch:
-      remote = RunGit(['config', 'branch.%s.remote' % branch]).strip()
+      remote = GetConfig('branch.%s.remote' % branch)
     else:
-      upstream_branch = RunGit(['config', 'rietveld.upstream-branch'],
-                               error_ok=True).strip()
+      upstream_branch = GetConfig('rietveld.upstream-branch', error_ok=True)
       if upstream_branch:
-        remote = RunGit(['config', 'rietveld.upstream-remote']).strip()
+        remote = GetConfig('rietveld.upstream-remote')
       else:
         # Fall back on trying a git-svn upstream branch.
         if settings.GetIsGitSvn():
@@ -860,8 +1001,7 @@ or verify this branch is set up to track another (via the --track argument to
 
     Returns None if it is not set.
     """
-    return RunGit(['config', 'branch.%s.base-url' % self.GetBranch()],
-                  error_ok=True).strip()
+    return GetConfig('branch.%s.base-url' % self.GetBranch(), error_ok=True)
 
   def GetGitSvnRemoteUrl(self):
     """Return the configured git-svn remote URL parsed from git svn info.
@@ -882,7 +1022,7 @@ or verify this branch is set up to track another (via the --track argument to
     Returns None if there is no remote.
     """
     remote, _ = self.GetRemoteBranch()
-    url = RunGit(['config', 'remote.%s.url' % remote], error_ok=True).strip()
+    url = GetConfig('remote.%s.url' % remote, error_ok=True)
 
     # If URL is pointing to a local directory, it is probably a git cache.
     if os.path.isdir(url):
@@ -894,7 +1034,7 @@ or verify this branch is set up to track another (via the --track argument to
   def GetIssue(self):
     """Returns the issue number as a int or None if not set."""
     if self.issue is None and not self.lookedup_issue:
-      issue = RunGit(['config', self._IssueSetting()], error_ok=True).strip()
+      issue = GetConfig(self._IssueSetting(), error_ok=True)
       self.issue = int(issue) or None if issue else None
       self.lookedup_issue = True
     return self.issue
@@ -906,8 +1046,8 @@ or verify this branch is set up to track another (via the --track argument to
       if self.GetIssue():
         rietveld_server_config = self._RietveldServer()
         if rietveld_server_config:
-          self.rietveld_server = gclient_utils.UpgradeToHttps(RunGit(
-              ['config', rietveld_server_config], error_ok=True).strip())
+          self.rietveld_server = gclient_utils.UpgradeToHttps(GetConfig(
+              rietveld_server_config, error_ok=True))
       if not self.rietveld_server:
         self.rietveld_server = settings.GetDefaultServerUrl()
     return self.rietveld_server
@@ -954,8 +1094,7 @@ or verify this branch is set up to track another (via the --track argument to
   def GetPatchset(self):
     """Returns the patchset number as a int or None if not set."""
     if self.patchset is None and not self.lookedup_patchset:
-      patchset = RunGit(['config', self._PatchsetSetting()],
-                        error_ok=True).strip()
+      patchset = GetConfig(self._PatchsetSetting(), error_ok=True)
       self.patchset = int(patchset) or None if patchset else None
       self.lookedup_patchset = True
     return self.patchset
@@ -963,11 +1102,11 @@ or verify this branch is set up to track another (via the --track argument to
   def SetPatchset(self, patchset):
     """Set this branch's patchset.  If patchset=0, clears the patchset."""
     if patchset:
-      RunGit(['config', self._PatchsetSetting(), str(patchset)])
+      SetConfig(self._PatchsetSetting(), str(patchset))
       self.patchset = patchset
     else:
-      RunGit(['config', '--unset', self._PatchsetSetting()],
-             stderr=subprocess2.PIPE, error_ok=True)
+      UnsetConfig(self._PatchsetSetting(), stderr=subprocess2.PIPE,
+                  error_ok=True)
       self.patchset = None
 
   def GetMostRecentPatchset(self):
@@ -996,13 +1135,13 @@ or verify this branch is set up to track another (via the --track argument to
     """Set this branch's issue.  If issue=0, clears the issue."""
     if issue:
       self.issue = issue
-      RunGit(['config', self._IssueSetting(), str(issue)])
+      SetConfig(self._IssueSetting(), str(issue))
       if self.rietveld_server:
-        RunGit(['config', self._RietveldServer(), self.rietveld_server])
+        SetConfig(self._RietveldServer(), self.rietveld_server)
     else:
       current_issue = self.GetIssue()
       if current_issue:
-        RunGit(['config', '--unset', self._IssueSetting()])
+        UnsetConfig(self._IssueSetting())
       self.issue = None
       self.SetPatchset(None)
 
@@ -1099,14 +1238,16 @@ or verify this branch is set up to track another (via the --track argument to
       return 'reply'
     return 'waiting'
 
-  def RunHook(self, committing, may_prompt, verbose, change):
+  def RunHook(self, committing, may_prompt, verbose, change, parallel=False,
+              defer_commands=False):
     """Calls sys.exit() if the hook fails; returns a HookResults otherwise."""
 
     try:
       return presubmit_support.DoPresubmitChecks(change, committing,
           verbose=verbose, output_stream=sys.stdout, input_stream=sys.stdin,
           default_presubmit=None, may_prompt=may_prompt,
-          rietveld_obj=self.RpcServer())
+          rietveld_obj=self.RpcServer(), parallel=parallel,
+          defer_commands=defer_commands)
     except presubmit_support.PresubmitFailure, e:
       DieWithError(
           ('%s\nMaybe your depot_tools is out of date?\n'
@@ -1256,7 +1397,8 @@ class ChangeDescription(object):
         reviewers.append(name)
     if add_owners_tbr:
       owners_db = owners.Database(change.RepositoryRoot(),
-        fopen=file, os_path=os.path, glob=glob.glob)
+        fopen=file, os_path=os.path, glob=glob.glob,
+        index=owners.OwnersIndex(change.RepositoryRoot()))
       all_reviewers = set(tbr_names + reviewers)
       missing_files = owners_db.files_not_covered_by(change.LocalPaths(),
                                                      all_reviewers)
@@ -1525,6 +1667,8 @@ def get_cl_statuses(
   """
   # Silence upload.py otherwise it becomes unwieldly.
   upload.verbosity = 0
+  # Each branch reads several keys.
+  EnableConfigSnapshot()
 
   if fine_grained:
     # Process one branch synchronously to work through authentication, then
@@ -1695,6 +1839,7 @@ def CMDstatus(parser, args):
   if not branches:
     print('No local branch found.')
     return 0
+  EnableConfigSnapshot()
 
   changes = (
       Changelist(branchref=b, auth_config=auth_config)
@@ -1946,6 +2091,11 @@ def CMDpresubmit(parser, args):
                     help='Run upload hook instead of the push/dcommit hook')
   parser.add_option('-f', '--force', action='store_true',
                     help='Run checks even if tree is dirty')
+  parser.add_option('--parallel', action='store_true',
+                    help='Run all the PRESUBMIT.py files in parallel')
+  parser.add_option('--defer-commands', action='store_true',
+                    help='Run the commands of all the PRESUBMIT.py files '
+                         'together once the files are done')
   auth.add_auth_options(parser)
   options, args = parser.parse_args(args)
   auth_config = auth.extract_auth_config_from_options(options)
@@ -1954,6 +2104,7 @@ def CMDpresubmit(parser, args):
     print 'use --force to check even if tree is dirty.'
     return 1
 
+  EnableConfigSnapshot()
   cl = Changelist(auth_config=auth_config)
   if args:
     base_branch = args[0]
@@ -1965,7 +2116,9 @@ def CMDpresubmit(parser, args):
       committing=not options.upload,
       may_prompt=False,
       verbose=options.verbose,
-      change=cl.GetChange(base_branch, None))
+      change=cl.GetChange(base_branch, None),
+      parallel=options.parallel,
+      defer_commands=options.defer_commands)
   return 0
 
 
@@ -3418,7 +3571,8 @@ def CMDowners(parser, args):
           cl.GetChange(base_branch, None).AffectedFiles()],
       change.RepositoryRoot(), author,
       fopen=file, os_path=os.path, glob=glob.glob,
-      disable_color=options.no_color).run()
+      disable_color=options.no_color,
+      index=owners.OwnersIndex(change.RepositoryRoot())).run()
 
 
 def BuildGitDiffCmd(diff_type, upstream_commit, args, extensions):
@@ -3651,8 +3805,9 @@ def main(argv):
     return 2
 
   # Reload settings.
-  global settings
+  global settings, config_snapshot
   settings = Settings()
+  config_snapshot = None
 
   colorize_CMDstatus_doc()
   dispatcher = subcommand.CommandDispatcher(__name__)
@@ -35,7 +35,9 @@ If a user's email is one of the email_addresses in the file, the user is
 considered an "OWNER" for all files in the directory.
 
 If the "per-file" directive is used, the line only applies to files in that
-directory that match the filename glob specified.
+directory that match the filename glob specified. The globs are matched against
+the queried paths rather than the files on disk, so they also apply to files
+added by a change.
 
 If the "set noparent" directive used, then only entries in this OWNERS file
 apply to files in this directory; if the "set noparent" directive is not
@@ -52,9 +54,16 @@ considered when determining the valid set of OWNERS. If the filename starts with
 the current file
 
 Examples for all of these combinations can be found in tests/owners_unittest.py.
+
+Parsed OWNERS files can be kept in an OwnersIndex so that they are only parsed
+again once they are modified.
 """
 
 import collections
+import fnmatch
+import heapq
+import marshal
+import os
 import random
 import re
 
@@ -67,6 +76,22 @@ EVERYONE = '*'
 BASIC_EMAIL_REGEXP = r'^[\w\-\+\%\.]+\@[\w\-\+\%\.]+$'
 
 
+# Compiled per-file globs, shared by all the databases.
+_GLOB_PATTERNS = {}
+
+
+def _glob_matches(glob_string, name):
+  """Returns whether the file name matches the per-file glob, with the same
+  rules as glob.glob()."""
+  if name.startswith('.') and not glob_string.startswith('.'):
+    return False
+  pattern = _GLOB_PATTERNS.get(glob_string)
+  if pattern is None:
+    pattern = re.compile(fnmatch.translate(glob_string))
+    _GLOB_PATTERNS[glob_string] = pattern
+  return bool(pattern.match(name))
+
+
 def _assert_is_collection(obj):
   assert not isinstance(obj, basestring)
   # Module 'collections' has no 'Iterable' member
@@ -87,6 +112,70 @@ class SyntaxErrorInOwnersFile(Exception):
     return '%s:%d syntax error: %s' % (self.path, self.lineno, self.msg)
 
 
+class OwnersIndex(object):
+  """An on-disk index of the parsed OWNERS files of a git checkout.
+
+  Each OWNERS file is stored as the list of its directives and is parsed again
+  only once its mtime or size change. The index is filled as OWNERS files are
+  read and written back to .git/owners_index by save() if anything changed.
+  Nothing is stored if root isn't the top of a git checkout.
+  """
+
+  # Bump when the format of the entries changes.
+  VERSION = 1
+
+  def __init__(self, root):
+    self.root = root
+    self._dirty = False
+    # Loaded on first use.
+    self._files = None
+
+  @property
+  def path(self):
+    return os.path.join(self.root, '.git', 'owners_index')
+
+  def _load(self):
+    self._files = {}
+    try:
+      with open(self.path, 'rb') as f:
+        data = marshal.load(f)
+      if data.get('version') == self.VERSION:
+        self._files = data['files']
+    except (IOError, OSError, EOFError, ValueError, TypeError,
+            AttributeError, KeyError):
+      pass
+
+  def get(self, owners_path, parse):
+    """Returns the directives of the OWNERS file at owners_path, calling
+    parse(owners_path) if it isn't indexed or changed since."""
+    if self._files is None:
+      self._load()
+    st = os.stat(owners_path)
+    key = [st.st_mtime, st.st_size]
+    entry = self._files.get(owners_path)
+    if entry and entry[0] == key:
+      return entry[1]
+    directives = parse(owners_path)
+    self._files[owners_path] = [key, directives]
+    self._dirty = True
+    return directives
+
+  def save(self):
+    if not self._dirty or not os.path.isdir(os.path.dirname(self.path)):
+      return
+    tmp = '%s.%d.tmp' % (self.path, os.getpid())
+    try:
+      with open(tmp, 'wb') as f:
+        marshal.dump({'version': self.VERSION, 'files': self._files}, f)
+      if os.name == 'nt' and os.path.exists(self.path):
+        os.remove(self.path)
+      os.rename(tmp, self.path)
+      self._dirty = False
+    except (IOError, OSError):
+      if os.path.exists(tmp):
+        os.remove(tmp)
+
+
 class Database(object):
   """A database of OWNERS files for a repository.
 
@@ -94,29 +183,44 @@ class Database(object):
   of changed files, and see if a list of changed files is covered by a
   list of reviewers."""
 
-  def __init__(self, root, fopen, os_path, glob):
+  def __init__(self, root, fopen, os_path, glob, index=None):
     """Args:
       root: the path to the root of the Repository
       open: function callback to open a text file for reading
       os_path: module/object callback with fields for 'abspath', 'dirname',
           'exists', and 'join'
       glob: function callback to list entries in a directory match a glob
-          (i.e., glob.glob)
+          (i.e., glob.glob); unused since per-file globs are matched against
+          the queried paths
+      index: optional OwnersIndex of the parsed OWNERS files of the real
+          filesystem
     """
     self.root = root
     self.fopen = fopen
     self.os_path = os_path
     self.glob = glob
+    self.index = index
 
     # Pick a default email regexp to use; callers can override as desired.
     self.email_regexp = re.compile(BASIC_EMAIL_REGEXP)
 
+    # Breaks ties between equally good reviewers.
+    self.random = random.Random()
+
     # Mapping of owners to the paths they own.
     self.owned_by = {EVERYONE: set()}
 
     # Mapping of paths to authorized owners.
     self.owners_for = {}
 
+    # Mapping of directories to the per-file rules of their OWNERS file, as a
+    # dict of glob to authorized owners of the matching entries.
+    self.glob_owners = {}
+
+    # Mapping of directories to the globs of their "per-file glob=set noparent"
+    # lines.
+    self.glob_stop_looking = {}
+
     # Mapping reviewers to the preceding comment per file in the OWNERS files.
     self.comments = {}
 
@@ -156,7 +260,8 @@ class Database(object):
 
     covered_objs = self._objs_covered_by(reviewers)
     uncovered_files = [f for f in files
-                       if not self._is_obj_covered_by(f, covered_objs)]
+                       if not self._is_obj_covered_by(f, reviewers,
+                                                      covered_objs)]
 
     return set(uncovered_files)
 
@@ -177,19 +282,50 @@ class Database(object):
       objs = objs | self.owned_by.get(r, set())
     return objs
 
-  def _stop_looking(self, objname):
-    return objname in self.stop_looking
+  def _matching_globs(self, rules, objname):
+    """Returns the globs of the per-file rules of objname's directory that
+    match objname."""
+    if not objname:
+      return []
+    name = self.os_path.basename(objname)
+    return [g for g in rules.get(self.os_path.dirname(objname), ())
+            if _glob_matches(g, name)]
+
+  def per_file_owners_for(self, objname):
+    """Returns the owners of objname given by the per-file rules of its
+    directory."""
+    owners = set()
+    rules = self.glob_owners.get(self.os_path.dirname(objname))
+    if rules:
+      for glob_string in self._matching_globs(self.glob_owners, objname):
+        owners |= rules[glob_string]
+    return owners
+
+  def _owners_for(self, objname):
+    owners = self.per_file_owners_for(objname)
+    owners.update(self.owners_for.get(objname, ()))
+    return owners
 
-  def _is_obj_covered_by(self, objname, covered_objs):
-    while not objname in covered_objs and not self._stop_looking(objname):
+  def _stop_looking(self, objname):
+    if objname in self.stop_looking:
+      return True
+    return bool(self._matching_globs(self.glob_stop_looking, objname))
+
+  def _is_obj_covered_by(self, objname, reviewers, covered_objs):
+    reviewers = set(reviewers)
+    reviewers.add(EVERYONE)
+    def is_covered(objname):
+      return (objname in covered_objs or
+              bool(self.per_file_owners_for(objname) & reviewers))
+    while not is_covered(objname) and not self._stop_looking(objname):
       objname = self.os_path.dirname(objname)
-    return objname in covered_objs
+    return is_covered(objname)
 
   def _enclosing_dir_with_owners(self, objname):
     """Returns the innermost enclosing directory that has an OWNERS file."""
     dirpath = objname
     while not dirpath in self.owners_for:
-      if self._stop_looking(dirpath):
+      if self.per_file_owners_for(dirpath) or self._stop_looking(dirpath):
         break
       dirpath = self.os_path.dirname(dirpath)
     return dirpath
@@ -202,6 +338,8 @@ class Database(object):
         if self._stop_looking(dirpath):
           break
         dirpath = self.os_path.dirname(dirpath)
+    if self.index:
+      self.index.save()
 
   def _read_owners(self, path):
     owners_path = self.os_path.join(self.root, path)
@@ -213,8 +351,27 @@ class Database(object):
 
     self.read_files.add(owners_path)
 
-    comment = []
+    if self.index:
+      directives = self.index.get(owners_path, self._parse_owners)
+    else:
+      directives = self._parse_owners(owners_path)
+
     dirpath = self.os_path.dirname(path)
+    for lineno, glob_string, directive, comment in directives:
+      if directive == 'set noparent' and glob_string is None:
+        self.stop_looking.add(dirpath)
+      elif glob_string is not None:
+        self._add_entry(dirpath, directive, 'per-file line', owners_path,
+                        lineno, '\n'.join(comment), glob_string)
+      else:
+        self._add_entry(dirpath, directive, 'line', owners_path, lineno,
+                        ' '.join(comment))
+
+  def _parse_owners(self, owners_path):
+    """Returns the directives of an OWNERS file as a list of
+    (lineno, per-file glob or None, directive, preceding comment lines)."""
+    directives = []
+    comment = []
     in_comment = False
     lineno = 0
     for line in self.fopen(owners_path):
@@ -231,35 +388,36 @@ class Database(object):
       in_comment = False
 
       if line == 'set noparent':
-        self.stop_looking.add(dirpath)
+        directives.append((lineno, None, line, []))
         continue
 
       m = re.match('per-file (.+)=(.+)', line)
       if m:
         glob_string = m.group(1).strip()
         directive = m.group(2).strip()
-        full_glob_string = self.os_path.join(self.root, dirpath, glob_string)
         if '/' in glob_string or '\\' in glob_string:
           raise SyntaxErrorInOwnersFile(owners_path, lineno,
               'per-file globs cannot span directories or use escapes: "%s"' %
               line)
-        baselines = self.glob(full_glob_string)
-        for baseline in (self.os_path.relpath(b, self.root) for b in baselines):
-          self._add_entry(baseline, directive, 'per-file line',
-                          owners_path, lineno, '\n'.join(comment))
+        directives.append((lineno, glob_string, directive, list(comment)))
         continue
 
       if line.startswith('set '):
         raise SyntaxErrorInOwnersFile(owners_path, lineno,
             'unknown option: "%s"' % line[4:].strip())
 
-      self._add_entry(dirpath, line, 'line', owners_path, lineno,
-                      ' '.join(comment))
+      directives.append((lineno, None, line, list(comment)))
+    return directives
 
-  def _add_entry(self, path, directive,
-                 line_type, owners_path, lineno, comment):
+  def _add_entry(self, path, directive, line_type, owners_path, lineno,
+                 comment, glob_string=None):
+    """Adds a directive of the OWNERS file of the directory path. If
+    glob_string is set, it only applies to the entries matching it."""
     if directive == 'set noparent':
-      self.stop_looking.add(path)
+      if glob_string is None:
+        self.stop_looking.add(path)
+      else:
+        self.glob_stop_looking.setdefault(path, set()).add(glob_string)
     elif directive.startswith('file:'):
       owners_file = self._resolve_include(directive[5:], owners_path)
       if not owners_file:
@@ -269,24 +427,29 @@ class Database(object):
       self._read_owners(owners_file)
 
       dirpath = self.os_path.dirname(owners_file)
-      for key in self.owned_by:
-        if not dirpath in self.owned_by[key]:
-          continue
-        self.owned_by[key].add(path)
-
-      if dirpath in self.owners_for:
-        self.owners_for.setdefault(path, set()).update(self.owners_for[dirpath])
+      for owner in self.owners_for.get(dirpath, ()):
+        self._add_owner(path, glob_string, owner)
 
     elif self.email_regexp.match(directive) or directive == EVERYONE:
       self.comments.setdefault(directive, {})
-      self.comments[directive][path] = comment
-      self.owned_by.setdefault(directive, set()).add(path)
-      self.owners_for.setdefault(path, set()).add(directive)
+      if glob_string is None:
+        self.comments[directive][path] = comment
+      else:
+        self.comments[directive][self.os_path.join(path, glob_string)] = comment
+      self._add_owner(path, glob_string, directive)
     else:
       raise SyntaxErrorInOwnersFile(owners_path, lineno,
           ('%s is not a "set" directive, file include, "*", '
            'or an email address: "%s"' % (line_type, directive)))
 
+  def _add_owner(self, path, glob_string, owner):
+    if glob_string is None:
+      self.owned_by.setdefault(owner, set()).add(path)
+      self.owners_for.setdefault(path, set()).add(owner)
+    else:
+      rules = self.glob_owners.setdefault(path, {})
+      rules.setdefault(glob_string, set()).add(owner)
+
   def _resolve_include(self, path, start):
     if path.startswith('//'):
       include_path = path[2:]
@@ -302,14 +465,69 @@ class Database(object):
     return include_path
 
   def _covering_set_of_owners_for(self, files, author):
-    dirs_remaining = set(self._enclosing_dir_with_owners(f) for f in files)
-    all_possible_owners = self.all_possible_owners(dirs_remaining, author)
+    dirs = set(self._enclosing_dir_with_owners(f) for f in files)
+    all_possible_owners = self.all_possible_owners(dirs, author)
+    return self._greedy_covering_set(all_possible_owners, dirs)
+
+  def _greedy_covering_set(self, all_possible_owners, dirs):
+    """Repeatedly picks the owner with the lowest cost for the directories
+    still needing a reviewer, see total_costs_by_owner().
+
+    The costs live in a heap and only the owners of the directories covered
+    by a pick are updated, instead of recomputing every cost after each pick.
+    Directories nobody can review are left out."""
+    owners_of_dir = {}
+    # Mapping of owners to [total distance, number of directories] over the
+    # directories still needing a reviewer.
+    totals = {}
+    for owner, entries in all_possible_owners.iteritems():
+      for dirname, distance in entries:
+        if dirname in dirs:
+          owners_of_dir.setdefault(dirname, []).append((owner, distance))
+          total = totals.setdefault(owner, [0, 0])
+          total[0] += distance
+          total[1] += 1
+    dirs_remaining = set(owners_of_dir)
+
+    # Entries are (cost, owner, version); entries with an outdated version
+    # are skipped when popped.
+    versions = dict.fromkeys(totals, 0)
+    heap = [(self._cost(*total), owner, 0)
+            for owner, total in totals.iteritems()]
+    heapq.heapify(heap)
+
     suggested_owners = set()
-    while dirs_remaining:
-      owner = self.lowest_cost_owner(all_possible_owners, dirs_remaining)
+    while dirs_remaining and heap:
+      lowest_cost = heap[0][0]
+      lowest_cost_owners = []
+      while heap and heap[0][0] == lowest_cost:
+        _, owner, version = heapq.heappop(heap)
+        if version == versions[owner]:
+          lowest_cost_owners.append(owner)
+      if not lowest_cost_owners:
+        continue
+      owner = self.random.choice(sorted(lowest_cost_owners))
+      for other in lowest_cost_owners:
+        if other != owner:
+          heapq.heappush(heap, (lowest_cost, other, versions[other]))
       suggested_owners.add(owner)
-      dirs_to_remove = set(el[0] for el in all_possible_owners[owner])
-      dirs_remaining -= dirs_to_remove
+      versions[owner] += 1
+
+      changed = set()
+      for dirname, _ in all_possible_owners[owner]:
+        if dirname not in dirs_remaining:
+          continue
+        dirs_remaining.remove(dirname)
+        for other, distance in owners_of_dir[dirname]:
+          totals[other][0] -= distance
+          totals[other][1] -= 1
+          changed.add(other)
+      changed.discard(owner)
+      for other in changed:
+        versions[other] += 1
+        if totals[other][1]:
+          heapq.heappush(heap, (self._cost(*totals[other]), other,
+                                versions[other]))
     return suggested_owners
 
   def all_possible_owners(self, dirs, author):
@@ -320,14 +538,16 @@ class Database(object):
     for current_dir in dirs:
       dirname = current_dir
       distance = 1
+      seen = set()
       while True:
-        for owner in self.owners_for.get(dirname, []):
+        for owner in self._owners_for(dirname):
           if author and owner == author:
             continue
           all_possible_owners.setdefault(owner, [])
           # If the same person is in multiple OWNERS files above a given
           # directory, only count the closest one.
-          if not any(current_dir == el[0] for el in all_possible_owners[owner]):
+          if owner not in seen:
+            seen.add(owner)
             all_possible_owners[owner].append((current_dir, distance))
         if self._stop_looking(dirname):
           break
@@ -336,12 +556,16 @@ class Database(object):
     return all_possible_owners
 
   @staticmethod
-  def total_costs_by_owner(all_possible_owners, dirs):
+  def _cost(total_distance, num_directories_owned):
     # We want to minimize both the number of reviewers and the distance
     # from the files/dirs needing reviews. The "pow(X, 1.75)" below is
     # an arbitrarily-selected scaling factor that seems to work well - it
     # will select one reviewer in the parent directory over three reviewers
     # in subdirs, but not one reviewer over just two.
+    return total_distance / pow(num_directories_owned, 1.75)
+
+  @staticmethod
+  def total_costs_by_owner(all_possible_owners, dirs):
     result = {}
     for owner in all_possible_owners:
       total_distance = 0
@@ -351,8 +575,7 @@ class Database(object):
           total_distance += distance
           num_directories_owned += 1
       if num_directories_owned:
-        result[owner] = (total_distance /
-                         pow(num_directories_owned, 1.75))
+        result[owner] = Database._cost(total_distance, num_directories_owned)
     return result
 
   @staticmethod
@@ -5,7 +5,6 @@
 """Interactive tool for finding reviewers/owners for a change."""
 
 import os
-import copy
 import owners as owners_module
 
 
@@ -14,6 +13,42 @@ def first(iterable):
     return element
 
 
+def iter_bits(mask):
+  """Yields the indexes of the bits set in mask, lowest first."""
+  while mask:
+    low = mask & -mask
+    yield low.bit_length() - 1
+    mask ^= low
+
+
+class FileTrie(object):
+  """Prefix tree of file paths by path component, mapping each directory or
+  file to the bitset of the file ids at or under it."""
+
+  def __init__(self, files):
+    # Each node is [bitset, {component: node}].
+    self.root = [0, {}]
+    for file_id, file_name in enumerate(files):
+      node = self.root
+      node[0] |= 1 << file_id
+      for component in self._split(file_name):
+        node = node[1].setdefault(component, [0, {}])
+        node[0] |= 1 << file_id
+
+  @staticmethod
+  def _split(path):
+    return [c for c in path.replace('\\', '/').split('/') if c]
+
+  def files_under(self, path):
+    """Returns the bitset of the files at or under path."""
+    node = self.root
+    for component in self._split(path):
+      node = node[1].get(component)
+      if node is None:
+        return 0
+    return node[0]
+
+
 class OwnersFinder(object):
   COLOR_LINK = '\033[4m'
   COLOR_BOLD = '\033[1;32m'
@@ -25,7 +60,7 @@ class OwnersFinder(object):
   def __init__(self, files, local_root, author,
                fopen, os_path, glob,
                email_postfix='@chromium.org',
-               disable_color=False):
+               disable_color=False, index=None):
     self.email_postfix = email_postfix
 
     if os.name == 'nt' or disable_color:
@@ -34,51 +69,54 @@ class OwnersFinder(object):
       self.COLOR_GREY = ''
       self.COLOR_RESET = ''
 
-    self.db = owners_module.Database(local_root, fopen, os_path, glob)
+    self.db = owners_module.Database(local_root, fopen, os_path, glob, index)
     self.db.load_data_needed_for(files)
 
     self.os_path = os_path
 
     self.author = author
 
-    filtered_files = files
-
-    # Eliminate files that author himself can review.
-    if author:
-      if author in self.db.owned_by:
-        for dir_name in self.db.owned_by[author]:
-          filtered_files = [
-              file_name for file_name in filtered_files
-              if not file_name.startswith(dir_name)]
-
-        filtered_files = list(filtered_files)
-
-    # Eliminate files that everyone can review.
-    if owners_module.EVERYONE in self.db.owned_by:
-      for dir_name in self.db.owned_by[owners_module.EVERYONE]:
-        filtered_files = filter(
-            lambda file_name: not file_name.startswith(dir_name),
-            filtered_files)
+    # Eliminate files that author himself or everyone can review.
+    trie = FileTrie(files)
+    reviewed = 0
+    for owner in filter(None, (author, owners_module.EVERYONE)):
+      for dir_name in self.db.owned_by.get(owner, ()):
+        reviewed |= trie.files_under(dir_name)
+    filtered_files = [
+        file_name for file_id, file_name in enumerate(files)
+        if not reviewed & (1 << file_id) and
+           not self.db.per_file_owners_for(file_name) &
+               set([author, owners_module.EVERYONE])]
 
     # If some files are eliminated.
     if len(filtered_files) != len(files):
       files = filtered_files
+      trie = FileTrie(files)
       # Reload the database.
-      self.db = owners_module.Database(local_root, fopen, os_path, glob)
+      self.db = owners_module.Database(
+          local_root, fopen, os_path, glob, index)
       self.db.load_data_needed_for(files)
 
     self.all_possible_owners = self.db.all_possible_owners(files, None)
 
-    self.owners_to_files = {}
-    self._map_owners_to_files(files)
-
-    self.files_to_owners = {}
-    self._map_files_to_owners()
+    # Files and owners are numbered so that their relations are bitsets: the
+    # files an owner can review, and the owners that can review a file.
+    self.files = list(files)
+    self.file_ids = dict((f, i) for i, f in enumerate(self.files))
+    self.owners = sorted(self.all_possible_owners)
+    self.owner_ids = dict((o, i) for i, o in enumerate(self.owners))
+    self.owner_files = {}
+    self.file_owners = [0] * len(self.files)
+    self._map_owners_to_files(trie)
+
+    # Mapping of owners to the names of the files they can review.
+    self.owners_to_files = dict(
+        (owner, set(self.files[i] for i in iter_bits(mask)))
+        for owner, mask in self.owner_files.iteritems())
 
     self.owners_score = self.db.total_costs_by_owner(
-        self.all_possible_owners, files)
+        self.all_possible_owners, set(files))
 
-    self.original_files_to_owners = copy.deepcopy(self.files_to_owners)
     self.comments = self.db.comments
 
     # This is the queue that will be shown in the interactive questions.
@@ -87,22 +125,33 @@ class OwnersFinder(object):
     # owner will be put to the end of the queue and shown later.
     self.owners_queue = []
 
-    self.unreviewed_files = set()
+    # Bitset of the files still needing a reviewer and, for each file, the
+    # bitset of the owners that weren't deselected for it.
+    self.unreviewed = 0
+    self.candidates = []
     self.reviewed_by = {}
     self.selected_owners = set()
     self.deselected_owners = set()
     self.reset()
 
+  @property
+  def unreviewed_files(self):
+    return set(self.files[i] for i in iter_bits(self.unreviewed))
+
+  def owners_of(self, file_name):
+    """Returns the owners that weren't deselected for file_name."""
+    mask = self.candidates[self.file_ids[file_name]]
+    return set(self.owners[i] for i in iter_bits(mask))
+
   def run(self):
     self.reset()
-    while self.owners_queue and self.unreviewed_files:
+    while self.owners_queue and self.unreviewed:
       owner = self.owners_queue[0]
 
       if (owner in self.selected_owners) or (owner in self.deselected_owners):
         continue
 
-      if not any((file_name in self.unreviewed_files)
-                 for file_name in self.owners_to_files[owner]):
+      if not self.owner_files[owner] & self.unreviewed:
         self.deselect_owner(owner)
         continue
 
@@ -141,23 +190,27 @@ class OwnersFinder(object):
     self.print_result()
     return 0
 
-  def _map_owners_to_files(self, files):
-    for owner in self.all_possible_owners:
+  def _map_owners_to_files(self, trie):
+    for owner in self.owners:
+      mask = 0
       for dir_name, _ in self.all_possible_owners[owner]:
-        for file_name in files:
-          if file_name.startswith(dir_name):
-            self.owners_to_files.setdefault(owner, set())
-            self.owners_to_files[owner].add(file_name)
-
-  def _map_files_to_owners(self):
-    for owner in self.owners_to_files:
-      for file_name in self.owners_to_files[owner]:
-        self.files_to_owners.setdefault(file_name, set())
-        self.files_to_owners[file_name].add(owner)
+        if dir_name in self.file_ids:
+          mask |= 1 << self.file_ids[dir_name]
+        else:
+          mask |= trie.files_under(dir_name)
+      if not mask:
+        continue
+      self.owner_files[owner] = mask
+      owner_bit = 1 << self.owner_ids[owner]
+      for file_id in iter_bits(mask):
+        self.file_owners[file_id] |= owner_bit
 
   def reset(self):
-    self.files_to_owners = copy.deepcopy(self.original_files_to_owners)
-    self.unreviewed_files = set(self.files_to_owners.keys())
+    self.candidates = list(self.file_owners)
+    self.unreviewed = 0
+    for file_id, mask in enumerate(self.file_owners):
+      if mask:
+        self.unreviewed |= 1 << file_id
     self.reviewed_by = {}
     self.selected_owners = set()
     self.deselected_owners = set()
@@ -174,11 +227,10 @@ class OwnersFinder(object):
     self.writeln('Selected: ' + owner)
     self.owners_queue.remove(owner)
     self.selected_owners.add(owner)
-    for file_name in filter(
-        lambda file_name: file_name in self.unreviewed_files,
-        self.owners_to_files[owner]):
-      self.unreviewed_files.remove(file_name)
-      self.reviewed_by[file_name] = owner
+    reviewed = self.owner_files[owner] & self.unreviewed
+    for file_id in iter_bits(reviewed):
+      self.reviewed_by[self.files[file_id]] = owner
+    self.unreviewed &= ~reviewed
     if findMandatoryOwners:
       self.find_mandatory_owners()
 
@@ -189,30 +241,31 @@ class OwnersFinder(object):
     self.writeln('Deselected: ' + owner)
     self.owners_queue.remove(owner)
     self.deselected_owners.add(owner)
-    for file_name in self.owners_to_files[owner] & self.unreviewed_files:
-      self.files_to_owners[file_name].remove(owner)
+    owner_mask = ~(1 << self.owner_ids[owner])
+    for file_id in iter_bits(self.owner_files[owner] & self.unreviewed):
+      self.candidates[file_id] &= owner_mask
     if findMandatoryOwners:
       self.find_mandatory_owners()
 
   def find_mandatory_owners(self):
-    continues = True
-    for owner in self.owners_queue:
+    for owner in list(self.owners_queue):
       if owner in self.selected_owners:
         continue
       if owner in self.deselected_owners:
         continue
-      if len(self.owners_to_files[owner] & self.unreviewed_files) == 0:
+      if not self.owner_files[owner] & self.unreviewed:
         self.deselect_owner(owner, False)
 
+    # Select the owners that are the only ones left for a file.
+    continues = True
     while continues:
       continues = False
-      for file_name in filter(
-          lambda file_name: len(self.files_to_owners[file_name]) == 1,
-          self.unreviewed_files):
-        owner = first(self.files_to_owners[file_name])
-        self.select_owner(owner, False)
-        continues = True
-        break
+      for file_id in iter_bits(self.unreviewed):
+        mask = self.candidates[file_id]
+        if mask and not mask & (mask - 1):
+          self.select_owner(self.owners[iter_bits(mask).next()], False)
+          continues = True
+          break
 
   def print_comments(self, owner):
     if owner not in self.comments:
@@ -230,28 +283,28 @@ class OwnersFinder(object):
       self.unindent()
 
   def print_file_info(self, file_name, except_owner=''):
-    if file_name not in self.unreviewed_files:
+    if file_name in self.reviewed_by:
       self.writeln(self.greyed(file_name +
                                ' (by ' +
                                self.bold_name(self.reviewed_by[file_name]) +
                                ')'))
     else:
-      if len(self.files_to_owners[file_name]) <= 3:
+      file_owners = self.owners_of(file_name)
+      if len(file_owners) <= 3:
         other_owners = []
-        for ow in self.files_to_owners[file_name]:
+        for ow in file_owners:
           if ow != except_owner:
             other_owners.append(self.bold_name(ow))
         self.writeln(file_name +
                      ' [' + (', '.join(other_owners)) + ']')
       else:
         self.writeln(file_name + ' [' +
-                     self.bold(str(len(self.files_to_owners[file_name]))) +
-                     ']')
+                     self.bold(str(len(file_owners))) + ']')
 
   def print_file_info_detailed(self, file_name):
     self.writeln(file_name)
     self.indent()
-    for ow in sorted(self.files_to_owners[file_name]):
+    for ow in sorted(self.owners_of(file_name)):
       if ow in self.deselected_owners:
         self.writeln(self.bold_name(self.greyed(ow)))
       elif ow in self.selected_owners:
@@ -356,7 +409,7 @@ class OwnersFinder(object):
   def print_info(self, owner):
     self.hr()
     self.writeln(
-        self.bold(str(len(self.unreviewed_files))) + ' file(s) left.')
+        self.bold(str(bin(self.unreviewed).count('1'))) + ' file(s) left.')
     self.print_owned_files_for(owner)
 
   def input_command(self, owner):
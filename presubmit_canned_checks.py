@@ -98,17 +98,23 @@ def CheckChangeWasUploaded(input_api, output_api):
 
 ### Content checks
 
-def CheckDoNotSubmitInFiles(input_api, output_api):
-  """Checks that the user didn't add 'DO NOT ''SUBMIT' to any files."""
+def _DoNotSubmitInFilesRule(input_api):
   # We want to check every text file, not just source files.
   file_filter = lambda x : x
   keyword = 'DO NOT ''SUBMIT'
-  errors = _FindNewViolationsOfRule(lambda _, line : keyword not in line,
-                                    input_api, file_filter)
-  text = '\n'.join('Found %s in %s' % (keyword, loc) for loc in errors)
-  if text:
-    return [output_api.PresubmitError(text)]
-  return []
+  def results(output_api, errors):
+    text = '\n'.join('Found %s in %s' % (keyword, loc) for loc in errors)
+    if text:
+      return [output_api.PresubmitError(text)]
+    return []
+  return _LineRule(lambda _, line : keyword not in line, results,
+                   file_filter, pattern=input_api.re.escape(keyword))
+
+
+def CheckDoNotSubmitInFiles(input_api, output_api):
+  """Checks that the user didn't add 'DO NOT ''SUBMIT' to any files."""
+  return _RunLineRules(
+      input_api, output_api, [_DoNotSubmitInFilesRule(input_api)])[0]
 
 
 def CheckChangeLintsClean(input_api, output_api, source_file_filter=None,
@@ -208,43 +214,133 @@ def _ReportErrorFileAndLine(filename, line_num, dummy_line):
   return '%s:%s' % (filename, line_num)
 
 
-def _FindNewViolationsOfRule(callable_rule, input_api, source_file_filter=None,
-                             error_formatter=_ReportErrorFileAndLine):
-  """Find all newly introduced violations of a per-line rule (a callable).
+class _LineRule(object):
+  """A per-line rule checked by _FindNewViolationsOfRules().
 
   Arguments:
     callable_rule: a callable taking a file extension and line of input and
       returning True if the rule is satisfied and False if there was a problem.
-    input_api: object to enumerate the affected files.
-    source_file_filter: a filter to be passed to the input api.
+    results: a callable taking (output_api, errors) and returning the
+      presubmit results for the list of formatted violations.
+    source_file_filter: a filter for the affected files to check.
     error_formatter: a callable taking (filename, line_number, line) and
       returning a formatted error string.
+    pattern: optional regular expression matching, in MULTILINE mode, at least
+      every line violating the rule. Files it doesn't match are skipped
+      without calling callable_rule on each of their lines.
+  """
+  def __init__(self, callable_rule, results=None, source_file_filter=None,
+               error_formatter=_ReportErrorFileAndLine, pattern=None):
+    self.callable_rule = callable_rule
+    self.results = results
+    self.source_file_filter = source_file_filter
+    self.error_formatter = error_formatter
+    self.pattern = pattern
+
+
+def _FindNewViolationsOfRules(rules, input_api):
+  """Find all newly introduced violations of several per-line rules at once.
+
+  Each affected file is read once for all the rules. The patterns of the rules
+  are combined into a single regular expression so that only the lines it
+  matches are checked against them.
 
   Returns:
-    A list of the newly-introduced violations reported by the rule.
+    A list with the list of newly-introduced violations of each rule.
   """
-  errors = []
+  errors = dict((rule, []) for rule in rules)
+  combined = None
+  if any(r.pattern for r in rules):
+    combined = input_api.re.compile(
+        '|'.join('(?:%s)' % r.pattern for r in rules if r.pattern),
+        input_api.re.MULTILINE | input_api.re.UNICODE)
+  # With different filters, each rule filters the files itself.
+  shared_filter = len(set(r.source_file_filter for r in rules)) == 1
+  file_filter = rules[0].source_file_filter if shared_filter else None
   for f in input_api.AffectedFiles(include_deletes=False,
-                                   file_filter=source_file_filter):
+                                   file_filter=file_filter):
+    file_rules = rules
+    if not shared_filter:
+      file_rules = [r for r in rules
+                    if not r.source_file_filter or r.source_file_filter(f)]
+      if not file_rules:
+        continue
     # For speed, we do two passes, checking first the full file.  Shelling out
     # to the SCM to determine the changed region can be quite expensive on
     # Win32.  Assuming that most files will be kept problem-free, we can
     # skip the SCM operations most of the time.
     extension = str(f.LocalPath()).rsplit('.', 1)[-1]
-    if all(callable_rule(extension, line) for line in f.NewContents()):
+    contents = f.NewContents()
+    violated = []
+    patterns = [r for r in file_rules if r.pattern]
+    remaining = [r for r in file_rules if not r.pattern]
+    text = '\n'.join(contents)
+    if text.count('\n') >= len(contents):
+      # The lines themselves contain newlines so the patterns don't apply.
+      remaining = list(file_rules)
+    elif patterns:
+      # Only the lines matched by the combined pattern can violate the rules
+      # that have one.
+      checked = -1
+      for m in combined.finditer(text):
+        start = text.rfind('\n', 0, m.start()) + 1
+        if start == checked:
+          continue
+        checked = start
+        end = text.find('\n', m.start())
+        line = text[start:] if end == -1 else text[start:end]
+        for rule in patterns[:]:
+          if not rule.callable_rule(extension, line):
+            violated.append(rule)
+            patterns.remove(rule)
+        if not patterns:
+          break
+    for line in contents:
+      if not remaining:
+        break
+      for rule in remaining[:]:
+        if not rule.callable_rule(extension, line):
+          violated.append(rule)
+          remaining.remove(rule)
+    if not violated:
       continue  # No violation found in full text: can skip considering diff.
 
     for line_num, line in f.ChangedContents():
-      if not callable_rule(extension, line):
-        errors.append(error_formatter(f.LocalPath(), line_num, line))
+      for rule in violated:
+        if not rule.callable_rule(extension, line):
+          errors[rule].append(
+              rule.error_formatter(f.LocalPath(), line_num, line))
 
-  return errors
+  return [errors[rule] for rule in rules]
 
 
-def CheckChangeHasNoTabs(input_api, output_api, source_file_filter=None):
-  """Checks that there are no tab characters in any of the text files to be
-  submitted.
+def _RunLineRules(input_api, output_api, rules):
+  """Returns the list of presubmit results of each rule, checked together."""
+  return [rule.results(output_api, errors) for rule, errors in zip(
+      rules, _FindNewViolationsOfRules(rules, input_api))]
+
+
+def _FindNewViolationsOfRule(callable_rule, input_api, source_file_filter=None,
+                             error_formatter=_ReportErrorFileAndLine):
+  """Find all newly introduced violations of a per-line rule (a callable).
+
+  Arguments:
+    callable_rule: a callable taking a file extension and line of input and
+      returning True if the rule is satisfied and False if there was a problem.
+    input_api: object to enumerate the affected files.
+    source_file_filter: a filter to be passed to the input api.
+    error_formatter: a callable taking (filename, line_number, line) and
+      returning a formatted error string.
+
+  Returns:
+    A list of the newly-introduced violations reported by the rule.
   """
+  rule = _LineRule(callable_rule, source_file_filter=source_file_filter,
+                   error_formatter=error_formatter)
+  return _FindNewViolationsOfRules([rule], input_api)[0]
+
+
+def _NoTabsRule(input_api, source_file_filter):
   # In addition to the filter, make sure that makefiles are blacklisted.
   if not source_file_filter:
     # It's the default filter.
@@ -255,43 +351,62 @@ def CheckChangeHasNoTabs(input_api, output_api, source_file_filter=None):
                  basename.endswith('.mk')) and
             source_file_filter(affected_file))
 
-  tabs = _FindNewViolationsOfRule(lambda _, line : '\t' not in line,
-                                  input_api, filter_more)
+  def results(output_api, tabs):
+    if tabs:
+      return [output_api.PresubmitPromptWarning('Found a tab character in:',
+                                                long_text='\n'.join(tabs))]
+    return []
+  return _LineRule(lambda _, line : '\t' not in line, results, filter_more,
+                   pattern=r'\t')
 
-  if tabs:
-    return [output_api.PresubmitPromptWarning('Found a tab character in:',
-                                              long_text='\n'.join(tabs))]
-  return []
+
+def CheckChangeHasNoTabs(input_api, output_api, source_file_filter=None):
+  """Checks that there are no tab characters in any of the text files to be
+  submitted.
+  """
+  return _RunLineRules(
+      input_api, output_api,
+      [_NoTabsRule(input_api, source_file_filter)])[0]
+
+
+def _TodoHasOwnerRule(input_api, source_file_filter):
+  unowned_todo = input_api.re.compile('TO''DO[^(]')
+  def results(output_api, errors):
+    errors = ['Found TO''DO with no owner in ' + x for x in errors]
+    if errors:
+      return [output_api.PresubmitPromptWarning('\n'.join(errors))]
+    return []
+  return _LineRule(lambda _, x : not unowned_todo.search(x), results,
+                   source_file_filter, pattern=unowned_todo.pattern)
 
 
 def CheckChangeTodoHasOwner(input_api, output_api, source_file_filter=None):
   """Checks that the user didn't add TODO(name) without an owner."""
+  return _RunLineRules(
+      input_api, output_api,
+      [_TodoHasOwnerRule(input_api, source_file_filter)])[0]
 
-  unowned_todo = input_api.re.compile('TO''DO[^(]')
-  errors = _FindNewViolationsOfRule(lambda _, x : not unowned_todo.search(x),
-                                    input_api, source_file_filter)
-  errors = ['Found TO''DO with no owner in ' + x for x in errors]
-  if errors:
-    return [output_api.PresubmitPromptWarning('\n'.join(errors))]
-  return []
+
+def _NoStrayWhitespaceRule(source_file_filter):
+  def results(output_api, errors):
+    if errors:
+      return [output_api.PresubmitPromptWarning(
+          'Found line ending with white spaces in:',
+          long_text='\n'.join(errors))]
+    return []
+  # Any whitespace but the newline joining the lines, at the end of a line.
+  return _LineRule(lambda _, line : line.rstrip() == line, results,
+                   source_file_filter, pattern=r'[^\S\n]$')
 
 
 def CheckChangeHasNoStrayWhitespace(input_api, output_api,
                                     source_file_filter=None):
   """Checks that there is no stray whitespace at source lines end."""
-  errors = _FindNewViolationsOfRule(lambda _, line : line.rstrip() == line,
-                                    input_api, source_file_filter)
-  if errors:
-    return [output_api.PresubmitPromptWarning(
-        'Found line ending with white spaces in:',
-        long_text='\n'.join(errors))]
-  return []
+  return _RunLineRules(
+      input_api, output_api, [_NoStrayWhitespaceRule(source_file_filter)])[0]
 
 
-def CheckLongLines(input_api, output_api, maxlen, source_file_filter=None):
-  """Checks that there aren't any lines longer than maxlen characters in any of
-  the text files to be submitted.
-  """
+def _LongLinesRule(input_api, maxlen, source_file_filter):
   maxlens = {
       'java': 100,
       # This is specifically for Android's handwritten makefiles (Android.mk).
@@ -362,14 +477,26 @@ def CheckLongLines(input_api, output_api, maxlen, source_file_filter=None):
   def format_error(filename, line_num, line):
     return '%s, line %s, %s chars' % (filename, line_num, len(line))
 
-  errors = _FindNewViolationsOfRule(no_long_lines, input_api,
-                                    source_file_filter,
-                                    error_formatter=format_error)
-  if errors:
-    msg = 'Found lines longer than %s characters (first 5 shown).' % maxlen
-    return [output_api.PresubmitPromptWarning(msg, items=errors[:5])]
-  else:
-    return []
+  def results(output_api, errors):
+    if errors:
+      msg = 'Found lines longer than %s characters (first 5 shown).' % maxlen
+      return [output_api.PresubmitPromptWarning(msg, items=errors[:5])]
+    else:
+      return []
+
+  # Lines shorter than the smallest limit are always fine.
+  return _LineRule(no_long_lines, results, source_file_filter,
+                   error_formatter=format_error,
+                   pattern='^.{%d,}' % (min(maxlens.itervalues()) + 1))
+
+
+def CheckLongLines(input_api, output_api, maxlen, source_file_filter=None):
+  """Checks that there aren't any lines longer than maxlen characters in any of
+  the text files to be submitted.
+  """
+  return _RunLineRules(
+      input_api, output_api,
+      [_LongLinesRule(input_api, maxlen, source_file_filter)])[0]
 
 
 def CheckLicense(input_api, output_api, license_re, source_file_filter=None,
@@ -534,6 +661,12 @@ def GetUnitTests(input_api, output_api, unit_tests, env=None):
   else:
     message_type = output_api.PresubmitPromptWarning
 
+  # The tests depend on the code they exercise as much as on themselves, so
+  # their results are only reused while the files of the change are unchanged.
+  changed_files = []
+  if input_api.change:
+    changed_files = input_api.change.AbsoluteLocalPaths()
+
   results = []
   for unit_test in unit_tests:
     cmd = []
@@ -550,7 +683,9 @@ def GetUnitTests(input_api, output_api, unit_tests, env=None):
         name=unit_test,
         cmd=cmd,
         kwargs=kwargs,
-        message=message_type))
+        message=message_type,
+        inputs=[input_api.os_path.join(kwargs['cwd'], unit_test)] +
+            changed_files))
   return results
 
 
@@ -684,11 +819,158 @@ def _FetchAllFiles(input_api, white_list, black_list):
   return files
 
 
+def _PythonModuleNames(path):
+  """Returns the dotted names the python file at path, relative to the
+  PRESUBMIT.py directory, can be imported as from any of its parents."""
+  parts = path.replace('\\', '/')[:-len('.py')].split('/')
+  if parts[-1] == '__init__':
+    parts.pop()
+  return ['.'.join(parts[i:]) for i in range(len(parts))]
+
+
+def _ParseImports(content):
+  """Returns the names of the modules imported by python source code, with
+  their parent packages."""
+  import ast
+  try:
+    tree = ast.parse(content)
+  except (SyntaxError, TypeError, ValueError):
+    return []
+  names = set()
+  for node in ast.walk(tree):
+    if isinstance(node, ast.Import):
+      modules = [a.name for a in node.names]
+    elif isinstance(node, ast.ImportFrom):
+      # node.module is None for 'from . import foo'.
+      base = node.module or ''
+      modules = [base] if base else []
+      modules.extend('.'.join(filter(None, (base, a.name)))
+                     for a in node.names if a.name != '*')
+    else:
+      continue
+    for module in modules:
+      parts = module.split('.')
+      names.update('.'.join(parts[:i]) for i in range(1, len(parts) + 1))
+  return sorted(names)
+
+
+class _PythonImportIndex(object):
+  """The modules imported by each python file of a checkout.
+
+  Works like owners.OwnersIndex: files are parsed again only once their mtime
+  or size change and the index is kept in .git/pylint_imports.
+  """
+
+  # Bump when the format of the entries changes.
+  VERSION = 1
+
+  def __init__(self, input_api):
+    self.input_api = input_api
+    self.path = input_api.os_path.join(
+        input_api.change.RepositoryRoot(), '.git', 'pylint_imports')
+    self._dirty = False
+    # Loaded on first use.
+    self._files = None
+
+  def _load(self):
+    self._files = {}
+    try:
+      with open(self.path, 'rb') as f:
+        data = self.input_api.marshal.load(f)
+      if data.get('version') == self.VERSION:
+        self._files = data['files']
+    except (IOError, OSError, EOFError, ValueError, TypeError,
+            AttributeError, KeyError):
+      pass
+
+  def imports(self, path):
+    """Returns the modules imported by the python file at path."""
+    if self._files is None:
+      self._load()
+    try:
+      st = self.input_api.os_stat(path)
+    except OSError:
+      return []
+    key = [st.st_mtime, st.st_size]
+    entry = self._files.get(path)
+    if entry and entry[0] == key:
+      return entry[1]
+    names = _ParseImports(self.input_api.ReadFile(path))
+    self._files[path] = [key, names]
+    self._dirty = True
+    return names
+
+  def save(self):
+    if (not self._dirty or
+        not self.input_api.os_path.isdir(
+            self.input_api.os_path.dirname(self.path))):
+      return
+    tmp = '%s.%d.tmp' % (self.path, _os.getpid())
+    try:
+      with open(tmp, 'wb') as f:
+        self.input_api.marshal.dump(
+            {'version': self.VERSION, 'files': self._files}, f)
+      if _os.name == 'nt' and _os.path.exists(self.path):
+        _os.remove(self.path)
+      _os.rename(tmp, self.path)
+      self._dirty = False
+    except (IOError, OSError):
+      if _os.path.exists(tmp):
+        _os.remove(tmp)
+
+
+def _PylintTargets(files, changed, imports_of):
+  """Returns the files that need to be linted once the files in changed were
+  modified: the changed files still in files and those importing them,
+  directly or not.
+
+  Paths are relative to the PRESUBMIT.py directory and imports_of(path)
+  returns the modules imported by path. Modules are matched by name only so
+  a few unrelated files may be linted too.
+  """
+  importers = {}
+  for path in files:
+    for name in imports_of(path):
+      importers.setdefault(name, []).append(path)
+  existing = set(files)
+  targets = set()
+  seen = set(changed)
+  queue = list(changed)
+  while queue:
+    path = queue.pop()
+    if path in existing:
+      targets.add(path)
+    for name in _PythonModuleNames(path):
+      for importer in importers.get(name, []):
+        if importer not in seen:
+          seen.add(importer)
+          queue.append(importer)
+  return sorted(targets)
+
+
+def _ImportsChanged(input_api, affected_files):
+  """Returns True if the change may add or remove imports between python
+  files."""
+  import_line = input_api.re.compile(r'^[+-]\s*(import|from)\s')
+  for f in affected_files:
+    if f.Action().startswith(('A', 'D')):
+      return True
+    for line in f.GenerateScmDiff().splitlines():
+      if not line.startswith(('+++', '---')) and import_line.match(line):
+        return True
+  return False
+
+
 def GetPylint(input_api, output_api, white_list=None, black_list=None,
-              disabled_warnings=None, extra_paths_list=None, pylintrc=None):
+              disabled_warnings=None, extra_paths_list=None, pylintrc=None,
+              incremental=None):
   """Run pylint on python files.
 
   The default white_list enforces looking only at *.py files.
+
+  In incremental mode, only the changed files and the files importing them are
+  linted and the cyclic-import check only runs if the change touches imports.
+  It defaults to True on upload and False on commit.
   """
   white_list = tuple(white_list or ('.*\.py$',))
   black_list = tuple(black_list or input_api.DEFAULT_BLACK_LIST)
@@ -716,9 +998,12 @@ def GetPylint(input_api, output_api, white_list=None, black_list=None,
     return input_api.re.escape(prefix) + regex
   src_filter = lambda x: input_api.FilterSourceFile(
       x, map(rel_path, white_list), map(rel_path, black_list))
-  if not input_api.AffectedSourceFiles(src_filter):
+  affected_files = input_api.AffectedSourceFiles(src_filter)
+  if not affected_files:
     input_api.logging.info('Skipping pylint: no matching changes.')
     return []
+  if incremental is None:
+    incremental = not input_api.is_committing
 
   if pylintrc is not None:
     pylintrc = input_api.os_path.join(input_api.PresubmitLocalPath(), pylintrc)
@@ -732,9 +1017,28 @@ def GetPylint(input_api, output_api, white_list=None, black_list=None,
   if not files:
     return []
   files.sort()
-
-  input_api.logging.info('Running pylint on %d files', len(files))
-  input_api.logging.debug('Running pylint on: %s', files)
+  # pylint reads all the files so its results can be reused until one of them
+  # or the configuration changes.
+  local_path = input_api.PresubmitLocalPath()
+  inputs = [input_api.os_path.join(local_path, f) for f in files] + [pylintrc]
+
+  targets = files
+  check_cycles = True
+  if incremental:
+    index = _PythonImportIndex(input_api)
+    # The files importing deleted files are linted too.
+    changed_files = input_api.AffectedFiles(
+        include_deletes=True, file_filter=src_filter)
+    changed = [f.AbsoluteLocalPath()[len(local_path) + 1:]
+               for f in changed_files]
+    targets = _PylintTargets(
+        files, changed,
+        lambda f: index.imports(input_api.os_path.join(local_path, f)))
+    index.save()
+    check_cycles = _ImportsChanged(input_api, changed_files)
+
+  input_api.logging.info('Running pylint on %d files', len(targets))
+  input_api.logging.debug('Running pylint on: %s', targets)
   # Copy the system path to the environment so pylint can find the right
   # imports.
   env = input_api.environ.copy()
@@ -766,7 +1070,8 @@ def GetPylint(input_api, output_api, white_list=None, black_list=None,
         name='Pylint (%s)' % description,
         cmd=cmd,
         kwargs={'env': env, 'stdin': '\n'.join(args + flist)},
-        message=error_type)
+        message=error_type,
+        inputs=inputs)
 
   # Always run pylint and pass it all the py files at once.
   # Passing py files one at time is slower and can produce
@@ -782,15 +1087,22 @@ def GetPylint(input_api, output_api, white_list=None, black_list=None,
 
     # Some PRESUBMITs explicitly mention cycle detection.
     if not any('R0401' in a or 'cyclic-import' in a for a in extra_args):
-      return [
-        GetPylintCmd(files, ["--disable=cyclic-import"], True),
-        GetPylintCmd(files, ["--disable=all", "--enable=cyclic-import"], False)
-      ]
+      commands = []
+      if targets:
+        commands.append(
+            GetPylintCmd(targets, ["--disable=cyclic-import"], True))
+      if check_cycles:
+        # Cycles can go through any file.
+        commands.append(GetPylintCmd(
+            files, ["--disable=all", "--enable=cyclic-import"], False))
+      return commands
+    elif targets:
+      return [ GetPylintCmd(targets, [], True) ]
     else:
-      return [ GetPylintCmd(files, [], True) ]
+      return []
 
   else:
-    return map(lambda x: GetPylintCmd([x], [], 1), files)
+    return map(lambda x: GetPylintCmd([x], [], 1), targets)
 
 
 def RunPylint(input_api, *args, **kwargs):
@@ -980,6 +1292,38 @@ def CheckSingletonInHeaders(input_api, output_api, source_file_filter=None):
   ]
 
 
+# The canned per-line checks, as defined here. input_api.canned_checks may
+# override them, e.g. with --skip_canned.
+_CANNED_LINE_CHECKS = dict((check.__name__, check) for check in (
+    CheckChangeHasNoStrayWhitespace, CheckChangeHasNoTabs,
+    CheckDoNotSubmitInFiles, CheckLongLines))
+
+
+def _RunLineChecks(input_api, output_api, checks):
+  """Runs canned per-line checks and returns the list of results of each.
+
+  checks is a list of (name, args, kwargs, rule). The checks still dispatched
+  to their canned version by input_api.canned_checks have their rules checked
+  together, in a single pass over the files. The others are called as
+  input_api.canned_checks.<name>(input_api, output_api, *args, **kwargs).
+  """
+  results = [None] * len(checks)
+  indexes = []
+  rules = []
+  for i, (name, args, kwargs, rule) in enumerate(checks):
+    check = getattr(input_api.canned_checks, name)
+    if check is _CANNED_LINE_CHECKS[name]:
+      indexes.append(i)
+      rules.append(rule)
+    else:
+      results[i] = check(input_api, output_api, *args, **kwargs)
+  if rules:
+    for i, rule_results in zip(
+        indexes, _RunLineRules(input_api, output_api, rules)):
+      results[i] = rule_results
+  return results
+
+
 def PanProjectChecks(input_api, output_api,
                      excluded_paths=None, text_files=None,
                      license_header=None, project_name=None,
@@ -1053,15 +1397,21 @@ def PanProjectChecks(input_api, output_api,
     results.extend(input_api.canned_checks.CheckOwners(
         input_api, output_api, source_file_filter=None))
 
-  snapshot("checking long lines")
-  results.extend(input_api.canned_checks.CheckLongLines(
-      input_api, output_api, maxlen, source_file_filter=sources))
-  snapshot( "checking tabs")
-  results.extend(input_api.canned_checks.CheckChangeHasNoTabs(
-      input_api, output_api, source_file_filter=sources))
-  snapshot( "checking stray whitespace")
-  results.extend(input_api.canned_checks.CheckChangeHasNoStrayWhitespace(
-      input_api, output_api, source_file_filter=sources))
+  line_checks = [
+    ('CheckLongLines', (maxlen,), {'source_file_filter': sources},
+     _LongLinesRule(input_api, maxlen, sources)),
+    ('CheckChangeHasNoTabs', (), {'source_file_filter': sources},
+     _NoTabsRule(input_api, sources)),
+    ('CheckChangeHasNoStrayWhitespace', (), {'source_file_filter': sources},
+     _NoStrayWhitespaceRule(sources)),
+  ]
+  if input_api.is_committing:
+    line_checks.append(
+        ('CheckDoNotSubmitInFiles', (), {}, _DoNotSubmitInFilesRule(input_api)))
+  snapshot("checking long lines, tabs and stray whitespace")
+  line_results = _RunLineChecks(input_api, output_api, line_checks)
+  for rule_results in line_results[:3]:
+    results.extend(rule_results)
   snapshot("checking nsobjects")
   results.extend(_CheckConstNSObject(
       input_api, output_api, source_file_filter=sources))
@@ -1084,9 +1434,7 @@ def PanProjectChecks(input_api, output_api,
         input_api, output_api))
     results.extend(input_api.canned_checks.CheckDoNotSubmitInDescription(
         input_api, output_api))
-    snapshot("checking do not submit in files")
-    results.extend(input_api.canned_checks.CheckDoNotSubmitInFiles(
-        input_api, output_api))
+    results.extend(line_results[3])
   snapshot("done")
   return results
 
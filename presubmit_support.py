@@ -18,17 +18,20 @@ import cStringIO  # Exposed through the API.
 import contextlib
 import fnmatch
 import glob
+import hashlib
 import inspect
 import itertools
 import json  # Exposed through the API.
 import logging
 import marshal  # Exposed through the API.
 import multiprocessing
+import multiprocessing.pool
 import optparse
 import os  # Somewhat exposed through the API.
 import pickle  # Exposed through the API.
 import random
 import re  # Exposed through the API.
+import select
 import sys  # Parts exposed through API.
 import tempfile  # Exposed through the API.
 import time
@@ -58,12 +61,16 @@ class PresubmitFailure(Exception):
 
 
 class CommandData(object):
-  def __init__(self, name, cmd, kwargs, message):
+  def __init__(self, name, cmd, kwargs, message, inputs=None):
     self.name = name
     self.cmd = cmd
     self.kwargs = kwargs
     self.message = message
     self.info = None
+    # Absolute paths of the files the outcome of the command depends on. When
+    # set, a successful run is cached until one of them changes, see
+    # _CommandScheduler.
+    self.inputs = inputs
 
 
 def normpath(path):
@@ -187,6 +194,18 @@ class _PresubmitNotifyResult(_PresubmitResult):
   pass
 
 
+# Top level object so multiprocessing can pickle
+class _DeferredCommandResult(_PresubmitResult):
+  """Stands for the outcome of a command passed to InputApi.RunTests until the
+  commands of all the presubmit scripts are run by _CommandScheduler."""
+  def __init__(self, command, parallel):
+    super(_DeferredCommandResult, self).__init__('')
+    self.command = command
+    self.parallel = parallel
+    # The message returned by CallCommand() once run, if any.
+    self.result = None
+
+
 # Top level object so multiprocessing can pickle
 # Public access through OutputApi object.
 class _MailTextResult(_PresubmitResult):
@@ -262,8 +281,12 @@ class InputApi(object):
       r".+\.patch$",
   )
 
+  # Set by the constructor, see below.
+  _defer_commands = False
+  _command_cache = None
+
   def __init__(self, change, presubmit_path, is_committing,
-      rietveld_obj, verbose):
+      rietveld_obj, verbose, defer_commands=False, command_cache=None):
     """Builds an InputApi object.
 
     Args:
@@ -271,6 +294,10 @@ class InputApi(object):
       presubmit_path: The path to the presubmit script being processed.
       is_committing: True if the change is about to be committed.
       rietveld_obj: rietveld.Rietveld client object
+      defer_commands: if True, RunTests returns placeholders and the commands
+        are run later along with those of the other presubmit scripts.
+      command_cache: optional _CommandCache used by RunTests to skip the
+        commands that already succeeded with the same inputs.
     """
     # Version number of the presubmit_support script.
     self.version = [int(x) for x in __version__.split('.')]
@@ -318,7 +345,11 @@ class InputApi(object):
     # changed, which causes Pool() to explode fantastically when run on windows
     # (because it tries to load the __main__ module, which imports lots of
     # things relative to the current working directory).
-    self._run_tests_pool = multiprocessing.Pool(self.cpu_count)
+    self._defer_commands = defer_commands
+    self._command_cache = command_cache
+    self._run_tests_pool = None
+    if not defer_commands:
+      self._run_tests_pool = multiprocessing.Pool(self.cpu_count)
 
     # The local path of the currently-being-processed presubmit script.
     self._current_presubmit_path = os.path.dirname(presubmit_path)
@@ -329,7 +360,8 @@ class InputApi(object):
     # TODO(dpranke): figure out a list of all approved owners for a repo
     # in order to be able to handle wildcard OWNERS files?
     self.owners_db = owners.Database(change.RepositoryRoot(),
-        fopen=file, os_path=self.os_path, glob=self.glob)
+        fopen=file, os_path=self.os_path, glob=self.glob,
+        index=owners.OwnersIndex(change.RepositoryRoot()))
     self.verbose = verbose
     self.Command = CommandData
 
@@ -498,14 +530,59 @@ class InputApi(object):
         tests.append(t)
         if self.verbose:
           t.info = _PresubmitNotifyResult
+    if self._defer_commands:
+      # The commands run once all the presubmit scripts are done, from the
+      # original working directory.
+      for t in tests:
+        t.kwargs['cwd'] = self.os_path.join(
+            self.PresubmitLocalPath(), t.kwargs.get('cwd') or '')
+      return msgs + [_DeferredCommandResult(t, parallel) for t in tests]
+    entries = [None] * len(tests)
+    if self._command_cache:
+      uncached = []
+      entries = []
+      for t in tests:
+        entry, cached = self._command_cache.lookup(t)
+        if cached:
+          if t.info:
+            msgs.append(t.info('%s (cached)' % t.name))
+        else:
+          uncached.append(t)
+          entries.append(entry)
+      tests = uncached
     if len(tests) > 1 and parallel:
       # async recipe works around multiprocessing bug handling Ctrl-C
-      msgs.extend(self._run_tests_pool.map_async(CallCommand, tests).get(99999))
+      outcomes = self._run_tests_pool.map_async(_CallCommand, tests).get(99999)
     else:
-      msgs.extend(map(CallCommand, tests))
+      outcomes = map(_CallCommand, tests)
+    msgs.extend(message for message, _ in outcomes)
+    if self._command_cache:
+      self._command_cache.add([
+          entry for entry, (_, succeeded) in zip(entries, outcomes)
+          if entry and succeeded])
     return [m for m in msgs if m]
 
 
+class _ReadOnlyList(list):
+  """A list that can't be modified, so it can be handed out without copying.
+
+  Slicing or copying it returns a regular list.
+  """
+  def _ReadOnly(self, *_args, **_kwargs):
+    raise TypeError('%s is read-only, copy it first' % type(self).__name__)
+
+  def __copy__(self):
+    return list(self)
+
+  def __deepcopy__(self, _memo):
+    # The items are strings or tuples of strings and numbers.
+    return list(self)
+
+  __setitem__ = __delitem__ = __setslice__ = __delslice__ = _ReadOnly
+  __iadd__ = __imul__ = _ReadOnly
+  append = extend = insert = pop = remove = reverse = sort = _ReadOnly
+
+
 class _DiffCache(object):
   """Caches diffs retrieved from a particular SCM."""
   def __init__(self, upstream=None):
@@ -516,6 +593,15 @@ class _DiffCache(object):
     """Get the diff for a particular path."""
     raise NotImplementedError()
 
+  def GetDiffSpan(self, path, local_root):
+    """Returns (diff, start, end) where diff[start:end] is the diff for path.
+
+    diff may hold the diffs of other files too so it doesn't need to be
+    copied.
+    """
+    diff = self.GetDiff(path, local_root)
+    return diff, 0, len(diff)
+
 
 class _SvnDiffCache(_DiffCache):
   """DiffCache implementation for subversion."""
@@ -531,45 +617,58 @@ class _SvnDiffCache(_DiffCache):
 
 
 class _GitDiffCache(_DiffCache):
-  """DiffCache implementation for git; gets all file diffs at once."""
+  """DiffCache implementation for git; gets all file diffs at once.
+
+  The diff of the whole change is kept in a single string along with the
+  offsets of each file's section in it.
+  """
   def __init__(self, upstream):
     super(_GitDiffCache, self).__init__(upstream=upstream)
-    self._diffs_by_file = None
-
-  def GetDiff(self, path, local_root):
-    if not self._diffs_by_file:
-      # Compute a single diff for all files and parse the output; should
-      # with git this is much faster than computing one diff for each file.
-      diffs = {}
-
-      # Don't specify any filenames below, because there are command line length
-      # limits on some platforms and GenerateDiff would fail.
-      unified_diff = scm.GIT.GenerateDiff(local_root, files=[], full_move=True,
-                                          branch=self._upstream)
-
-      # This regex matches the path twice, separated by a space. Note that
-      # filename itself may contain spaces.
-      file_marker = re.compile('^diff --git (?P<filename>.*) (?P=filename)$')
-      current_diff = []
-      keep_line_endings = True
-      for x in unified_diff.splitlines(keep_line_endings):
-        match = file_marker.match(x)
-        if match:
-          # Marks the start of a new per-file section.
-          diffs[match.group('filename')] = current_diff = [x]
-        elif x.startswith('diff --git'):
-          raise PresubmitFailure('Unexpected diff line: %s' % x)
-        else:
-          current_diff.append(x)
-
-      self._diffs_by_file = dict(
-        (normpath(path), ''.join(diff)) for path, diff in diffs.items())
-
-    if path not in self._diffs_by_file:
+    self._diff = None
+    # Maps a normalized path to the (start, end) of its diff in self._diff.
+    self._spans = None
+
+  def _Parse(self, local_root):
+    # Compute a single diff for all files and parse the output; should
+    # with git this is much faster than computing one diff for each file.
+
+    # Don't specify any filenames below, because there are command line length
+    # limits on some platforms and GenerateDiff would fail.
+    unified_diff = scm.GIT.GenerateDiff(local_root, files=[], full_move=True,
+                                        branch=self._upstream)
+
+    # This regex matches the path twice, separated by a space. Note that
+    # filename itself may contain spaces.
+    file_marker = re.compile('^diff --git (?P<filename>.*) (?P=filename)$')
+    spans = {}
+    previous = None
+    for match in re.finditer(r'^diff --git[^\r\n]*', unified_diff, re.M):
+      marker = file_marker.match(match.group(0))
+      if not marker:
+        raise PresubmitFailure('Unexpected diff line: %s' % match.group(0))
+      # Marks the start of a new per-file section.
+      if previous:
+        spans[previous[0]] = (previous[1], match.start())
+      previous = (normpath(marker.group('filename')), match.start())
+    if previous:
+      spans[previous[0]] = (previous[1], len(unified_diff))
+    self._diff = unified_diff
+    self._spans = spans
+
+  def GetDiffSpan(self, path, local_root):
+    if self._spans is None:
+      self._Parse(local_root)
+
+    if path not in self._spans:
       raise PresubmitFailure(
           'Unified diff did not contain entry for file %s' % path)
 
-    return self._diffs_by_file[path]
+    start, end = self._spans[path]
+    return self._diff, start, end
+
+  def GetDiff(self, path, local_root):
+    diff, start, end = self.GetDiffSpan(path, local_root)
+    return diff[start:end]
 
 
 class AffectedFile(object):
@@ -641,16 +740,19 @@ class AffectedFile(object):
 
     Contents will be empty if the file is a directory or does not exist.
     Note: The carriage returns (LF or CR) are stripped off.
+
+    The list is shared between calls and is read-only; slice it, or use
+    copy.copy() or copy.deepcopy(), to get a regular list that can be modified.
     """
     if self._cached_new_contents is None:
-      self._cached_new_contents = []
+      self._cached_new_contents = _ReadOnlyList()
       if not self.IsDirectory():
         try:
-          self._cached_new_contents = gclient_utils.FileRead(
-              self.AbsoluteLocalPath(), 'rU').splitlines()
+          self._cached_new_contents = _ReadOnlyList(gclient_utils.FileRead(
+              self.AbsoluteLocalPath(), 'rU').splitlines())
         except IOError:
           pass  # File not found?  That's fine; maybe it was deleted.
-    return self._cached_new_contents[:]
+    return self._cached_new_contents
 
   def ChangedContents(self):
     """Returns a list of tuples (line number, line text) of all new lines.
@@ -659,25 +761,43 @@ class AffectedFile(object):
      with a line of the form
 
      ^@@ <old line num>,<old size> <new line num>,<new size> @@$
+
+    The list is shared between calls and is read-only, like NewContents().
     """
     if self._cached_changed_contents is not None:
-      return self._cached_changed_contents[:]
-    self._cached_changed_contents = []
-    line_num = 0
+      return self._cached_changed_contents
+    self._cached_changed_contents = _ReadOnlyList()
 
     if self.IsDirectory():
-      return []
+      return self._cached_changed_contents
 
-    for line in self.GenerateScmDiff().splitlines():
-      m = re.match(r'^@@ [0-9\,\+\-]+ \+([0-9]+)\,[0-9]+ @@', line)
-      if m:
-        line_num = int(m.groups(1)[0])
-        continue
-      if line.startswith('+') and not line.startswith('++'):
-        self._cached_changed_contents.append((line_num, line[1:]))
-      if not line.startswith('-'):
+    changed = []
+    line_num = 0
+    hunk_header = re.compile(r'@@ [0-9\,\+\-]+ \+([0-9]+)\,[0-9]+ @@')
+    diff, pos, end = self._diff_cache.GetDiffSpan(
+        self.LocalPath(), self._local_root)
+    # Walks the lines in place; only the added lines are copied.
+    while pos < end:
+      eol = diff.find('\n', pos, end)
+      if eol == -1:
+        eol = end
+      first = diff[pos]
+      if first == '@':
+        m = hunk_header.match(diff, pos, eol)
+        if m:
+          line_num = int(m.group(1))
+          pos = eol + 1
+          continue
+      if first == '+' and diff[pos + 1:pos + 2] != '+':
+        line_end = eol
+        if diff[line_end - 1:line_end] == '\r':
+          line_end -= 1
+        changed.append((line_num, diff[pos + 1:line_end]))
+      if first != '-':
         line_num += 1
-    return self._cached_changed_contents[:]
+      pos = eol + 1
+    self._cached_changed_contents = _ReadOnlyList(changed)
+    return self._cached_changed_contents
 
   def __str__(self):
     return self.LocalPath()
@@ -1344,18 +1464,252 @@ def DoPostUploadExecuter(change,
   return results
 
 
+class _CommandCache(object):
+  """Remembers, in cache_dir, the commands declaring their inputs that
+  succeeded, so they are skipped while their inputs don't change.
+
+  Each entry is an empty file named after the sha1 of the command and of the
+  content of its inputs. The least recently used ones are pruned.
+  """
+
+  # Number of successful commands remembered in the cache directory.
+  MAX_CACHED = 500
+
+  def __init__(self, cache_dir):
+    self.cache_dir = cache_dir
+    # Maps an absolute path to the sha1 of its content.
+    self._hashes = {}
+
+  def _hash_file(self, path):
+    if path not in self._hashes:
+      try:
+        with open(path, 'rb') as f:
+          self._hashes[path] = hashlib.sha1(f.read()).hexdigest()
+      except IOError:
+        # Deleted files and directories.
+        self._hashes[path] = None
+    return self._hashes[path]
+
+  def lookup(self, command, key=None):
+    """Returns (entry, cached): the name of the cache entry of command, or None
+    if it can't be cached, and whether it already succeeded.
+
+    key is _CommandScheduler._key(command), computed if not given.
+    """
+    if command.inputs is None:
+      return None, False
+    digest = hashlib.sha1(key or _CommandScheduler._key(command))
+    for path in sorted(set(command.inputs)):
+      digest.update(repr((path, self._hash_file(path))))
+    entry = digest.hexdigest()
+    try:
+      # Touching the entry keeps it from being pruned.
+      os.utime(os.path.join(self.cache_dir, entry), None)
+      return entry, True
+    except OSError:
+      return entry, False
+
+  def add(self, entries):
+    """Records that the commands of the cache entries succeeded."""
+    if (not entries or
+        not os.path.isdir(os.path.dirname(self.cache_dir))):
+      return
+    try:
+      if not os.path.isdir(self.cache_dir):
+        os.mkdir(self.cache_dir)
+      for entry in entries:
+        open(os.path.join(self.cache_dir, entry), 'w').close()
+      entries = sorted(
+          (os.stat(p).st_mtime, p) for p in (
+              os.path.join(self.cache_dir, e)
+              for e in os.listdir(self.cache_dir)))
+      for _, path in entries[:-self.MAX_CACHED]:
+        os.remove(path)
+    except (IOError, OSError), e:
+      logging.warning('Failed to update %s: %s', self.cache_dir, e)
+
+
+class _CommandScheduler(object):
+  """Runs the commands passed to InputApi.RunTests by all the presubmit scripts
+  at once.
+
+  Identical commands are only run once and the longest commands, according to
+  the durations of the previous runs, are started first. Commands declaring
+  their inputs are skipped when they already succeeded with the same inputs.
+  """
+
+  # Number of commands listed by report().
+  SLOWEST = 5
+
+  # Number of commands whose duration is remembered; the least recently used
+  # ones are dropped first.
+  MAX_DURATIONS = 500
+
+  # Variables inherited from os.environ that change what the commands do. The
+  # others, like credentials or per-session variables, are left out of the
+  # keys. An env passed explicitly by a script is part of the key as a whole.
+  KEY_ENV = ('LANG', 'LC_ALL', 'LC_CTYPE', 'PATH', 'PYLINTRC', 'PYTHONHOME',
+             'PYTHONPATH', 'VIRTUAL_ENV')
+
+  def __init__(self, durations_path, jobs=None, cache_dir=None):
+    self.durations_path = durations_path
+    self.jobs = jobs or multiprocessing.cpu_count()
+    self.cache = _CommandCache(cache_dir) if cache_dir else None
+    # List of (seconds, name) of the commands run.
+    self.timings = []
+
+  @staticmethod
+  def _key(command):
+    """Returns the sha1 of what a command runs."""
+    kwargs = dict(command.kwargs)
+    # Commands run in the current directory unless told otherwise.
+    kwargs['cwd'] = os.path.abspath(kwargs.get('cwd') or os.curdir)
+    if kwargs.get('env') is None:
+      kwargs['env'] = dict((k, os.environ[k])
+                           for k in _CommandScheduler.KEY_ENV
+                           if k in os.environ)
+    kwargs = sorted(
+        (k, sorted(v.iteritems()) if isinstance(v, dict) else v)
+        for k, v in kwargs.iteritems()
+        if k not in ('stdout', 'stderr'))
+    return hashlib.sha1(repr((command.cmd, kwargs))).hexdigest()
+
+  def _load_durations(self):
+    """Returns a dict of the command keys to [seconds, last used]."""
+    if not self.durations_path or not os.path.isfile(self.durations_path):
+      return {}
+    try:
+      durations = json.loads(gclient_utils.FileRead(self.durations_path))
+    except (IOError, ValueError), e:
+      logging.warning('Ignoring unreadable %s: %s', self.durations_path, e)
+      return {}
+    # Entries written in another format are dropped.
+    return dict((k, v) for k, v in durations.iteritems()
+                if isinstance(v, list) and len(v) == 2)
+
+  def _save_durations(self, durations):
+    if (not self.durations_path or
+        not os.path.isdir(os.path.dirname(self.durations_path))):
+      return
+    try:
+      gclient_utils.FileWrite(self.durations_path, json.dumps(durations))
+    except IOError, e:
+      logging.warning('Failed to write %s: %s', self.durations_path, e)
+
+  @staticmethod
+  def _call(command):
+    start = time.time()
+    message, succeeded = _CallCommand(command)
+    return message, succeeded, time.time() - start
+
+  def run(self, results):
+    """Runs the commands of the _DeferredCommandResult in results and returns
+    results with them replaced by the commands' messages."""
+    deferred = [r for r in results if isinstance(r, _DeferredCommandResult)]
+    if not deferred:
+      return results
+
+    # Maps each distinct command to the placeholders waiting for it.
+    waiting = {}
+    order = []
+    serial = set()
+    cache_entries = {}
+    for placeholder in deferred:
+      key = self._key(placeholder.command)
+      if key not in waiting:
+        waiting[key] = []
+        entry, cached = None, False
+        if self.cache:
+          entry, cached = self.cache.lookup(placeholder.command, key)
+        if cached:
+          command = placeholder.command
+          if command.info:
+            placeholder.result = command.info('%s (cached)' % command.name)
+        else:
+          order.append(key)
+          cache_entries[key] = entry
+      waiting[key].append(placeholder)
+      if not placeholder.parallel:
+        serial.add(key)
+
+    # The durations of other checkouts or branches are kept too, up to
+    # MAX_DURATIONS commands.
+    durations = self._load_durations()
+    now = time.time()
+    for key in waiting:
+      if key in durations:
+        durations[key][1] = now
+    # Commands never run before come first since they may be long.
+    parallel = sorted(
+        (k for k in order if k not in serial),
+        key=lambda k: -durations.get(k, [float('inf')])[0])
+    commands = [waiting[k][0].command for k in parallel]
+    outcomes = []
+    if commands:
+      pool = multiprocessing.pool.ThreadPool(min(self.jobs, len(commands)))
+      try:
+        # async recipe works around multiprocessing bug handling Ctrl-C
+        outcomes = pool.map_async(self._call, commands, 1).get(99999)
+      finally:
+        pool.close()
+        pool.join()
+    serial = [k for k in order if k in serial]
+    outcomes.extend(self._call(waiting[k][0].command) for k in serial)
+
+    succeeded_entries = []
+    for key, (message, succeeded, seconds) in zip(parallel + serial, outcomes):
+      durations[key] = [round(seconds, 2), now]
+      self.timings.append((seconds, waiting[key][0].command.name))
+      # Duplicates are reported once.
+      waiting[key][0].result = message
+      if succeeded and cache_entries[key]:
+        succeeded_entries.append(cache_entries[key])
+    if len(durations) > self.MAX_DURATIONS:
+      by_last_use = sorted(durations, key=lambda k: durations[k][1])
+      for key in by_last_use[:-self.MAX_DURATIONS]:
+        del durations[key]
+    self._save_durations(durations)
+    if self.cache:
+      self.cache.add(succeeded_entries)
+
+    replaced = []
+    for result in results:
+      if isinstance(result, _DeferredCommandResult):
+        if result.result:
+          replaced.append(result.result)
+      else:
+        replaced.append(result)
+    return replaced
+
+  def report(self, output):
+    """Writes the slowest commands that were run."""
+    if not self.timings:
+      return
+    output.write('Slowest presubmit commands:\n')
+    for seconds, name in sorted(self.timings, reverse=True)[:self.SLOWEST]:
+      output.write('  %6.2fs %s\n' % (seconds, name))
+    output.write('\n')
+
+
 class PresubmitExecuter(object):
-  def __init__(self, change, committing, rietveld_obj, verbose):
+  def __init__(self, change, committing, rietveld_obj, verbose,
+               defer_commands=False, command_cache=None):
     """
     Args:
       change: The Change object.
       committing: True if 'gcl commit' is running, False if 'gcl upload' is.
       rietveld_obj: rietveld.Rietveld client object.
+      defer_commands: True to return placeholders for the commands passed to
+        InputApi.RunTests, see _CommandScheduler.
+      command_cache: optional _CommandCache of the commands run by
+        InputApi.RunTests when they aren't deferred.
     """
     self.change = change
     self.committing = committing
     self.rietveld = rietveld_obj
     self.verbose = verbose
+    self.defer_commands = defer_commands
+    self.command_cache = command_cache
 
   def ExecPresubmitScript(self, script_text, presubmit_path):
     """Executes a single presubmit script.
@@ -1375,7 +1729,9 @@ class PresubmitExecuter(object):
 
     # Load the presubmit script into context.
     input_api = InputApi(self.change, presubmit_path, self.committing,
-                         self.rietveld, self.verbose)
+                         self.rietveld, self.verbose,
+                         defer_commands=self.defer_commands,
+                         command_cache=self.command_cache)
     context = {}
     try:
       exec script_text in context
@@ -1409,6 +1765,85 @@ class PresubmitExecuter(object):
     os.chdir(main_path)
     return result
 
+  def ExecPresubmitScriptsInParallel(self, scripts, output, jobs=None):
+    """Executes presubmit scripts concurrently, each in its own forked process
+    so that the working directory and the module state aren't shared.
+
+    Args:
+      scripts: list of (script_text, presubmit_path).
+      output: PresubmitOutput receiving the time taken by each script.
+      jobs: maximum number of scripts running at once, defaults to the number
+        of CPUs.
+
+    Return:
+      The results of all the scripts, in the order of scripts.
+    """
+    jobs = jobs or multiprocessing.cpu_count()
+    # The forked processes would otherwise write the buffered output again.
+    for stream in (sys.stdout, sys.stderr, output.output_stream):
+      if stream and hasattr(stream, 'flush'):
+        stream.flush()
+
+    outcomes = [None] * len(scripts)
+    pending = list(enumerate(scripts))
+    running = {}
+    try:
+      while pending or running:
+        while pending and len(running) < jobs:
+          index, (script_text, presubmit_path) = pending.pop(0)
+          reader, writer = multiprocessing.Pipe(False)
+          process = multiprocessing.Process(
+              target=_ExecPresubmitScriptInChild,
+              args=(self, script_text, presubmit_path, writer))
+          process.start()
+          writer.close()
+          running[reader] = (index, process)
+        ready, _, _ = select.select(list(running), [], [])
+        for reader in ready:
+          index, process = running.pop(reader)
+          try:
+            outcomes[index] = reader.recv()
+          except EOFError:
+            outcomes[index] = (None, '"%s" exited without results.' %
+                               scripts[index][1], 0)
+          reader.close()
+          process.join()
+    finally:
+      for _, process in running.itervalues():
+        process.terminate()
+
+    output.write('Presubmit script timings:\n')
+    results = []
+    for (_, presubmit_path), (result, error, duration) in zip(scripts,
+                                                              outcomes):
+      output.write('  %6.2fs %s\n' % (duration, presubmit_path))
+      if error:
+        raise PresubmitFailure(error)
+      results.extend(result)
+    return results
+
+
+def _ExecPresubmitScriptInChild(executer, script_text, presubmit_path, conn):
+  """Runs a presubmit script in a process started by
+  ExecPresubmitScriptsInParallel() and sends (results, error, duration) back
+  through conn."""
+  start = time.time()
+  try:
+    result, error = list(executer.ExecPresubmitScript(
+        script_text, presubmit_path)), None
+  except PresubmitFailure, e:
+    result, error = None, str(e)
+  except Exception:
+    result, error = None, '"%s" had an exception.\n%s' % (
+        presubmit_path, traceback.format_exc())
+  duration = time.time() - start
+  try:
+    conn.send((result, error, duration))
+  except (pickle.PicklingError, cPickle.PicklingError, TypeError), e:
+    conn.send((None, '"%s" returned results that can\'t be pickled: %s' % (
+        presubmit_path, e), duration))
+  conn.close()
+
 
 def DoPresubmitChecks(change,
                       committing,
@@ -1417,7 +1852,9 @@ def DoPresubmitChecks(change,
                       input_stream,
                       default_presubmit,
                       may_prompt,
-                      rietveld_obj):
+                      rietveld_obj,
+                      parallel=False,
+                      defer_commands=False):
   """Runs all presubmit checks that apply to the files in the change.
 
   This finds all PRESUBMIT.py files in directories enclosing the files in the
@@ -1436,6 +1873,12 @@ def DoPresubmitChecks(change,
     default_presubmit: A default presubmit script to execute in any case.
     may_prompt: Enable (y/n) questions on warning or error.
     rietveld_obj: rietveld.Rietveld object.
+    parallel: Runs the presubmit scripts concurrently in separate processes.
+      Only supported where processes can be forked.
+    defer_commands: Runs the commands passed to input_api.RunTests once all the
+      presubmit scripts are done, instead of when they are passed. RunTests then
+      returns placeholders, so it is only for scripts that don't look at what it
+      returns.
 
   Warning:
     If may_prompt is true, output_stream SHOULD be sys.stdout and input_stream
@@ -1462,19 +1905,35 @@ def DoPresubmitChecks(change,
     if not presubmit_files and verbose:
       output.write("Warning, no PRESUBMIT.py found.\n")
     results = []
-    executer = PresubmitExecuter(change, committing, rietveld_obj, verbose)
+    git_dir = os.path.join(change.RepositoryRoot(), '.git')
+    cache_dir = os.path.join(git_dir, 'presubmit_cache')
+    executer = PresubmitExecuter(change, committing, rietveld_obj, verbose,
+                                 defer_commands=defer_commands,
+                                 command_cache=_CommandCache(cache_dir))
+    scheduler = _CommandScheduler(
+        os.path.join(git_dir, 'presubmit_durations.json'),
+        cache_dir=cache_dir)
+    if parallel and sys.platform == 'win32':
+      logging.warning('Presubmit scripts can\'t run in parallel on Windows.')
+      parallel = False
+    scripts = []
     if default_presubmit:
       if verbose:
         output.write("Running default presubmit script.\n")
       fake_path = os.path.join(change.RepositoryRoot(), 'PRESUBMIT.py')
-      results += executer.ExecPresubmitScript(default_presubmit, fake_path)
+      scripts.append((default_presubmit, fake_path))
     for filename in presubmit_files:
       filename = os.path.abspath(filename)
       if verbose:
         output.write("Running %s\n" % filename)
       # Accept CRLF presubmit script.
-      presubmit_script = gclient_utils.FileRead(filename, 'rU')
-      results += executer.ExecPresubmitScript(presubmit_script, filename)
+      scripts.append((gclient_utils.FileRead(filename, 'rU'), filename))
+    if parallel:
+      results += executer.ExecPresubmitScriptsInParallel(scripts, output)
+    else:
+      for presubmit_script, filename in scripts:
+        results += executer.ExecPresubmitScript(presubmit_script, filename)
+    results = scheduler.run(results)
 
     errors = []
     notifications = []
@@ -1497,6 +1956,7 @@ def DoPresubmitChecks(change,
           item.handle(output)
           output.write('\n')
 
+    scheduler.report(output)
     total_time = time.time() - start_time
     if total_time > 1.0:
       output.write("Presubmit checks took %.1fs to calculate.\n\n" % total_time)
@@ -1595,6 +2055,11 @@ def CallCommand(cmd_data):
 
   multiprocessing needs a top level function with a single argument.
   """
+  return _CallCommand(cmd_data)[0]
+
+
+def _CallCommand(cmd_data):
+  """Runs an external program and returns (message or None, succeeded)."""
   cmd_data.kwargs['stdout'] = subprocess.PIPE
   cmd_data.kwargs['stderr'] = subprocess.STDOUT
   try:
@@ -1604,12 +2069,13 @@ def CallCommand(cmd_data):
   except OSError as e:
     duration = time.time() - start
     return cmd_data.message(
-        '%s exec failure (%4.2fs)\n   %s' % (cmd_data.name, duration, e))
+        '%s exec failure (%4.2fs)\n   %s' % (cmd_data.name, duration, e)), False
   if code != 0:
     return cmd_data.message(
-        '%s (%4.2fs) failed\n%s' % (cmd_data.name, duration, out))
+        '%s (%4.2fs) failed\n%s' % (cmd_data.name, duration, out)), False
   if cmd_data.info:
-    return cmd_data.info('%s (%4.2fs)' % (cmd_data.name, duration))
+    return cmd_data.info('%s (%4.2fs)' % (cmd_data.name, duration)), True
+  return None, True
 
 
 def main(argv=None):
@@ -1638,6 +2104,12 @@ def main(argv=None):
                     "which the diff should be computed.")
   parser.add_option("--default_presubmit")
   parser.add_option("--may_prompt", action='store_true', default=False)
+  parser.add_option("--parallel", action='store_true', default=False,
+                    help="Run the PRESUBMIT.py scripts in parallel, each in "
+                    "its own process.")
+  parser.add_option("--defer_commands", action='store_true', default=False,
+                    help="Run the commands of all the PRESUBMIT.py scripts "
+                    "together once the scripts are done.")
   parser.add_option("--skip_canned", action='append', default=[],
                     help="A list of checks to skip which appear in "
                     "presubmit_canned_checks. Can be provided multiple times "
@@ -1739,7 +2211,9 @@ def main(argv=None):
           sys.stdin,
           options.default_presubmit,
           options.may_prompt,
-          rietveld_obj)
+          rietveld_obj,
+          parallel=options.parallel,
+          defer_commands=options.defer_commands)
     return not results.should_continue()
   except NonexistantCannedCheckFilter, e:
     print >> sys.stderr, (
@@ -402,13 +402,11 @@ class GIT(object):
     if files:
       command.append('--')
       command.extend(files)
-    diff = GIT.Capture(command, cwd=cwd, strip_out=False).splitlines(True)
-    for i in range(len(diff)):
-      # In the case of added files, replace /dev/null with the path to the
-      # file being added.
-      if diff[i].startswith('--- /dev/null'):
-        diff[i] = '--- %s' % diff[i+1][4:]
-    return ''.join(diff)
+    diff = GIT.Capture(command, cwd=cwd, strip_out=False)
+    # In the case of added files, replace /dev/null with the path to the
+    # file being added. The diff is edited in one go since it can be huge.
+    return re.sub(r'(?m)^--- /dev/null[^\n]*\n\+\+\+ ([^\n]*\n?)',
+                  lambda m: '--- %s+++ %s' % (m.group(1), m.group(1)), diff)
 
   @staticmethod
   def GetDifferentFiles(cwd, branch=None, branch_head='HEAD'):
@@ -12,6 +12,7 @@ import errno
 import logging
 import os
 import Queue
+import select
 import subprocess
 import sys
 import time
@@ -265,6 +266,7 @@ class Popen(subprocess.Popen):
     """Does I/O for a process's pipes using threads.
 
     It's the simplest and slowest implementation. Expect very slow behavior.
+    Only used where poll() isn't available, i.e. on Windows.
 
     If there is a callback and it doesn't keep up with the calls, the timeout
     effectiveness will be delayed accordingly.
@@ -391,6 +393,130 @@ class Popen(subprocess.Popen):
       if timed_out:
         self.returncode = TIMED_OUT
 
+  def _tee_poll(self, input):  # pylint: disable=W0622
+    """Does I/O for a process's pipes from the calling thread with poll().
+
+    The output is read in chunks as soon as it is available and the timeout and
+    the nag timer are handled between two calls to poll(), so no thread is
+    started.
+
+    If there is a callback and it doesn't keep up with the output, the timeout
+    effectiveness will be delayed accordingly.
+    """
+    poller = select.poll()
+    # Maps a file descriptor to [callback, held back \r].
+    readers = {}
+    for pipe, callback in ((self.stdout, self.stdout_cb),
+                           (self.stderr, self.stderr_cb)):
+      if callback:
+        readers[pipe.fileno()] = [callback, '']
+        poller.register(pipe.fileno(), select.POLLIN | select.POLLPRI)
+    stdin_fd = None
+    if input:
+      if isinstance(input, unicode):
+        input = input.encode('ascii')
+      stdin_fd = self.stdin.fileno()
+      poller.register(stdin_fd, select.POLLOUT)
+    elif self.stdin:
+      # Pipe but no input, make sure it's closed.
+      self.stdin.close()
+    written = 0
+
+    now = time.time()
+    deadline = None
+    if self.timeout is not None:
+      deadline = now + self.timeout
+    last_output = now
+    next_nag = None
+    if self.nag_timer:
+      next_nag = now + self.nag_timer
+
+    def output(fd, data):
+      callback, held_back = readers[fd]
+      if self.universal_newlines:
+        # Don't translate a \r that may be the first half of a \r\n.
+        data = held_back + data
+        readers[fd][1] = ''
+        if data.endswith('\r'):
+          data, readers[fd][1] = data[:-1], '\r'
+        data = data.replace('\r\n', '\n').replace('\r', '\n')
+      if data:
+        callback(data)
+
+    timed_out = False
+    try:
+      while readers or stdin_fd is not None or self.poll() is None:
+        now = time.time()
+        if deadline is not None and now >= deadline and not timed_out:
+          deadline = None
+          if self.poll() is None:
+            logging.debug('Timed out after %.0fs: killing' % (
+                now - self.start))
+            self.kill()
+            timed_out = True
+        if next_nag is not None and now >= next_nag:
+          elapsed = now - last_output
+          logging.warn('  No output for %.0f seconds from command:' % elapsed)
+          logging.warn('    %s' % self.cmd_str)
+          next_nag += self.nag_timer
+          if (self.nag_max and
+              int('%.0f' % (elapsed / self.nag_timer)) >= self.nag_max):
+            deadline = now
+            continue
+
+        wait = [t - now for t in (deadline, next_nag) if t is not None]
+        if not readers and stdin_fd is None:
+          # Only waiting for the process to exit.
+          if not wait:
+            self.wait()
+            break
+          time.sleep(min(max(min(wait), 0), 0.1))
+          continue
+        try:
+          events = poller.poll(
+              int(max(min(wait), 0) * 1000) + 1 if wait else None)
+        except select.error as e:
+          if e.args[0] == errno.EINTR:
+            continue
+          raise
+        for fd, event in events:
+          if fd == stdin_fd:
+            try:
+              written += os.write(
+                  fd, input[written:written + select.PIPE_BUF])
+            except OSError as e:
+              if e.errno != errno.EPIPE:
+                raise
+              written = len(input)
+            if written >= len(input):
+              poller.unregister(fd)
+              self.stdin.close()
+              stdin_fd = None
+            continue
+          data = ''
+          if event & (select.POLLIN | select.POLLPRI | select.POLLHUP):
+            data = os.read(fd, 64 * 1024)
+          if data:
+            last_output = time.time()
+            if next_nag is not None:
+              next_nag = last_output + self.nag_timer
+            output(fd, data)
+          else:
+            # The pipe was closed; flush any held back \r.
+            if readers[fd][1]:
+              readers[fd][0]('\n')
+            poller.unregister(fd)
+            del readers[fd]
+    finally:
+      if self.poll() is None:
+        # Interrupted by an exception, e.g. thrown by a callback. Don't leave
+        # the child behind.
+        logging.debug('Killing child because of an exception')
+        self.kill()
+        self.wait()
+      if timed_out:
+        self.returncode = TIMED_OUT
+
   # pylint: disable=W0221,W0622
   def communicate(self, input=None, timeout=None, nag_timer=None,
                   nag_max=None):
@@ -426,7 +552,10 @@ class Popen(subprocess.Popen):
     if self.stderr and not self.stderr_cb and not self.stderr_is_void:
       stderr = []
       self.stderr_cb = stderr.append
-    self._tee_threads(input)
+    if sys.platform == 'win32' or not hasattr(select, 'poll'):
+      self._tee_threads(input)
+    else:
+      self._tee_poll(input)
     if stdout is not None:
       stdout = ''.join(stdout)
     if stderr is not None:
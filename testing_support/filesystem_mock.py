@@ -40,7 +40,7 @@ class MockFileSystem(object):
 
   def basename(self, path):
     if self.sep not in path:
-      return ''
+      return path
     return self._split(path)[-1] or self.sep
 
   def dirname(self, path):
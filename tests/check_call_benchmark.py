@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# Copyright 2015 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Times how fast gclient_utils.CheckCallAndFilter consumes a child's output.
+
+The child prints git-like progress lines, ended with \\r, and regular lines.
+The chunked reads are compared against the former implementation, which read
+the output one byte at a time.
+"""
+
+import cStringIO
+import optparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import gclient_utils
+import subprocess2
+
+
+CHILD = r'''
+import sys
+line = 'Receiving objects:  42%% (4242/10000), 1.00 MiB | 1.00 MiB/s'
+written = 0
+i = 0
+while written < %d:
+  out = line + ('\n' if i %% 100 == 0 else '\r')
+  sys.stdout.write(out)
+  written += len(out)
+  i += 1
+'''
+
+
+def legacy_pump(args, filter_fn, stdout):
+  output = cStringIO.StringIO()
+  kid = subprocess2.Popen(
+      args, bufsize=0, stdout=subprocess2.PIPE, stderr=subprocess2.STDOUT)
+  in_byte = kid.stdout.read(1)
+  in_line = ''
+  while in_byte:
+    output.write(in_byte)
+    stdout.write(in_byte)
+    if in_byte not in ['\r', '\n']:
+      in_line += in_byte
+    else:
+      filter_fn(in_line)
+      in_line = ''
+    in_byte = kid.stdout.read(1)
+  if len(in_line):
+    filter_fn(in_line)
+  kid.wait()
+  return output.getvalue()
+
+
+def chunked_pump(args, filter_fn, stdout):
+  return gclient_utils.CheckCallAndFilter(
+      args, filter_fn=filter_fn, stdout=stdout, print_stdout=True)
+
+
+def timed(fn, args):
+  """Returns the number of lines seen, the wall time and the CPU time of the
+  parent process."""
+  lines = [0]
+  def count(_):
+    lines[0] += 1
+  start, cpu_start = time.time(), os.times()
+  fn(args, count, open(os.devnull, 'w'))
+  cpu_end = os.times()
+  cpu = (cpu_end[0] - cpu_start[0]) + (cpu_end[1] - cpu_start[1])
+  return lines[0], time.time() - start, cpu
+
+
+def main(args):
+  parser = optparse.OptionParser(description=sys.modules[__name__].__doc__)
+  parser.add_option('--size', type='int', default=16,
+                    help='MiB of output printed by the child, '
+                         'default: %default')
+  parser.add_option('--skip-legacy', action='store_true',
+                    help='don\'t time the former per-byte implementation')
+  options, args = parser.parse_args(args)
+  if args:
+    parser.error('Unexpected arguments: %s' % args)
+
+  child = [sys.executable, '-c', CHILD % (options.size * 1024 * 1024)]
+  pumps = [('chunked', chunked_pump)]
+  if not options.skip_legacy:
+    pumps.append(('legacy', legacy_pump))
+  for name, fn in pumps:
+    lines, elapsed, cpu = timed(fn, child)
+    print '%-8s %7d lines in %6.2fs, %6.2fs of CPU, %7.1f MiB/s' % (
+        name, lines, elapsed, cpu, options.size / elapsed)
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main(sys.argv[1:]))
@@ -6,6 +6,7 @@
 
 """Unit tests for download_from_google_storage.py."""
 
+import glob
 import optparse
 import os
 import Queue
@@ -263,6 +264,137 @@ class DownloadTests(unittest.TestCase):
     self.assertEqual(list(stdout_queue.queue), expected_output)
     self.assertEqual(self.gsutil.history, [])
 
+  def test_get_sha1_cached(self):
+    filename = os.path.join(self.base_path, 'rootfolder_text.txt')
+    sha1_hash = 'e6c4fbd4fe7607f3e6ebf68b2ea4ef694da7b4fe'
+    self.assertEqual(
+        download_from_google_storage.get_sha1_cached(filename),
+        sha1_hash)
+    self.assertTrue(os.path.exists(filename + '.sha1_stat'))
+    # The recorded sha1 is trusted as long as the file isn't modified.
+    download_from_google_storage.record_sha1(filename, 'a' * 40)
+    self.assertEqual(
+        download_from_google_storage.get_sha1_cached(filename),
+        'a' * 40)
+    with open(filename, 'ab') as f:
+      f.write('more')
+    self.assertEqual(
+        download_from_google_storage.get_sha1_cached(filename),
+        download_from_google_storage.get_sha1(filename))
+
+  def test_download_worker_cache_hit(self):
+    filename = os.path.join(self.base_path, 'rootfolder_text.txt')
+    sha1_hash = 'e6c4fbd4fe7607f3e6ebf68b2ea4ef694da7b4fe'
+    cache = download_from_google_storage.BlobCache(
+        os.path.join(self.temp_dir, 'cache'), 1024 * 1024)
+    cache.put(sha1_hash, filename)
+    output_filename = os.path.join(self.temp_dir, 'rootfolder_text_copy.txt')
+    self.queue.put((sha1_hash, output_filename))
+    self.queue.put((None, None))
+    stdout_queue = Queue.Queue()
+    download_from_google_storage._downloader_worker_thread(
+        0, self.queue, False, self.base_url, self.gsutil,
+        stdout_queue, self.ret_codes, True, False, cache=cache)
+    self.assertEqual(
+        ['0> Copied %s from the cache.' % output_filename],
+        list(stdout_queue.queue))
+    self.assertEqual([], self.gsutil.history)
+    self.assertEqual(
+        sha1_hash,
+        download_from_google_storage.get_sha1(output_filename))
+
+  def test_blob_cache_copies(self):
+    filename = os.path.join(self.base_path, 'rootfolder_text.txt')
+    sha1_hash = 'e6c4fbd4fe7607f3e6ebf68b2ea4ef694da7b4fe'
+    cache = download_from_google_storage.BlobCache(
+        os.path.join(self.temp_dir, 'cache'), 1024 * 1024)
+    cache.put(sha1_hash, filename)
+    output_filename = os.path.join(self.temp_dir, 'out')
+    self.assertTrue(cache.get(sha1_hash, output_filename))
+    entry = cache._entry(sha1_hash)
+    # The output doesn't share its inode with the cache entry.
+    self.assertNotEqual(
+        os.stat(entry).st_ino, os.stat(output_filename).st_ino)
+    # A corrupted entry is evicted.
+    with open(entry, 'wb') as f:
+      f.write('corrupted')
+    self.assertFalse(cache.get(sha1_hash, output_filename))
+    self.assertFalse(cache.has(sha1_hash))
+    self.assertEqual(
+        sha1_hash, download_from_google_storage.get_sha1(output_filename))
+
+  def test_blob_cache_trim(self):
+    filename = os.path.join(self.base_path, 'rootfolder_text.txt')
+    sha1_hash = 'e6c4fbd4fe7607f3e6ebf68b2ea4ef694da7b4fe'
+    cache = download_from_google_storage.BlobCache(
+        os.path.join(self.temp_dir, 'cache'), 1)
+    cache.put(sha1_hash, filename)
+    self.assertTrue(cache.get(
+        sha1_hash, os.path.join(self.temp_dir, 'out')))
+    cache.trim()
+    self.assertFalse(cache.get(
+        sha1_hash, os.path.join(self.temp_dir, 'out')))
+
+  def test_download_batched(self):
+    sources = {
+        'e6c4fbd4fe7607f3e6ebf68b2ea4ef694da7b4fe':
+            os.path.join(self.base_path, 'rootfolder_text.txt'),
+        'b5415aa0b64006a95c0c409182e628881d6d6463':
+            os.path.join(self.base_path, 'subfolder', 'subfolder_text.txt'),
+    }
+    urls = sorted('%s/%s' % (self.base_url, h) for h in sources)
+    out_dir = os.path.join(self.temp_dir, 'out')
+    os.mkdir(out_dir)
+    listing = '\n'.join([
+        '%s:' % urls[0],
+        '    Metadata:',
+        '        executable:         1',
+        '%s:' % urls[1],
+        '    Content-Length:         25',
+    ])
+    def fake_cp():
+      staging = glob.glob(os.path.join(out_dir, '_download_tmp*'))[0]
+      for sha1_hash, path in sources.iteritems():
+        shutil.copy(path, os.path.join(staging, sha1_hash))
+    self.gsutil.add_expected(0, listing, '')
+    self.gsutil.add_expected(0, '', '', fake_cp)
+    with open(os.path.join(out_dir, 'a.sha1'), 'w') as f:
+      f.write(urls[0].rsplit('/', 1)[1])
+    with open(os.path.join(out_dir, 'b.sha1'), 'w') as f:
+      f.write(urls[1].rsplit('/', 1)[1])
+
+    code = download_from_google_storage.download_from_google_storage(
+        out_dir, self.base_url, self.gsutil, 2, True, False, False, None,
+        False, False, False, False, False)
+    self.assertEqual(0, code)
+    self.assertEqual(2, len(self.gsutil.history))
+    self.assertEqual(
+        ('check_call', ('ls', '-L') + tuple(urls)), self.gsutil.history[0])
+    self.assertEqual(('-m', 'cp') + tuple(urls), self.gsutil.history[1][1][:-1])
+    self.assertEqual(
+        [os.path.join(out_dir, n) for n in ('a', 'a.sha1', 'a.sha1_stat', 'b',
+                                            'b.sha1', 'b.sha1_stat')],
+        sorted(glob.glob(os.path.join(out_dir, '*'))))
+    if sys.platform != 'win32':
+      self.assertTrue(os.access(os.path.join(out_dir, 'a'), os.X_OK))
+      self.assertFalse(os.access(os.path.join(out_dir, 'b'), os.X_OK))
+
+  def test_download_worker_staged_fails(self):
+    sha1_hash = 'e6c4fbd4fe7607f3e6ebf68b2ea4ef694da7b4fe'
+    file_url = '%s/%s' % (self.base_url, sha1_hash)
+    output_filename = os.path.join(self.temp_dir, 'out')
+    self.queue.put((sha1_hash, output_filename))
+    self.queue.put((None, None))
+    stdout_queue = Queue.Queue()
+    # The staged file vanished.
+    batch = {file_url: (os.path.join(self.temp_dir, 'missing'), '')}
+    download_from_google_storage._downloader_worker_thread(
+        0, self.queue, False, self.base_url, self.gsutil,
+        stdout_queue, self.ret_codes, True, False, batch=batch)
+    self.assertEqual(1, self.ret_codes.get()[0])
+    self.assertTrue(stdout_queue.get().startswith('0> Failed to move '))
+    self.assertFalse(os.path.exists(output_filename))
+
   def test_download_extract_archive(self):
     # Generate a gzipped tarfile
     output_filename = os.path.join(self.base_path, 'subfolder.tar.gz')
@@ -111,6 +111,18 @@ class BasicTests(SuperMoxTestBase):
       self.assertEquals(gclient_scm.SCMWrapper._get_first_remote_url(FAKE_PATH),
                         answer)
 
+  def testPhaseTimings(self):
+    self.mox.StubOutWithMock(gclient_scm.time, 'time')
+    for now in (0, 1, 3, 6):
+      gclient_scm.time.time().AndReturn(now)
+    self.mox.ReplayAll()
+
+    wrapper = gclient_scm.SCMWrapper()
+    with wrapper._Phase('clone'):
+      with wrapper._Phase('checkout'):
+        pass
+    self.assertEquals({'clone': 4, 'checkout': 2}, wrapper.timings)
+
   def tearDown(self):
     SuperMoxTestBase.tearDown(self)
 
@@ -393,6 +405,43 @@ class ManagedGitWrapperTestCase(BaseGitWrapperTestCase):
                       'a7142dc9f0009350b96a11f372b6ea658592aa95')
     sys.stdout.close()
 
+  def testUpdatePinnedNoop(self):
+    if not self.enabled:
+      return
+    rev = 'a7142dc9f0009350b96a11f372b6ea658592aa95'
+    options = self.Options(revision=rev)
+    scm = gclient_scm.CreateSCM(url=self.url, root_dir=self.root_dir,
+                                relpath=self.relpath)
+    self.assertEquals(scm.update(options, (), []), rev)
+    self.assertFalse(scm.short_circuited)
+
+    # Nothing changed, git isn't run at all.
+    scm = gclient_scm.CreateSCM(url=self.url, root_dir=self.root_dir,
+                                relpath=self.relpath)
+    scm._Capture = scm._Run = None
+    self.assertEquals(scm.update(options, (), []), rev)
+    self.assertTrue(scm.short_circuited)
+
+    # --force always does a full update.
+    options.force = True
+    scm = gclient_scm.CreateSCM(url=self.url, root_dir=self.root_dir,
+                                relpath=self.relpath)
+    scm.update(options, (), [])
+    self.assertFalse(scm.short_circuited)
+    sys.stdout.close()
+
+  def testReadHead(self):
+    if not self.enabled:
+      return
+    options = self.Options()
+    scm = gclient_scm.CreateSCM(url=self.url, root_dir=self.root_dir,
+                                relpath=self.relpath)
+    expected = scm._Capture(['rev-parse', 'HEAD'])
+    self.assertEquals(scm._ReadHead(), expected)
+    scm._Run(['pack-refs', '--all'], options)
+    self.assertEquals(scm._ReadHead(), expected)
+    sys.stdout.close()
+
   def testUpdateMerge(self):
     if not self.enabled:
       return
@@ -9,6 +9,7 @@ See gclient_smoketest.py for integration tests.
 """
 
 import Queue
+import StringIO
 import copy
 import logging
 import os
@@ -36,6 +37,8 @@ class SCMMock(object):
   def __init__(self, unit_test, url):
     self.unit_test = unit_test
     self.url = url
+    self.timings = {}
+    self.short_circuited = False
 
   def RunCommand(self, command, options, args, file_list):
     self.unit_test.assertEquals('None', command)
@@ -333,6 +336,123 @@ class GclientTest(trial_dir.TestCase):
     self.assertEqual(client.GetHooks(options),
                      [x['action'] for x in hooks + extra_hooks + sub_hooks])
 
+  def _runParallelHooks(self, hooks, jobs):
+    write('.gclient',
+          'solutions = [{"name":"top","url":"svn://example.com/top"}]')
+    write(os.path.join('top', 'DEPS'), 'hooks = %r' % hooks)
+    parser = gclient.OptionParser()
+    options, _ = parser.parse_args(['--jobs', str(jobs)])
+    options.force = True
+    client = gclient.GClient.LoadCurrentConfig(options)
+    work_queue = gclient_utils.ExecutionQueue(options.jobs, None, False)
+    for s in client.dependencies:
+      work_queue.enqueue(s)
+    work_queue.flush({}, None, [], options=options)
+    client.RunHooksRecursively(options)
+    return client
+
+  def testParallelHooks(self):
+    def touch(name, requires=None):
+      # Only creates the file if the hook it requires already ran.
+      code = 'open(%r, "w")' % name
+      if requires:
+        code = 'import os; os.path.exists(%r) and %s' % (requires, code)
+      return [sys.executable, '-c', code]
+    hooks = [
+      {'name': 'a', 'pattern': '.', 'depends_on': [], 'action': touch('a')},
+      {'name': 'c', 'pattern': '.', 'depends_on': ['b'],
+       'action': touch('c', 'b')},
+      {'name': 'b', 'pattern': '.', 'depends_on': ['a', 'missing'],
+       'action': touch('b', 'a')},
+      {'name': 'd', 'pattern': '.', 'action': touch('d', 'c')},
+    ]
+    for jobs in (1, 4):
+      client = self._runParallelHooks(hooks, jobs)
+      for name in ('a', 'b', 'c', 'd'):
+        self.assertTrue(os.path.exists(name))
+        os.remove(name)
+      self.assertEquals(4, len(client.hook_timings))
+
+  def testParallelHooksFailure(self):
+    hooks = [
+      {'name': 'a', 'pattern': '.', 'depends_on': [],
+       'action': [sys.executable, '-c', 'import sys; sys.exit(1)']},
+      {'name': 'b', 'pattern': '.', 'depends_on': ['a'],
+       'action': [sys.executable, '-c', 'open("b", "w")']},
+    ]
+    old_stderr = sys.stderr
+    sys.stderr = StringIO.StringIO()
+    try:
+      with self.assertRaises(SystemExit) as e:
+        self._runParallelHooks(hooks, 4)
+    finally:
+      sys.stderr = old_stderr
+    self.assertEquals(2, e.exception.code)
+    self.assertFalse(os.path.exists('b'))
+
+  def testDepsCache(self):
+    write(
+        '.gclient',
+        'solutions = [\n'
+        '  { "name": "foo", "url": "svn://example.com/foo",\n'
+        '    "custom_vars": {"v": "/dir2"} },\n'
+        ']')
+    write(
+        os.path.join('foo', 'DEPS'),
+        'vars = {"v": "/unused"}\n'
+        'deps = {\n'
+        '  "foo/dir1": "/dir1",\n'
+        '  "foo/dir2": Var("v"),\n'
+        '}\n'
+        'hooks = [{"pattern": ".", "action": ["a", "b"]}]')
+    parser = gclient.OptionParser()
+    options, _ = parser.parse_args(['--jobs', '1'])
+
+    def sync():
+      obj = gclient.GClient.LoadCurrentConfig(options)
+      work_queue = gclient_utils.ExecutionQueue(options.jobs, None, False)
+      for s in obj.dependencies:
+        work_queue.enqueue(s)
+      work_queue.flush({}, None, [], options=options)
+      obj.deps_cache.save()
+      top_dep = obj.dependencies[0]
+      return (
+          sorted((d.name, str(d.url)) for d in top_dep.dependencies),
+          top_dep.deps_hooks)
+
+    expected = (
+        [('foo/dir1', '/dir1'),
+         ('foo/dir2', '/dir2')],
+        ({'pattern': '.', 'action': ['a', 'b']},))
+    self.assertEquals(expected, sync())
+    self.assertTrue(os.path.isfile('.gclient_deps_cache'))
+
+    # The DEPS file isn't evaluated again when it didn't change.
+    old_parse = gclient.Dependency._ParseDepsContent
+    def fail(*_):
+      self.fail('DEPS evaluated again')
+    gclient.Dependency._ParseDepsContent = fail
+    try:
+      self.assertEquals(expected, sync())
+    finally:
+      gclient.Dependency._ParseDepsContent = old_parse
+
+    write(
+        os.path.join('foo', 'DEPS'),
+        'deps = {\n'
+        '  "foo/dir4": "/dir4",\n'
+        '}')
+    self.assertEquals(([('foo/dir4', '/dir4')], ()), sync())
+
+  def testDepsCacheUrls(self):
+    for url in (None, 'svn://example.com/foo',
+                gclient.GClientKeywords.FromImpl('foo', 'bar'),
+                gclient.GClientKeywords.FileImpl('svn://example.com/f@1')):
+      decoded = gclient.DepsCache.DecodeUrl(
+          eval(repr(gclient.DepsCache.EncodeUrl(url))))
+      self.assertEquals(str(url), str(decoded))
+      self.assertEquals(url.__class__, decoded.__class__)
+
   def testTargetOS(self):
     """Verifies that specifying a target_os pulls in all relevant dependencies.
 
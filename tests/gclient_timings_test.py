@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# Copyright 2015 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Unit tests for gclient_timings.py."""
+
+import datetime
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from testing_support import trial_dir
+
+import gclient_timings
+
+
+class SyncTimingsTest(trial_dir.TestCase):
+  def setUp(self):
+    super(SyncTimingsTest, self).setUp()
+    self.path = os.path.join(self.root_dir, '.gclient_timings')
+
+  def testCriticalPaths(self):
+    timings = gclient_timings.SyncTimings(self.path)
+    timings.record_dep('src', None, 10)
+    timings.record_dep('src/a', 'src', 30)
+    timings.record_dep('src/b', 'src', 5)
+    timings.record_dep('src/a/c', 'src/a', 7)
+    timings.record_dep('other', None, 20)
+    self.assertEquals(
+        {'src': 47, 'src/a': 37, 'src/b': 5, 'src/a/c': 7, 'other': 20},
+        timings.critical_paths())
+
+  def testSmoothingAndPersistence(self):
+    timings = gclient_timings.SyncTimings(self.path)
+    timings.record_dep('src', None, 10)
+    timings.save()
+    timings = gclient_timings.SyncTimings(self.path)
+    timings.record_dep('src', None, 20)
+    self.assertEquals({'src': 15}, timings.critical_paths())
+
+  def testRecordRun(self):
+    class Dep(object):
+      def __init__(self, name, parent, wait, work, timings, up_to_date=False):
+        self.name = name
+        self.parent = parent
+        self.enqueued = datetime.datetime(2015, 6, 1, 12, 0, 0)
+        self.start = self.enqueued + datetime.timedelta(seconds=wait)
+        self.finish = self.start + datetime.timedelta(seconds=work)
+        self.timings = timings
+        self.up_to_date = up_to_date
+
+    class Root(object):
+      name = None
+      parent = None
+      root_dir = self.root_dir
+
+      def __init__(self):
+        src = Dep('src', self, 0, 10, {'fetch': 6, 'deps': 1})
+        self.deps = [src, Dep('src/a', src, 3, 20, {'clone': 19}),
+                     Dep('src/b', src, 3, 0, {}, True)]
+
+      def subtree(self, _):
+        return self.deps
+
+    os.makedirs(os.path.join(self.root_dir, 'src', '.git', 'objects', 'pack'))
+    with open(os.path.join(
+        self.root_dir, 'src', '.git', 'objects', 'pack', 'a.pack'), 'w') as f:
+      f.write('x' * 42)
+    timings = gclient_timings.SyncTimings(self.path)
+    start = datetime.datetime(2015, 6, 1, 12, 0, 0)
+    timings.record_run(Root(), 8, start, start + datetime.timedelta(seconds=33),
+                       [('python hook.py', 4.5)])
+    timings.save()
+
+    timings = gclient_timings.SyncTimings(self.path)
+    self.assertEquals(
+        {'src': 30, 'src/a': 20, 'src/b': 0}, timings.critical_paths())
+    self.assertEquals(1, len(timings.runs))
+    run = timings.runs[0]
+    self.assertEquals(33, run['elapsed'])
+    self.assertEquals(
+        {'work': 10, 'wait': 0, 'size': 42, 'phases': {'fetch': 6, 'deps': 1}},
+        run['deps']['src'])
+    self.assertEquals(3, run['deps']['src/a']['wait'])
+    self.assertEquals(1, run['up_to_date'])
+    self.assertEquals([{'action': 'python hook.py', 'elapsed': 4.5}],
+                      run['hooks'])
+    report = '\n'.join(timings.report())
+    self.assertIn('Working: 30.0s, waiting in the queue: 6.0s.', report)
+    self.assertIn('1 dependencies were already up to date.', report)
+    self.assertIn('src/a  (clone 19.0s, queued 3.0s)', report)
+    self.assertIn('python hook.py', report)
+
+  def testCorrupted(self):
+    with open(self.path, 'w') as f:
+      f.write('{not json')
+    self.assertEquals({}, gclient_timings.SyncTimings(self.path).deps)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -6,6 +6,7 @@
 import os
 import StringIO
 import sys
+import unittest
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
@@ -81,6 +82,44 @@ class CheckCallAndFilterTestCase(GclientUtilBase):
         'ahah\naccb\nallo\naddb\n'
         '________ running \'boo foo bar\' in \'bleh\'\nahah\naccb\nallo\naddb')
 
+  def testChunks(self):
+    # Lines end with either \r or \n and span several reads; the prompt at the
+    # end has no newline.
+    self.mox.stubs.Set(gclient_utils, 'OUTPUT_CHUNK_SIZE', 3)
+    args = ['boo', 'foo', 'bar']
+    test_string = 'ahah\r\nac\rcb\n\nEnter: '
+    # pylint: disable=E1101
+    subprocess2.Popen(
+        args,
+        stdout=subprocess2.PIPE,
+        stderr=subprocess2.STDOUT,
+        bufsize=0).AndReturn(self.ProcessIdMock(test_string))
+    os.getcwd()
+    self.mox.ReplayAll()
+    line_list = []
+    output = gclient_utils.CheckCallAndFilter(
+        args, filter_fn=line_list.append, print_stdout=True)
+    self.assertEquals(test_string, output)
+    self.assertEquals(['ahah', '', 'ac', 'cb', '', 'Enter: '], line_list)
+    self.checkstdout(test_string)
+
+  def testNoReturnOutput(self):
+    args = ['boo', 'foo', 'bar']
+    test_string = 'ahah\naccb\n'
+    # pylint: disable=E1101
+    subprocess2.Popen(
+        args,
+        stdout=subprocess2.PIPE,
+        stderr=subprocess2.STDOUT,
+        bufsize=0).AndReturn(self.ProcessIdMock(test_string))
+    os.getcwd()
+    self.mox.ReplayAll()
+    line_list = []
+    output = gclient_utils.CheckCallAndFilter(
+        args, filter_fn=line_list.append, return_output=False)
+    self.assertEquals(None, output)
+    self.assertEquals(['ahah', 'accb'], line_list)
+
 
 class SplitUrlRevisionTestCase(GclientUtilBase):
   def testSSHUrl(self):
@@ -160,6 +199,100 @@ class GClientUtilsTest(trial_dir.TestCase):
     os.chmod(l2, 0)
     os.chmod(l1, 0)
 
+  def testSpillBuffer(self):
+    buf = gclient_utils._SpillBuffer(4)
+    buf.write('abc')
+    self.assertEquals('abc', buf.getvalue())
+    buf.write('de')
+    buf.write('f')
+    self.assertTrue(buf._spilled)
+    self.assertEquals('abcdef', buf.getvalue())
+    buf.close()
+
+  def testRmtree(self):
+    outside = os.path.join(self.root_dir, 'outside')
+    os.mkdir(outside)
+    gclient_utils.FileWrite(os.path.join(outside, 'kept'), 'foo')
+    tree = os.path.join(self.root_dir, 'tree')
+    for i in xrange(20):
+      d = os.path.join(tree, 'd%d' % i, 'e', 'f')
+      os.makedirs(d)
+      gclient_utils.FileWrite(os.path.join(d, 'file'), 'foo')
+    if hasattr(os, 'symlink'):
+      os.symlink(outside, os.path.join(tree, 'd0', 'link'))
+    os.chmod(os.path.join(tree, 'd1', 'e'), 0)
+    gclient_utils.rmtree(tree)
+    self.assertFalse(os.path.exists(tree))
+    self.assertTrue(os.path.isfile(os.path.join(outside, 'kept')))
+
+  def testRmtreeInBackground(self):
+    trash = os.path.join(self.root_dir, 'trash')
+    os.makedirs(os.path.join(trash, 'trash_leftover', 'old'))
+    # The leftovers of a process that is gone are deleted, not the entries of
+    # a running one.
+    dead = subprocess2.Popen([sys.executable, '-c', ''])
+    dead.wait()
+    os.makedirs(os.path.join(trash, 'trash.%d.abc' % dead.pid, 'old'))
+    running = 'trash.%d.abc' % os.getppid()
+    os.makedirs(os.path.join(trash, running, 'in_use'))
+    tree = os.path.join(self.root_dir, 'tree')
+    os.makedirs(os.path.join(tree, 'sub'))
+    gclient_utils.rmtree_in_background(tree, trash)
+    self.assertFalse(os.path.exists(tree))
+    for thread in gclient_utils.threading.enumerate():
+      if thread.name == 'rmtree %s' % tree:
+        self.assertTrue(thread.daemon)
+        thread.join()
+    self.assertEquals([running], os.listdir(trash))
+
+  def testTaskOutput(self):
+    live = StringIO.StringIO()
+    log_path = os.path.join(self.root_dir, 'dep.log')
+    out = gclient_utils.TaskOutput(max_size=8)
+    out.live = live
+    out.start_log(log_path)
+    out.write('abc\nde')
+    self.assertEquals('abc\n', live.getvalue())
+    out.write('f\nghij\nkl')
+    self.assertEquals('abc\ndef\nghij\n', live.getvalue())
+    self.assertEquals('\nghij\nkl', out.getvalue())
+    self.assertEquals(7, out.dropped)
+    out.close()
+    self.assertEquals('abc\ndef\nghij\nkl\n', live.getvalue())
+    self.assertEquals('abc\ndef\nghij\nkl', gclient_utils.FileRead(log_path))
+
+    item = gclient_utils.WorkItem('dep')
+    item.outbuf = out
+    self.assertEquals(
+        '\ndep\n----------------------------------------\n'
+        '[... 7 bytes skipped ...]\nghij\nkl\nFull log: %s\n'
+        '----------------------------------------' % log_path,
+        gclient_utils.ExecutionQueue.format_task_output(item))
+
+  def testTaskLogNames(self):
+    log_dir = os.path.join(self.root_dir, 'logs')
+    queue = gclient_utils.ExecutionQueue(1, None, False, log_dir=log_dir)
+    paths = set()
+    for name in ('src/a_b/c', 'src/a/b_c'):
+      item = gclient_utils.WorkItem(name)
+      queue._start_output(item)
+      item.outbuf.close()
+      paths.add(item.outbuf.log_path)
+    self.assertEquals(2, len(paths))
+    self.assertEquals(2, len(os.listdir(log_dir)))
+
+  def testAnnotated(self):
+    out = StringIO.StringIO()
+    annotated = gclient_utils.Annotated(out)
+    thread = gclient_utils.threading.currentThread()
+    thread.index = 3
+    try:
+      annotated.write('a\n\nb')
+      annotated.write('c\nd\n')
+    finally:
+      del thread.index
+    self.assertEquals('3>a\n3>bc\n3>d\n', out.getvalue())
+
   def testUpgradeToHttps(self):
     values = [
         ['', ''],
@@ -201,8 +334,51 @@ class GClientUtilsTest(trial_dir.TestCase):
           expected, gclient_utils.ParseCodereviewSettingsContent(content))
 
 
+class ExecutionQueueTest(unittest.TestCase):
+  class Item(gclient_utils.WorkItem):
+    def __init__(self, name, requirements=(), children=()):
+      gclient_utils.WorkItem.__init__(self, name)
+      self.requirements = requirements
+      self.children = children
+
+    # pylint: disable=W0221
+    def run(self, order, work_queue):
+      order.append(self.name)
+      for child in self.children:
+        work_queue.enqueue(child)
+
+  def _flush(self, items, **kwargs):
+    order = []
+    work_queue = gclient_utils.ExecutionQueue(1, None, False, **kwargs)
+    for item in items:
+      work_queue.enqueue(item)
+    work_queue.flush(order)
+    return order
+
+  def testRequirements(self):
+    items = [
+        self.Item('c', ('b',)),
+        self.Item('b', ('a',)),
+        self.Item('a'),
+    ]
+    self.assertEquals(['a', 'b', 'c'], self._flush(items))
+
+  def testPriorities(self):
+    items = [
+        self.Item('a'),
+        self.Item('b', children=[self.Item('b/x', ('b',))]),
+        self.Item('c'),
+    ]
+    self.assertEquals(
+        ['b', 'b/x', 'c', 'a'],
+        self._flush(items, priorities={'a': 1, 'b': 10, 'b/x': 5, 'c': 2}))
+
+  def testMissingRequirement(self):
+    items = [self.Item('a'), self.Item('b', ('unknown',))]
+    self.assertRaises(gclient_utils.Error, self._flush, items)
+
+
 if __name__ == '__main__':
-  import unittest
   unittest.main()
 
 # vim: ts=2:sw=2:tw=80:et:
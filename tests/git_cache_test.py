@@ -7,6 +7,7 @@
 
 import os
 import shutil
+import subprocess
 import sys
 import tempfile
 import unittest
@@ -51,6 +52,112 @@ class GitCacheTest(unittest.TestCase):
       mirror = git_cache.Mirror('test://phony.example.biz', refs=fetch_specs)
       self.assertItemsEqual(mirror.fetch_specs, expected)
 
+  def testIncrementalPopulate(self):
+    origin = tempfile.mkdtemp(prefix='git_cache_test_origin_')
+    try:
+      def git(*args):
+        return subprocess.check_output(['git'] + list(args), cwd=origin)
+      git('init', '-q')
+      git('commit', '-q', '--allow-empty', '-m', 'first')
+
+      output = []
+      mirror = git_cache.Mirror(
+          'file://' + origin, refs=['refs/branch-heads/*'],
+          print_func=output.append)
+      mirror.populate(bootstrap=False, incremental=True)
+      # A populate that isn't incremental fetches anyway.
+      mirror.populate(bootstrap=False)
+      self.assertNotIn('Remote refs of file://%s are unchanged, not fetching.' %
+                       origin, output)
+      mirror.populate(bootstrap=False, incremental=True)
+      mirror.populate(bootstrap=False, incremental=True)
+      self.assertIn('Remote refs of file://%s are unchanged, not fetching.' %
+                    origin, output)
+
+      # Deleting a ref on the remote is a change too.
+      git('branch', 'other')
+      del output[:]
+      mirror.populate(bootstrap=False, incremental=True)
+      git('branch', '-D', 'other')
+      mirror.populate(bootstrap=False, incremental=True)
+      self.assertEquals(2, output.count(
+          'Fetching +refs/heads/*:refs/heads/* '
+          '+refs/branch-heads/*:refs/branch-heads/*'))
+      self.assertEquals(
+          git('rev-parse', 'HEAD'),
+          subprocess.check_output(['git', 'rev-parse', 'master'],
+                                  cwd=mirror.mirror_path))
+    finally:
+      shutil.rmtree(origin, ignore_errors=True)
+
+  def testUnbundle(self):
+    origin = tempfile.mkdtemp(prefix='git_cache_test_origin_')
+    try:
+      def git(*args, **kwargs):
+        return subprocess.check_output(
+            ['git'] + list(args), cwd=kwargs.get('cwd', origin))
+      git('init', '-q')
+      git('commit', '-q', '--allow-empty', '-m', 'first')
+      git('branch', 'other')
+      bundle = os.path.join(origin, 'test.bundle')
+      git('bundle', 'create', '-q', bundle, '--all')
+      sha1 = git_cache.get_sha1(bundle)
+
+      output = []
+      mirror = git_cache.Mirror('file://' + origin, print_func=output.append)
+      directory = os.path.join(origin, 'good')
+      os.mkdir(directory)
+      with open(bundle, 'rb') as f:
+        self.assertTrue(mirror.unbundle(f, directory, sha1))
+      self.assertEquals(git('rev-parse', 'HEAD'),
+                        git('rev-parse', 'other', cwd=directory))
+      git('fsck', cwd=directory)
+
+      directory = os.path.join(origin, 'bad')
+      os.mkdir(directory)
+      with open(bundle, 'rb') as f:
+        self.assertFalse(mirror.unbundle(f, directory, '0' * 40))
+      self.assertIn('Bundle checksum mismatch: expected %s, got %s.' % (
+          '0' * 40, sha1), output)
+    finally:
+      shutil.rmtree(origin, ignore_errors=True)
+
+  def testPopulateMirrors(self):
+    origins = [tempfile.mkdtemp(prefix='git_cache_test_origin_')
+               for _ in range(3)]
+    try:
+      for origin in origins:
+        subprocess.check_output(['git', 'init', '-q'], cwd=origin)
+        subprocess.check_output(
+            ['git', 'commit', '-q', '--allow-empty', '-m', 'first'],
+            cwd=origin)
+      mirrors = [git_cache.Mirror('file://' + o) for o in origins]
+      self.assertEquals(
+          0, git_cache.populate_mirrors(mirrors[:2], 2, bootstrap=False))
+      self.assertTrue(all(m.exists() for m in mirrors[:2]))
+      self.assertTrue(mirrors[0].last_updated())
+      self.assertFalse(mirrors[2].last_updated())
+
+      # A locked mirror is reported as failed but doesn't stop the others.
+      lockfile = git_cache.Lockfile(mirrors[2].mirror_path)
+      lockfile.lock()
+      try:
+        self.assertEquals(
+            1, git_cache.populate_mirrors(mirrors, 2, bootstrap=False))
+      finally:
+        lockfile.unlock()
+      self.assertFalse(mirrors[2].exists())
+
+      # So is a mirror failing in an unexpected way.
+      def fail(**_kwargs):
+        raise OSError('boom')
+      mirrors[1].populate = fail
+      self.assertEquals(
+          1, git_cache.populate_mirrors(mirrors[:2], 2, bootstrap=False))
+    finally:
+      for origin in origins:
+        shutil.rmtree(origin, ignore_errors=True)
+
 if __name__ == '__main__':
   sys.exit(coverage_utils.covered_main((
     os.path.join(DEPOT_TOOLS_ROOT, 'git_cache.py')
@@ -958,6 +958,55 @@ class TestGitCl(TestCase):
     ]
     self.assertNotEqual(git_cl.main(['patch', '123456']), 0)
 
+  def test_config_snapshot(self):
+    stamps = [[1]]
+    self.mock(git_cl.GitConfigSnapshot, '_current_stamps',
+              lambda _: list(stamps[0]))
+    self.mock(git_cl, 'config_snapshot', None)
+    self.calls = [
+      ((['git', 'config', '--list', '-z'],),
+       'branch.Foo.merge\nrefs/heads/master\0core.bare\nfalse\0'
+       'rietveld.server\nold\0rietveld.server\nhttps://a\0push.x\0'),
+      ((['git', 'config', 'branch.Foo.rietveldissue', '12'],), ''),
+      ((['git', 'config', '--list', '-z'],), 'core.bare\ntrue\0'),
+    ]
+    git_cl.EnableConfigSnapshot()
+    self.assertEqual('refs/heads/master', git_cl.GetConfig('BRANCH.Foo.Merge'))
+    self.assertEqual('', git_cl.GetConfig('branch.foo.merge', error_ok=True))
+    self.assertEqual('https://a', git_cl.GetConfig('rietveld.server'))
+    self.assertEqual('', git_cl.GetConfig('push.x'))
+    git_cl.SetConfig('branch.Foo.rietveldissue', '12')
+    self.assertEqual('12', git_cl.GetConfig('branch.Foo.rietveldissue'))
+    # A configuration file changed.
+    stamps[0] = [2]
+    self.assertEqual('true', git_cl.GetConfig('core.bare'))
+    self.assertEqual('', git_cl.GetConfig('rietveld.server', error_ok=True))
+
+  def test_config_snapshot_worktree(self):
+    self.calls = [
+      ((['git', 'rev-parse', '--git-dir'],), '/repo/.git/worktrees/wt\n'),
+      ((['git', 'rev-parse', '--git-common-dir'],), '/repo/.git\n'),
+    ]
+    files = git_cl.GitConfigSnapshot()._config_files()
+    join = git_cl.os.path.join
+    self.assertEqual(join('/repo/.git', 'config'), files[0])
+    self.assertEqual(
+        join('/repo/.git/worktrees/wt', 'config.worktree'), files[1])
+
+  def test_config_snapshot_old_git(self):
+    self.calls = [
+      ((['git', 'rev-parse', '--git-dir'],), '.git\n'),
+      ((['git', 'rev-parse', '--git-common-dir'],), '--git-common-dir\n'),
+    ]
+    files = git_cl.GitConfigSnapshot()._config_files()
+    # The paths are absolute since presubmit scripts change directory.
+    self.assertEqual(
+        git_cl.os.path.abspath(git_cl.os.path.join('.git', 'config')),
+        files[0])
+    self.assertEqual(
+        git_cl.os.path.abspath(git_cl.os.path.join('.git', 'config.worktree')),
+        files[1])
+
 if __name__ == '__main__':
   git_cl.logging.basicConfig(
       level=git_cl.logging.DEBUG if '-v' in sys.argv else git_cl.logging.ERROR)
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# Copyright 2015 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Times the reviewer suggestions of owners.py on synthetic OWNERS trees.
+
+The greedy selection is compared against the former implementation, which
+recomputed the cost of every owner after each pick.
+"""
+
+import optparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from testing_support import filesystem_mock
+
+import owners
+
+
+def make_tree(rng, num_dirs, fanout, num_owners, owners_per_file):
+  """Returns a MockFileSystem with num_dirs directories, each with an OWNERS
+  file and a source file, and the list of the source files."""
+  pool = ['owner%d@example.com' % i for i in range(num_owners)]
+  files = {'/OWNERS': '\n'.join(rng.sample(pool, owners_per_file)) + '\n'}
+  dirs = ['']
+  sources = []
+  while len(dirs) <= num_dirs:
+    parent = rng.choice(dirs[-fanout * 4:])
+    path = '%s/d%d' % (parent, len(dirs))
+    dirs.append(path)
+    lines = rng.sample(pool, rng.randint(1, owners_per_file))
+    if rng.random() < 0.05:
+      lines.insert(0, 'set noparent')
+    files[path + '/OWNERS'] = '\n'.join(lines) + '\n'
+    files[path + '/foo.cc'] = ''
+    sources.append(path[1:] + '/foo.cc')
+  return filesystem_mock.MockFileSystem(files=files), sources
+
+
+def legacy_covering_set(all_possible_owners, dirs):
+  dirs_remaining = set(dirs)
+  suggested_owners = set()
+  while dirs_remaining:
+    owner = owners.Database.lowest_cost_owner(all_possible_owners,
+                                              dirs_remaining)
+    suggested_owners.add(owner)
+    dirs_remaining -= set(el[0] for el in all_possible_owners[owner])
+  return suggested_owners
+
+
+def timed(fn, *args):
+  start = time.time()
+  result = fn(*args)
+  return result, time.time() - start
+
+
+def main(args):
+  parser = optparse.OptionParser(description=sys.modules[__name__].__doc__)
+  parser.add_option('--dirs', type='int', default=2000,
+                    help='number of directories, default: %default')
+  parser.add_option('--fanout', type='int', default=4,
+                    help='approximate subdirectories per directory, '
+                         'default: %default')
+  parser.add_option('--owners', type='int', default=200,
+                    help='number of distinct owners, default: %default')
+  parser.add_option('--owners-per-file', type='int', default=3,
+                    help='maximum owners per OWNERS file, default: %default')
+  parser.add_option('--files', type='int', default=1000,
+                    help='number of files in the change, default: %default')
+  parser.add_option('--seed', type='int', default=0,
+                    help='seed of the tree, default: %default')
+  parser.add_option('--skip-legacy', action='store_true',
+                    help='don\'t time the former greedy implementation')
+  options, args = parser.parse_args(args)
+  if args:
+    parser.error('Unexpected arguments: %s' % args)
+
+  rng = random.Random(options.seed)
+  repo, sources = make_tree(rng, options.dirs, options.fanout, options.owners,
+                            options.owners_per_file)
+  files = rng.sample(sources, min(options.files, len(sources)))
+  db = owners.Database('/', repo.open_for_reading, repo, repo.glob)
+  _, elapsed = timed(db.load_data_needed_for, files)
+  print 'Loaded %d OWNERS files in %.3fs.' % (len(db.read_files), elapsed)
+
+  dirs = set(db._enclosing_dir_with_owners(f) for f in files)
+  candidates, elapsed = timed(db.all_possible_owners, dirs, None)
+  print '%d files in %d directories, %d candidate owners found in %.3fs.' % (
+      len(files), len(dirs), len(candidates), elapsed)
+
+  def report(name, suggested, elapsed):
+    print '%-8s %3d reviewers in %.3fs' % (name, len(suggested), elapsed)
+
+  # Only the selection is timed, the candidates are shared.
+  report('greedy', *timed(db._greedy_covering_set, candidates, dirs))
+  if not options.skip_legacy:
+    report('legacy', *timed(legacy_covering_set, candidates, dirs))
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main(sys.argv[1:]))
@@ -236,5 +236,22 @@ class OwnersFinderTests(_BaseTestCase):
                      [darin + ' is commented as:', ['foo (at content)']])
 
 
+  def test_file_trie(self):
+    trie = owners_finder.FileTrie(['chrome/a.cc', 'chrome/b/c.cc',
+                                   'chrome_frame/d.cc'])
+    self.assertEqual(trie.files_under(''), 0b111)
+    self.assertEqual(trie.files_under('chrome'), 0b011)
+    self.assertEqual(trie.files_under('chrome/b'), 0b010)
+    self.assertEqual(trie.files_under('chrome/a.cc'), 0b001)
+    self.assertEqual(trie.files_under('chrome/a'), 0)
+
+  def test_restart_after_deselect(self):
+    finder = self.defaultFinder()
+    finder.deselect_owner(john)
+    finder.reset()
+    self.assertEqual(finder.owners_of('content/content.gyp'),
+                     set([john, darin]))
+    self.assertEqual(finder.selected_owners, set())
+
 if __name__ == '__main__':
   unittest.main()
@@ -6,7 +6,9 @@
 """Unit tests for owners.py."""
 
 import os
+import shutil
 import sys
+import tempfile
 import unittest
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -205,6 +207,21 @@ class OwnersDatabaseTest(_BaseTestCase):
     self.files['/OWNERS'] = 'per-file DEPS=*\n'
     self.assert_files_not_covered_by(['DEPS'], [brett], [])
 
+  def test_per_file_new_file(self):
+    # Per-file rules apply to files that don't exist yet, without listing
+    # the directory.
+    self.files['/content/baz/OWNERS'] = owners_file(brett,
+        lines=['per-file new_*.cc=tom@example.com'])
+    def fail_glob(pattern):
+      self.fail('unexpected glob of %s' % pattern)
+    self.glob = fail_glob
+    self.assert_files_not_covered_by(['content/baz/new_file.cc'],
+                                    [tom],
+                                    [])
+    self.assert_files_not_covered_by(['content/baz/newer.cc'],
+                                    [tom],
+                                    ['content/baz/newer.cc'])
+
   def test_mock_relpath(self):
     # This test ensures the mock relpath has the arguments in the right
     # order; this should probably live someplace else.
@@ -481,5 +498,45 @@ class LowestCostOwnersTest(_BaseTestCase):
                 'chrome/browser'],
                ben)
 
+class OwnersIndexTest(unittest.TestCase):
+  def setUp(self):
+    self.root = tempfile.mkdtemp(prefix='owners_index_test')
+    os.mkdir(os.path.join(self.root, '.git'))
+    self.owners = os.path.join(self.root, 'OWNERS')
+    with open(self.owners, 'w') as f:
+      f.write(owners_file(ben, lines=['per-file *.gyp=%s' % brett]))
+
+  def tearDown(self):
+    shutil.rmtree(self.root)
+
+  def db(self, fopen=open):
+    return owners.Database(self.root, fopen, os.path, lambda _: [],
+                           index=owners.OwnersIndex(self.root))
+
+  def test_reuses_parsed_files(self):
+    self.db().load_data_needed_for(['foo.cc'])
+    self.assertTrue(os.path.exists(os.path.join(self.root, '.git',
+                                                'owners_index')))
+    def fail_open(path):
+      self.fail('%s was parsed again' % path)
+    db = self.db(fopen=fail_open)
+    db.load_data_needed_for(['foo.cc'])
+    self.assertEquals(db.owned_by[ben], set(['']))
+
+  def test_reparses_modified_files(self):
+    self.db().load_data_needed_for(['foo.cc'])
+    with open(self.owners, 'a') as f:
+      f.write(john + '\n')
+    db = self.db()
+    db.load_data_needed_for(['foo.cc'])
+    self.assertEquals(db.owned_by[john], set(['']))
+
+  def test_no_git_directory(self):
+    os.rmdir(os.path.join(self.root, '.git'))
+    db = self.db()
+    db.load_data_needed_for(['foo.cc'])
+    self.assertEquals(db.owned_by[ben], set(['']))
+
+
 if __name__ == '__main__':
   unittest.main()
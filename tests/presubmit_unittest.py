@@ -8,12 +8,16 @@
 # pylint: disable=E1101,E1103
 
 import StringIO
+import copy
 import functools
 import itertools
+import json
 import logging
 import multiprocessing
 import os
+import shutil
 import sys
+import tempfile
 import time
 import unittest
 
@@ -178,11 +182,12 @@ class PresubmitUnittest(PresubmitTestsBase):
       'PresubmitFailure', 'PresubmitExecuter', 'PresubmitOutput', 'ScanSubDirs',
       'SvnAffectedFile', 'SvnChange', 'auth', 'cPickle', 'cpplint', 'cStringIO',
       'contextlib', 'canned_check_filter', 'fix_encoding', 'fnmatch',
-      'gclient_utils', 'glob', 'inspect', 'json', 'load_files', 'logging',
+      'gclient_utils', 'glob', 'hashlib', 'inspect', 'json', 'load_files',
+      'logging',
       'marshal', 'normpath', 'optparse', 'os', 'owners', 'pickle',
       'presubmit_canned_checks', 'random', 're', 'rietveld', 'scm',
-      'subprocess', 'sys', 'tempfile', 'time', 'traceback', 'types', 'unittest',
-      'urllib2', 'warn', 'multiprocessing', 'DoGetTryMasters',
+      'select', 'subprocess', 'sys', 'tempfile', 'time', 'traceback', 'types',
+      'unittest', 'urllib2', 'warn', 'multiprocessing', 'DoGetTryMasters',
       'GetTryMastersExecuter', 'itertools',
     ]
     # If this test fails, you should add the relevant test.
@@ -706,6 +711,201 @@ class PresubmitUnittest(PresubmitTestsBase):
     self.assertEqual(output.getvalue().count(
         'Running presubmit upload checks ...\n'), 1)
 
+  def testDoPresubmitChecksParallel(self):
+    join = presubmit.os.path.join
+    description_lines = ('Hello there',
+                         'this is a change',
+                         'STORY=http://tracker/123')
+    files = [
+      ['A', join('haspresubmit', 'blat.cc')],
+    ]
+    haspresubmit_path = join(self.fake_root_dir, 'haspresubmit', 'PRESUBMIT.py')
+    root_path = join(self.fake_root_dir, 'PRESUBMIT.py')
+    inherit_path = presubmit.os.path.join(self.fake_root_dir,
+                                          self._INHERIT_SETTINGS)
+    presubmit.os.path.isfile(inherit_path).AndReturn(False)
+    presubmit.os.path.isfile(root_path).AndReturn(True)
+    presubmit.os.path.isfile(haspresubmit_path).AndReturn(True)
+    presubmit.gclient_utils.FileRead(root_path,
+                                     'rU').AndReturn(self.presubmit_text)
+    presubmit.gclient_utils.FileRead(haspresubmit_path,
+                                     'rU').AndReturn(
+                                         'def CheckChangeOnUpload(i, o):\n'
+                                         '  return [o.PresubmitError("##")]\n')
+    presubmit.random.randint(0, 4).AndReturn(1)
+    self.mox.ReplayAll()
+
+    change = presubmit.Change(
+        'mychange',
+        '\n'.join(description_lines),
+        self.fake_root_dir,
+        files,
+        0,
+        0,
+        None)
+    output = presubmit.DoPresubmitChecks(
+        change, False, False, None, None, None, False, None, parallel=True)
+    self.failIf(output.should_continue())
+    value = output.getvalue()
+    # The results are in the order of the scripts.
+    self.assertTrue(0 < value.index('!!') < value.index('##'))
+    self.assertTrue(
+        0 < value.index(root_path) < value.index(haspresubmit_path))
+
+  def testExecPresubmitScriptInChildUnpicklable(self):
+    class FakeExecuter(object):
+      @staticmethod
+      def ExecPresubmitScript(_script_text, _presubmit_path):
+        return [lambda: None]
+    self.mox.ReplayAll()
+    parent, child = multiprocessing.Pipe(False)
+    presubmit._ExecPresubmitScriptInChild(
+        FakeExecuter(), 'script', 'PRESUBMIT.py', child)
+    result, error, _ = parent.recv()
+    self.assertEqual(result, None)
+    self.assertTrue(error.startswith(
+        '"PRESUBMIT.py" returned results that can\'t be pickled: '))
+
+  def testCommandScheduler(self):
+    ran = []
+    def FakeCallCommand(cmd_data):
+      ran.append(cmd_data.name)
+      if cmd_data.name == 'fails':
+        return cmd_data.message('failed'), False
+      return None, True
+    self.mox.stubs.Set(presubmit, '_CallCommand', FakeCallCommand)
+    def Command(name, parallel=True):
+      return presubmit._DeferredCommandResult(
+          presubmit.CommandData(name, [name], {}, presubmit._PresubmitError),
+          parallel)
+    short, long_, fails = Command('short'), Command('long'), Command('fails')
+    duplicate = Command('long')
+    serial = Command('serial', False)
+    notify = presubmit.OutputApi.PresubmitNotifyResult('hi')
+    key = presubmit._CommandScheduler._key
+    durations_path = presubmit.os.path.join(self.fake_root_dir, 'durations')
+    presubmit.os.path.isfile(durations_path).AndReturn(True)
+    presubmit.gclient_utils.FileRead(durations_path).AndReturn(json.dumps({
+        key(short.command): [1, 0], key(long_.command): [10, 0],
+        key(fails.command): [5, 0], 'recent': [3, 2], 'old': [3, 1],
+        'legacy': 3}))
+    presubmit.os.path.isdir(self.fake_root_dir).AndReturn(True)
+    # The commands of other runs are kept until there are too many, the least
+    # recently used first.
+    presubmit.gclient_utils.FileWrite(durations_path, mox.Func(
+        lambda data: sorted(json.loads(data)) == sorted(
+            [key(c.command) for c in (short, long_, fails, serial)] +
+            ['recent'])))
+    self.mox.stubs.Set(presubmit._CommandScheduler, 'MAX_DURATIONS', 5)
+    self.mox.ReplayAll()
+
+    scheduler = presubmit._CommandScheduler(durations_path, jobs=1)
+    results = scheduler.run([notify, short, long_, fails, duplicate, serial])
+    # Longest first, the duplicate isn't run and the serial command is last.
+    self.assertEqual(ran, ['long', 'fails', 'short', 'serial'])
+    self.assertEqual(len(results), 2)
+    self.assertEqual(results[0], notify)
+    self.assertEqual(results[1]._message, 'failed')
+    output = presubmit.PresubmitOutput()
+    scheduler.report(output)
+    self.assertTrue(output.getvalue().startswith(
+        'Slowest presubmit commands:\n'))
+
+  def testCommandSchedulerKey(self):
+    def Key(env):
+      return presubmit._CommandScheduler._key(presubmit.CommandData(
+          'foo', ['foo'], {'env': env}, presubmit._PresubmitError))
+    # An explicit env is part of the key as a whole, and the key is a digest.
+    key = Key({'PATH': '/bin', 'TOKEN': 'secret'})
+    self.assertNotEqual(key, Key({'PATH': '/bin'}))
+    self.assertNotEqual(Key({'CHROME_HEADLESS': '1'}), Key({}))
+    self.assertEqual(len(key), 40)
+    self.assertFalse('secret' in key)
+    # Only the allowlisted variables of os.environ matter.
+    self.mox.stubs.Set(presubmit.os, 'environ', {
+        'PATH': '/bin', 'SSH_AUTH_SOCK': '/tmp/a', 'TOKEN': 'secret'})
+    inherited = Key(None)
+    presubmit.os.environ = {'PATH': '/bin'}
+    self.assertEqual(inherited, Key(None))
+    presubmit.os.environ = {'PATH': '/usr/bin'}
+    self.assertNotEqual(inherited, Key(None))
+
+  def testCommandSchedulerCache(self):
+    ran = []
+    def FakeCallCommand(cmd_data):
+      ran.append(cmd_data.name)
+      if cmd_data.name == 'fails':
+        return cmd_data.message('failed'), False
+      return None, True
+    self.mox.stubs.Set(presubmit, '_CallCommand', FakeCallCommand)
+    # The cache lives on disk.
+    for name in ('close', 'fdopen', 'mkdir', 'open', 'write'):
+      self.UnMock(presubmit.os, name)
+    self.UnMock(presubmit.os.path, 'isdir')
+    self.mox.ReplayAll()
+    root = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, root)
+    source = presubmit.os.path.join(root, 'foo.py')
+    with open(source, 'w') as f:
+      f.write('1')
+
+    def Run():
+      del ran[:]
+      commands = [
+          presubmit.CommandData(
+              name, [name], {}, presubmit._PresubmitError, inputs)
+          for name, inputs in (('cached', [source]), ('fails', [source]),
+                               ('uncached', None))]
+      scheduler = presubmit._CommandScheduler(
+          None, jobs=1, cache_dir=presubmit.os.path.join(root, 'cache'))
+      return scheduler.run(
+          [presubmit._DeferredCommandResult(c, True) for c in commands])
+
+    self.assertEqual(len(Run()), 1)
+    self.assertEqual(sorted(ran), ['cached', 'fails', 'uncached'])
+    # Only the successful command with inputs is cached.
+    self.assertEqual(len(Run()), 1)
+    self.assertEqual(sorted(ran), ['fails', 'uncached'])
+    with open(source, 'w') as f:
+      f.write('2')
+    Run()
+    self.assertEqual(sorted(ran), ['cached', 'fails', 'uncached'])
+
+  def testRunTestsCache(self):
+    ran = []
+    def FakeCallCommand(cmd_data):
+      ran.append(cmd_data.name)
+      return None, True
+    self.mox.stubs.Set(presubmit, '_CallCommand', FakeCallCommand)
+    for name in ('close', 'fdopen', 'mkdir', 'open', 'write'):
+      self.UnMock(presubmit.os, name)
+    self.UnMock(presubmit.os.path, 'isdir')
+    self.UnMock(presubmit.os.path, 'abspath')
+    input_api = self.mox.CreateMock(presubmit.InputApi)
+    input_api.verbose = False
+    self.mox.ReplayAll()
+    root = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, root)
+    source = presubmit.os.path.join(root, 'foo.py')
+    with open(source, 'w') as f:
+      f.write('1')
+    input_api._command_cache = presubmit._CommandCache(
+        presubmit.os.path.join(root, 'cache'))
+
+    def Run():
+      del ran[:]
+      return presubmit.InputApi.RunTests(input_api, [
+          presubmit.CommandData(
+              name, [name], {'cwd': root}, presubmit._PresubmitError, inputs)
+          for name, inputs in (('cached', [source]), ('uncached', None))],
+          parallel=False)
+
+    # The commands that succeeded are skipped without being deferred.
+    self.assertEqual([], Run())
+    self.assertEqual(['cached', 'uncached'], ran)
+    self.assertEqual([], Run())
+    self.assertEqual(['uncached'], ran)
+
   def testDoPresubmitChecksPromptsAfterWarnings(self):
     join = presubmit.os.path.join
     description_lines = ('Hello there',
@@ -1153,7 +1353,9 @@ def CheckChangeOnCommit(input_api, output_api):
     presubmit.DoPresubmitChecks(mox.IgnoreArg(), False, False,
                                 mox.IgnoreArg(),
                                 mox.IgnoreArg(),
-                                None, False, None).AndReturn(output)
+                                None, False, None,
+                                parallel=False,
+                                defer_commands=False).AndReturn(output)
     self.mox.ReplayAll()
 
     self.assertEquals(
@@ -1698,6 +1900,55 @@ class AffectedFileUnittest(PresubmitTestsBase):
     self.assertEquals(presubmit.normpath('foo/blat.cc'), af.LocalPath())
     self.assertEquals('M', af.Action())
     self.assertEquals(['whatever', 'cookie'], af.NewContents())
+    # The cached lines are shared with the caller, not copied.
+    self.assertTrue(af.NewContents() is af.NewContents())
+    self.assertRaises(TypeError, af.NewContents().append, 'more')
+    # Copies are regular lists.
+    self.assertEquals(['whatever', 'cookie', 'more'],
+                      copy.copy(af.NewContents()) + ['more'])
+    copied = copy.deepcopy(af.NewContents())
+    copied.append('more')
+    self.assertEquals(['whatever', 'cookie', 'more'], copied)
+
+  def testGitChangedContents(self):
+    unified_diff = '\n'.join([
+        'diff --git a.cc a.cc',
+        'index 1111111..2222222 100644',
+        '--- a.cc',
+        '+++ a.cc',
+        '@@ -10,4 +10,5 @@ void f() {',
+        ' context\r',
+        '-removed\r',
+        '+added\r',
+        '+++ not a header\r',
+        ' context\r',
+        '@@ -40,3 +41,3 @@',
+        ' context',
+        '-old',
+        '+new',
+        'diff --git b b.cc b b.cc',
+        'new file mode 100644',
+        'index 0000000..3333333',
+        '--- /dev/null',
+        '+++ b b.cc',
+        '@@ -0,0 +1,2 @@',
+        '+first',
+        '+',
+        ''])
+    presubmit.scm.GIT.GenerateDiff(
+        self.fake_root_dir, files=[], full_move=True, branch=None
+        ).AndReturn(unified_diff)
+    for path in ('a.cc', 'b b.cc'):
+      presubmit.os.path.exists(
+          presubmit.os.path.join(self.fake_root_dir, path)).AndReturn(False)
+    self.mox.ReplayAll()
+    diff_cache = presubmit._GitDiffCache(upstream=None)
+    a = presubmit.GitAffectedFile('a.cc', 'M', self.fake_root_dir, diff_cache)
+    b = presubmit.GitAffectedFile('b b.cc', 'A', self.fake_root_dir, diff_cache)
+    # Added lines starting with '++' are skipped, but still counted.
+    self.assertEquals([(11, 'added'), (42, 'new')], a.ChangedContents())
+    self.assertEquals([(1, 'first'), (2, '')], b.ChangedContents())
+    self.assertTrue(b.ChangedContents() is b.ChangedContents())
 
   def testAffectedFileNotExists(self):
     notfound = 'notfound.cc'
@@ -2162,6 +2413,36 @@ class CannedChecksUnittest(PresubmitTestsBase):
     self.assertEquals(results1[0]._long_text,
         'makefile.foo:46')
 
+  def testFindNewViolationsOfRules(self):
+    lines = ['x' * 20 + '\t', '\ty', 'TO' 'DO: z ']
+    class FakeAffectedFile(object):
+      @staticmethod
+      def LocalPath():
+        return 'foo.cc'
+      @staticmethod
+      def NewContents():
+        return lines
+      @staticmethod
+      def ChangedContents():
+        return list(enumerate(lines, 1))
+    input_api = self.MockInputApi(None, False)
+    input_api.AffectedFiles(file_filter=None, include_deletes=False
+        ).AndReturn([FakeAffectedFile()])
+    self.mox.ReplayAll()
+
+    rules = [
+      presubmit_canned_checks._LongLinesRule(input_api, 10, None),
+      presubmit_canned_checks._NoTabsRule(input_api, lambda _: True),
+      presubmit_canned_checks._NoStrayWhitespaceRule(None),
+      presubmit_canned_checks._TodoHasOwnerRule(input_api, None),
+      presubmit_canned_checks._DoNotSubmitInFilesRule(input_api),
+    ]
+    # A line matching several rules is reported for each of them.
+    self.assertEqual(
+        [['foo.cc, line 1, 21 chars'], ['foo.cc:1', 'foo.cc:2'],
+         ['foo.cc:1', 'foo.cc:3'], ['foo.cc:3'], []],
+        presubmit_canned_checks._FindNewViolationsOfRules(rules, input_api))
+
   def testCannedCheckLongLines(self):
     check = lambda x, y, z: presubmit_canned_checks.CheckLongLines(x, y, 10, z)
     self.ContentTest(check, '0123456789', None, '01234567890', None,
@@ -2504,6 +2785,7 @@ class CannedChecksUnittest(PresubmitTestsBase):
     input_api.PresubmitLocalPath().AndReturn('/foo')
     input_api.PresubmitLocalPath().AndReturn('/foo')
     input_api.os_walk('/foo').AndReturn([('/foo', [], ['file1.py'])])
+    input_api.PresubmitLocalPath().AndReturn('/foo')
     pylint = os.path.join(_ROOT, 'third_party', 'pylint.py')
     pylintrc = os.path.join(_ROOT, 'pylintrc')
 
@@ -2524,6 +2806,120 @@ class CannedChecksUnittest(PresubmitTestsBase):
     self.assertEquals([], results)
     self.checkstdout('')
 
+  def testCannedRunPylintIncremental(self):
+    change = presubmit.Change(
+        'foo1', 'description1', self.fake_root_dir, None, 0, 0, None)
+    input_api = self.MockInputApi(change, False)
+    input_api.marshal = presubmit.marshal
+    input_api.os_stat = lambda _: os.stat_result((0,) * 10)
+    input_api.environ = self.mox.CreateMock(os.environ)
+    input_api.environ.copy().AndReturn({})
+    join = presubmit.os.path.join
+    root = self.fake_root_dir
+    affected = self.mox.CreateMock(presubmit.GitAffectedFile)
+    input_api.AffectedSourceFiles(mox.IgnoreArg()).AndReturn([affected])
+    for _ in range(3):
+      input_api.PresubmitLocalPath().AndReturn(root)
+    input_api.os_walk(root).AndReturn(
+        [(root, ['sub'], ['a.py', 'b.py']), (join(root, 'sub'), [], ['c.py'])])
+    input_api.AffectedFiles(include_deletes=True, file_filter=mox.IgnoreArg()
+        ).AndReturn([affected])
+    affected.AbsoluteLocalPath().AndReturn(join(root, 'a.py'))
+    input_api.ReadFile(join(root, 'a.py')).AndReturn('import os\n')
+    input_api.ReadFile(join(root, 'b.py')).AndReturn('import a\n')
+    input_api.ReadFile(join(root, 'sub', 'c.py')).AndReturn(
+        'from b import foo\n')
+    presubmit.os.path.isdir(join(root, '.git')).AndReturn(False)
+    affected.Action().AndReturn('M')
+    affected.GenerateScmDiff().AndReturn('+++ a.py\n+x = 1\n')
+    pylint = os.path.join(_ROOT, 'third_party', 'pylint.py')
+    pylintrc = os.path.join(_ROOT, 'pylintrc')
+    # Only a.py and the files importing it, without the cycle check.
+    CommHelper(input_api,
+        ['pyyyyython', pylint, '--args-on-stdin'],
+        env=mox.IgnoreArg(), stdin=
+               '--rcfile=%s\n--disable=cyclic-import\n--jobs=2\n%s' % (
+                   pylintrc, '\n'.join(['a.py', 'b.py', join('sub', 'c.py')])))
+    self.mox.ReplayAll()
+
+    results = presubmit_canned_checks.RunPylint(
+        input_api, presubmit.OutputApi)
+    self.assertEquals([], results)
+    self.checkstdout('')
+
+  def testCannedRunPylintIncrementalDeletedFile(self):
+    change = presubmit.Change(
+        'foo1', 'description1', self.fake_root_dir, None, 0, 0, None)
+    input_api = self.MockInputApi(change, False)
+    input_api.marshal = presubmit.marshal
+    input_api.os_stat = lambda _: os.stat_result((0,) * 10)
+    input_api.environ = self.mox.CreateMock(os.environ)
+    input_api.environ.copy().AndReturn({})
+    join = presubmit.os.path.join
+    root = self.fake_root_dir
+    modified = self.mox.CreateMock(presubmit.GitAffectedFile)
+    deleted = self.mox.CreateMock(presubmit.GitAffectedFile)
+    input_api.AffectedSourceFiles(mox.IgnoreArg()).AndReturn([modified])
+    for _ in range(3):
+      input_api.PresubmitLocalPath().AndReturn(root)
+    input_api.os_walk(root).AndReturn(
+        [(root, ['sub'], ['a.py']), (join(root, 'sub'), [], ['c.py'])])
+    input_api.AffectedFiles(include_deletes=True, file_filter=mox.IgnoreArg()
+        ).AndReturn([modified, deleted])
+    modified.AbsoluteLocalPath().AndReturn(join(root, 'a.py'))
+    deleted.AbsoluteLocalPath().AndReturn(join(root, 'b.py'))
+    input_api.ReadFile(join(root, 'a.py')).AndReturn('import os\n')
+    input_api.ReadFile(join(root, 'sub', 'c.py')).AndReturn(
+        'from b import foo\n')
+    presubmit.os.path.isdir(join(root, '.git')).AndReturn(False)
+    modified.Action().AndReturn('M')
+    modified.GenerateScmDiff().AndReturn('+++ a.py\n+x = 1\n')
+    deleted.Action().AndReturn('D')
+    pylint = os.path.join(_ROOT, 'third_party', 'pylint.py')
+    pylintrc = os.path.join(_ROOT, 'pylintrc')
+    # sub/c.py imports the deleted b.py, and the cycle check runs.
+    files = '\n'.join(['a.py', join('sub', 'c.py')])
+    CommHelper(input_api,
+        ['pyyyyython', pylint, '--args-on-stdin'],
+        env=mox.IgnoreArg(), stdin=
+               '--rcfile=%s\n--disable=cyclic-import\n--jobs=2\n%s' % (
+                   pylintrc, files))
+    CommHelper(input_api,
+        ['pyyyyython', pylint, '--args-on-stdin'],
+        env=mox.IgnoreArg(), stdin=
+               '--rcfile=%s\n--disable=all\n--enable=cyclic-import\n%s' % (
+                   pylintrc, files))
+    self.mox.ReplayAll()
+
+    results = presubmit_canned_checks.RunPylint(
+        input_api, presubmit.OutputApi)
+    self.assertEquals([], results)
+    self.checkstdout('')
+
+  def testPylintTargets(self):
+    self.mox.ReplayAll()
+    self.assertEqual(
+        ['a', 'a.b', 'a.b.c', 'd', 'e', 'e.f', 'g', 'h'],
+        presubmit_canned_checks._ParseImports(
+            'import a.b.c\nimport d as x\nfrom e import f\n'
+            'from . import g\nfrom h import *\n'))
+    self.assertEqual([], presubmit_canned_checks._ParseImports('import ('))
+    imports = {
+      'a.py': ['x'],
+      'b.py': ['a'],
+      'c.py': ['b'],
+      'd.py': [],
+      'pkg/__init__.py': ['d'],
+      'pkg/e.py': ['pkg'],
+    }
+    targets = lambda changed: presubmit_canned_checks._PylintTargets(
+        sorted(imports), changed, imports.get)
+    self.assertEqual(['a.py', 'b.py', 'c.py'], targets(['a.py']))
+    self.assertEqual(['d.py', 'pkg/__init__.py', 'pkg/e.py'],
+                     targets(['d.py']))
+    # Deleted files aren't linted but the files importing them are.
+    self.assertEqual(['b.py', 'c.py'], targets(['gone/a.py']))
+
   def testCheckBuildbotPendingBuildsBad(self):
     input_api = self.MockInputApi(None, True)
     connection = self.mox.CreateMockAnything()
@@ -2853,19 +3249,22 @@ class CannedChecksUnittest(PresubmitTestsBase):
         'foo1', 'description1', self.fake_root_dir, None, 0, 0, None)
     input_api = self.MockInputApi(change, False)
     affected_file = self.mox.CreateMock(presubmit.SvnAffectedFile)
+    # The per-line rules are checked in a single pass.
+    input_api.AffectedFiles(file_filter=None, include_deletes=False
+        ).AndReturn([affected_file])
     for _ in range(3):
-      input_api.AffectedFiles(file_filter=mox.IgnoreArg(), include_deletes=False
-          ).AndReturn([affected_file])
-      affected_file.LocalPath()
-      affected_file.NewContents().AndReturn('Hey!\nHo!\nHey!\nHo!\n\n')
+      input_api.FilterSourceFile(  # pylint: disable=E1123
+          affected_file, black_list=mox.IgnoreArg()).AndReturn(True)
+    affected_file.LocalPath().AndReturn('hello.py')
+    affected_file.LocalPath().AndReturn('hello.py')
+    affected_file.NewContents().AndReturn(['Hey!', 'Ho! ', 'Hey!', 'Ho!'])
     affected_file.ChangedContents().AndReturn([
-        (0, 'Hey!\n'),
-        (1, 'Ho!\n'),
-        (2, 'Hey!\n'),
-        (3, 'Ho!\n'),
-        (4, '\n')])
-    for _ in range(5):
-      affected_file.LocalPath().AndReturn('hello.py')
+        (1, 'Hey!'),
+        (2, 'Ho! '),
+        (3, 'Hey!'),
+        (4, 'Ho!')])
+    affected_file.LocalPath().AndReturn('hello.py')
+    affected_file.LocalPath().AndReturn('hello.py')
     input_api.AffectedSourceFiles(mox.IgnoreArg()).AndReturn([affected_file])
     input_api.ReadFile(affected_file).AndReturn('Hey!\nHo!\nHey!\nHo!\n\n')
 
@@ -2874,7 +3273,6 @@ class CannedChecksUnittest(PresubmitTestsBase):
     input_api.AffectedSourceFiles(mox.IgnoreArg()).AndReturn([affected_file])
     input_api.ReadFile(affected_file, 'rb').AndReturn(
         'Hey!\nHo!\nHey!\nHo!\n\n')
-    affected_file.LocalPath()
 
     self.mox.ReplayAll()
     results = presubmit_canned_checks.PanProjectChecks(
@@ -2888,8 +3286,54 @@ class CannedChecksUnittest(PresubmitTestsBase):
     self.assertEqual(2, len(results))
     self.assertEqual(
         'Found line ending with white spaces in:', results[0]._message)
+    self.assertEqual('hello.py:2', results[0]._long_text)
     self.checkstdout('')
 
+  def testPanProjectChecksOverriddenLineChecks(self):
+    change = presubmit.Change(
+        'foo1', 'description1', self.fake_root_dir, None, 0, 0, None)
+    input_api = self.MockInputApi(change, True)
+    input_api.canned_checks = self.mox.CreateMockAnything()
+    # The line checks are dispatched through input_api.canned_checks when it
+    # overrides them.
+    input_api.canned_checks.CheckLongLines(
+        input_api, presubmit.OutputApi, 80, source_file_filter=mox.IgnoreArg()
+        ).AndReturn(['long'])
+    input_api.canned_checks.CheckChangeHasNoTabs(
+        input_api, presubmit.OutputApi, source_file_filter=mox.IgnoreArg()
+        ).AndReturn(['tabs'])
+    input_api.canned_checks.CheckChangeHasNoStrayWhitespace(
+        input_api, presubmit.OutputApi, source_file_filter=mox.IgnoreArg()
+        ).AndReturn(['whitespace'])
+    input_api.canned_checks.CheckDoNotSubmitInFiles(
+        input_api, presubmit.OutputApi).AndReturn(['do not submit'])
+    input_api.AffectedSourceFiles(mox.IgnoreArg()).AndReturn([])
+    input_api.canned_checks.CheckChangeSvnEolStyle(
+        input_api, presubmit.OutputApi, source_file_filter=mox.IgnoreArg()
+        ).AndReturn([])
+    input_api.canned_checks.CheckLicense(
+        input_api, presubmit.OutputApi, mox.IgnoreArg(),
+        source_file_filter=mox.IgnoreArg()).AndReturn([])
+    input_api.canned_checks.CheckSvnForCommonMimeTypes(
+        input_api, presubmit.OutputApi).AndReturn([])
+    input_api.canned_checks.CheckChangeWasUploaded(
+        input_api, presubmit.OutputApi).AndReturn([])
+    input_api.canned_checks.CheckChangeHasDescription(
+        input_api, presubmit.OutputApi).AndReturn([])
+    input_api.canned_checks.CheckDoNotSubmitInDescription(
+        input_api, presubmit.OutputApi).AndReturn([])
+
+    self.mox.ReplayAll()
+    results = presubmit_canned_checks.PanProjectChecks(
+        input_api,
+        presubmit.OutputApi,
+        excluded_paths=None,
+        text_files=None,
+        license_header=None,
+        project_name=None,
+        owners_check=False)
+    self.assertEqual(['long', 'tabs', 'whitespace', 'do not submit'], results)
+
 
 if __name__ == '__main__':
   import unittest
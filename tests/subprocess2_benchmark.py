@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# Copyright 2015 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Times how fast subprocess2.communicate() pipes data through a child.
+
+The data is fed to the child's stdin and read back from its stdout through a
+callback, which is the path used whenever a callback, a timeout or a nag timer
+is given. The poll() loop is compared against the former threaded
+implementation, which is much slower and is run on less data by default.
+"""
+
+import optparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import subprocess2
+
+
+# Copies its stdin to its stdout.
+CHILD = r'''
+import os
+while True:
+  data = os.read(0, 65536)
+  if not data:
+    break
+  while data:
+    data = data[os.write(1, data):]
+'''
+
+
+def timed(size):
+  """Pipes size bytes through the child and returns the wall and CPU time of
+  the parent process."""
+  received = [0]
+  def count(data):
+    received[0] += len(data)
+  data = '0123456789abcdef' * (size / 16)
+  start, cpu_start = time.time(), os.times()
+  _, returncode = subprocess2.communicate(
+      [sys.executable, '-c', CHILD], stdin=data, stdout=count, timeout=3600)
+  cpu_end = os.times()
+  assert returncode == 0, returncode
+  assert received[0] == len(data), (received[0], len(data))
+  cpu = (cpu_end[0] - cpu_start[0]) + (cpu_end[1] - cpu_start[1])
+  return time.time() - start, cpu
+
+
+def main(args):
+  parser = optparse.OptionParser(description=sys.modules[__name__].__doc__)
+  parser.add_option('--size', type='int', default=1024,
+                    help='MiB piped through the poll() loop, default: %default')
+  parser.add_option('--threads-size', type='int', default=4,
+                    help='MiB piped through the threads, default: %default')
+  options, args = parser.parse_args(args)
+  if args:
+    parser.error('Unexpected arguments: %s' % args)
+
+  runs = [('poll', options.size)]
+  if options.threads_size:
+    runs.append(('threads', options.threads_size))
+  for name, size in runs:
+    old_select = subprocess2.select
+    if name == 'threads':
+      # Hides poll() from subprocess2.
+      subprocess2.select = object()
+    try:
+      elapsed, cpu = timed(size * 1024 * 1024)
+    finally:
+      subprocess2.select = old_select
+    print '%-8s %5d MiB in %7.2fs, %7.2fs of CPU, %7.1f MiB/s' % (
+        name, size, elapsed, cpu, size / elapsed)
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main(sys.argv[1:]))
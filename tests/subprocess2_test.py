@@ -583,6 +583,22 @@ class S2Test(BaseTestCase):
     returncode = len(stdin) if sys.platform == 'win32' else 0
     self._check_res(res, None, None, returncode)
 
+  def test_tee_threads(self):
+    # The threaded implementation is still used where poll() isn't available.
+    old_select = subprocess2.select
+    subprocess2.select = object()
+    try:
+      stdout = []
+      stdin = '0123456789abcdef' * (8*1024)
+      res = subprocess2.communicate(
+          self.exe + ['--large', '--read', '--stdout'], stdin=stdin,
+          stdout=stdout.append, timeout=60)
+    finally:
+      subprocess2.select = old_select
+    self.assertEquals(128*1024 + len('A\nBB\nCCC\n'), len(''.join(stdout)))
+    returncode = len(stdin) if sys.platform == 'win32' else 0
+    self._check_res(res, None, None, returncode)
+
   def test_tee_cb_throw(self):
     # Having a callback throwing up should not cause side-effects. It's a bit
     # hard to measure.
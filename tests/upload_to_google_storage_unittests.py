@@ -110,6 +110,25 @@ class UploadTests(unittest.TestCase):
     os.remove(output_filename)
     self.assertEqual(code, 0)
 
+  def test_upload_batched(self):
+    lorem_ipsum2 = os.path.join(self.base_path, 'lorem_ipsum2.txt')
+    filenames = [self.lorem_ipsum, lorem_ipsum2]
+    url = '%s/%s' % (self.base_url, self.lorem_ipsum_sha1)
+    url2 = '%s/%s' % (
+        self.base_url, upload_to_google_storage.get_sha1(lorem_ipsum2))
+    # Only the first file exists, with the same MD5.
+    self.gsutil.add_expected(
+        0, '%s:\n    ETag: 634d7c1ed3545383837428f031840a1e\n' % url, '')
+    code = upload_to_google_storage.upload_to_google_storage(
+        filenames, self.base_url, self.gsutil, False, False, 1, False, None)
+    self.assertEqual(
+        self.gsutil.history,
+        [('check_call', ('ls', '-L') + tuple(sorted([url, url2]))),
+         ('check_call', ('cp', lorem_ipsum2, url2))])
+    for filename in filenames:
+      os.remove(filename + '.sha1')
+    self.assertEqual(code, 0)
+
   def test_upload_worker_errors(self):
     work_queue = Queue.Queue()
     work_queue.put((self.lorem_ipsum, self.lorem_ipsum_sha1))
@@ -18,6 +18,7 @@ import time
 
 from download_from_google_storage import get_sha1
 from download_from_google_storage import Gsutil
+from download_from_google_storage import gsutil_ls_long
 from download_from_google_storage import printer_worker
 from download_from_google_storage import GSUTIL_DEFAULT_PATH
 
@@ -68,15 +69,27 @@ def get_md5_cached(filename):
 
 def _upload_worker(
     thread_num, upload_queue, base_url, gsutil, md5_lock, force,
-    use_md5, stdout_queue, ret_codes, gzip):
+    use_md5, stdout_queue, ret_codes, gzip, listing=None):
+  """Uploads the files from upload_queue.
+
+  listing is the 'gsutil ls -L' output of the objects that already exist if it
+  was fetched beforehand, see gsutil_ls_long().
+  """
   while True:
     filename, sha1_sum = upload_queue.get()
     if not filename:
       break
     file_url = '%s/%s' % (base_url, sha1_sum)
-    if gsutil.check_call('ls', file_url)[0] == 0 and not force:
+    if listing is not None:
+      exists = file_url in listing
+    else:
+      exists = gsutil.check_call('ls', file_url)[0] == 0
+    if exists and not force:
       # File exists, check MD5 hash.
-      _, out, _ = gsutil.check_call('ls', '-L', file_url)
+      if listing is not None:
+        out = listing[file_url]
+      else:
+        _, out, _ = gsutil.check_call('ls', '-L', file_url)
       etag_match = re.search('ETag:\s+([a-z0-9]{32})', out)
       if etag_match:
         remote_md5 = etag_match.group(1)
@@ -148,14 +161,21 @@ def upload_to_google_storage(
   printer_thread = threading.Thread(target=printer_worker, args=[stdout_queue])
   printer_thread.daemon = True
   printer_thread.start()
-  for thread_num in range(num_threads):
-    t = threading.Thread(
-        target=_upload_worker,
-        args=[thread_num, upload_queue, base_url, gsutil, md5_lock,
-              force, use_md5, stdout_queue, ret_codes, gzip])
-    t.daemon = True
-    t.start()
-    all_threads.append(t)
+
+  # With several files, hash them all first to list the existing objects with
+  # a few gsutil calls instead of two per file.
+  batch = not force and len(input_filenames) > 1
+  def start_workers(listing=None):
+    for thread_num in range(num_threads):
+      t = threading.Thread(
+          target=_upload_worker,
+          args=[thread_num, upload_queue, base_url, gsutil, md5_lock,
+                force, use_md5, stdout_queue, ret_codes, gzip, listing])
+      t.daemon = True
+      t.start()
+      all_threads.append(t)
+  if not batch:
+    start_workers()
 
   # We want to hash everything in a single thread since its faster.
   # The bottleneck is in disk IO, not CPU.
@@ -182,6 +202,12 @@ def upload_to_google_storage(
     upload_queue.put((filename, sha1_sum))
   hashing_duration = time.time() - hashing_start
 
+  if batch:
+    stdout_queue.put('Main> Listing %d files...' % upload_queue.qsize())
+    start_workers(gsutil_ls_long(gsutil, sorted(set(
+        '%s/%s' % (base_url, sha1_sum)
+        for _, sha1_sum in upload_queue.queue))))
+
   # Wait for everything to finish.
   for _ in all_threads:
     upload_queue.put((None, None))  # To mark the end of the work queue.